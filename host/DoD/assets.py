@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+"""
+Logo and glyph store
+
+Logos and font glyphs are binary PBM images (P4, packed bits, 1 is a droplet) in the assets folder:
+
+    assets/logos/<name>.pbm             one row per nozzle, one column per 1/120 inch
+    assets/fonts/<font>/<char>.pbm      one glyph, top row on the first nozzle of the text
+
+They are read on first use and memoized, and come back as read-only (rows, columns) uint8 arrays.
+Any image editor that saves PBM can add or change a logo or a glyph.
+"""
+
+## ==== IMPORT MODULES ====
+import os
+from functools import lru_cache
+
+import numpy as np
+
+
+assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+
+## ==== FUNCTIONS ====
+
+## read a binary PBM (P4) file as a (rows, columns) uint8 array
+def read_pbm(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    fields = []
+    pos = 0
+    # magic number, width and height, separated by whitespace, comments start with #
+    while len(fields) < 3:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos) + 1
+            continue
+        start = pos
+        while not data[pos:pos + 1].isspace():
+            pos += 1
+        fields.append(data[start:pos])
+    if fields[0] != b'P4':
+        raise ValueError('%s is not a binary PBM (P4) file' % path)
+    width, height = int(fields[1]), int(fields[2])
+    row_bytes = (width + 7) // 8
+    bits = np.frombuffer(data, dtype=np.uint8, count=row_bytes * height, offset=pos + 1)
+    return np.unpackbits(bits.reshape(height, row_bytes), axis=1)[:, :width]
+
+
+# end
+
+
+## write a (rows, columns) array of 0 and 1 as binary PBM (P4)
+def write_pbm(path, matrix, comment=None):
+    matrix = np.asarray(matrix, dtype=np.uint8) != 0
+    height, width = matrix.shape
+    header = b'P4\n'
+    if comment:
+        header += b'# ' + comment.encode() + b'\n'
+    header += b'%d %d\n' % (width, height)
+    with open(path, 'wb') as f:
+        f.write(header + np.packbits(matrix, axis=1).tobytes())
+
+
+# end
+
+
+@lru_cache(maxsize=None)
+def _load(path):
+    matrix = read_pbm(path)
+    matrix.flags.writeable = False
+    return matrix
+
+
+## logo by name, see logo_names()
+def load_logo(name):
+    return _load(os.path.join(assets_dir, 'logos', name + '.pbm'))
+
+
+## glyph of one character, None if the font has no such glyph
+def load_glyph(font, char):
+    path = os.path.join(assets_dir, 'fonts', font, char + '.pbm')
+    if not os.path.exists(path):
+        return None
+    return _load(path)
+
+
+# end
+
+
+def logo_names():
+    return sorted(f[:-4] for f in os.listdir(os.path.join(assets_dir, 'logos')) if f.endswith('.pbm'))
+
+
+def font_names():
+    return sorted(os.listdir(os.path.join(assets_dir, 'fonts')))
+
+
+def glyph_names(font):
+    return sorted(f[:-4] for f in os.listdir(os.path.join(assets_dir, 'fonts', font)) if f.endswith('.pbm'))
+
+
+# end
@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+"""
+Bitmap to droplet conversion
+
+Loads an image (PNG, TIFF, JPG, ...), scales it to the nozzle pitch (vertical) and the dot pitch
+(horizontal), halftones it into the droplet sizes 0 (none), 1 (small), 2 (medium) and 3 (large),
+and writes the droplets as ESC i raster data for the Epson printers or as G-code with P1 fires
+for the pyboard setup.
+
+    python3 -m DoD.bitmap image.png output/image.prn -w 2
+    python3 -m DoD.bitmap image.png gcode/image.nc -w 2 --gcode
+"""
+
+## ==== IMPORT MODULES ====
+import os
+import argparse
+import functools
+
+import numpy as np
+from PIL import Image
+
+from DoD.nozzle_health import load_health, alive_nozzles
+from DoD.unprint import UNPRINT_DROP_ALPHA
+from DoD.swath import plan_swaths, swaths_escp2, NOZZLE_PITCH, DOT_PITCH
+from DoD.toolpath import plan_gcode
+
+
+## ==== Constants ====
+
+## ink coverage of no drop, a small, medium and large droplet, the halftone levels
+DROP_LEVELS = UNPRINT_DROP_ALPHA
+
+
+## ==== Functions ====
+
+## load an image as ink coverage, scaled to the printer resolution
+def load_image(path, width, height=None, dot_pitch=DOT_PITCH, nozzle_pitch=NOZZLE_PITCH, cmyk=False):
+    """
+    width, height:  printed size in inch, height follows the aspect ratio if None
+    Returns a dict with the ink name as key and a (rows, columns) float array of the ink
+    coverage (0 is white, 1 full coverage) as value. One row per nozzle, one column per dot.
+    With cmyk=True the image is split in cyan, magenta, yellow and black, else the grey
+    value is used for black.
+    """
+    image = Image.open(path)
+    if height is None:
+        height = width * image.height / image.width
+    size = (max(1, int(round(width / dot_pitch))), max(1, int(round(height / nozzle_pitch))))
+
+    if not cmyk:
+        grey = np.asarray(image.convert('L').resize(size, Image.BILINEAR), dtype=np.float32)
+        return {'black': 1 - grey / 255}
+
+    rgb = np.asarray(image.convert('RGB').resize(size, Image.BILINEAR), dtype=np.float32) / 255
+    black = 1 - rgb.max(axis=2)
+    rest = np.maximum(1 - black, 1e-6)
+    inks = {'black': black}
+    for k, name in enumerate(['cyan', 'magenta', 'yellow']):
+        inks[name] = (1 - rgb[:, :, k] - black) / rest
+    return inks
+
+
+# end
+
+
+## quantize ink coverage to the nearest droplet size
+def _quantize(values):
+    middle = (DROP_LEVELS[1:] + DROP_LEVELS[:-1]) / 2
+    return np.searchsorted(middle, values).astype(np.uint8)
+
+
+## halftone ink coverage into droplet sizes 0-3
+def halftone(ink, method='diffuse'):
+    """
+    ink is a (rows, columns) array with coverage 0-1, returns a uint8 array of droplet sizes.
+    method:
+        'threshold':    nearest droplet size per pixel
+        'diffuse':      Floyd-Steinberg error diffusion. Every pixel only depends on pixels
+                        with a lower x + 2y, so all pixels with the same x + 2y are computed
+                        at once, about rows * 3 numpy steps for the whole image.
+    """
+    ink = np.clip(np.asarray(ink, dtype=np.float64), 0, 1)
+    if method == 'threshold':
+        return _quantize(ink)
+    if method != 'diffuse':
+        raise ValueError("Unknown halftone method '%s', use 'threshold' or 'diffuse'" % method)
+
+    rows, cols = ink.shape
+    # accumulated error, one extra row below and a column padding on both sides
+    error = np.zeros((rows + 1, cols + 2))
+    drops = np.zeros((rows, cols), dtype=np.uint8)
+    all_y = np.arange(rows)
+    for t in range(cols + 2 * (rows - 1)):
+        ys = all_y[max(0, (t - cols + 2) // 2):min(rows - 1, t // 2) + 1]
+        xs = t - 2 * ys
+        value = ink[ys, xs] + error[ys, xs + 1]
+        size = _quantize(value)
+        drops[ys, xs] = size
+        err = value - DROP_LEVELS[size]
+        # each statement has distinct targets, so += adds every contribution
+        error[ys, xs + 2] += err * (7 / 16)
+        error[ys + 1, xs] += err * (3 / 16)
+        error[ys + 1, xs + 1] += err * (5 / 16)
+        error[ys + 1, xs + 2] += err * (1 / 16)
+    return drops
+
+
+# end
+
+
+## ESC/P2 raster data of a droplet array, printed in bands the height of the nozzle array
+def drops_escp2(drops, r, x, y, nozzles, pmgmt=720, hor=5760, health=None):
+    """
+    drops:      (rows, columns) droplet sizes, one row per nozzle, one column per dot
+    r:          color byte of the nozzle row
+    x, y:       position of the top left corner in inch
+    health:     nozzle health map, see nozzle_health.py
+    """
+    swaths = plan_swaths({r: drops}, int(x * hor), nozzles, hor, health=health)
+    return swaths_escp2(swaths, y, pmgmt, hor) + b'\x0c'
+
+
+# end
+
+
+## pattern function for DoD.patterns: prints the image at p.x, p.y with the selected color
+def p_image(p, path, width, height=None, method='diffuse'):
+    ink = load_image(path, width, height)['black']
+    return drops_escp2(halftone(ink, method), p.color, p.x, p.y, p.nozzles, p.pmgmt, p.hor, load_health(p.prnname))
+
+
+# end
+
+
+## G-code for the pyboard: move to every column and fire the nozzles of every droplet size
+def drops_gcode(drops, x=0, y=0, dx=DOT_PITCH * 25.4, nozzle_pitch=NOZZLE_PITCH * 25.4, nozzles=90,
+                quality='E', alive=None):
+    """
+    drops:          (rows, columns) droplet sizes, one row per nozzle
+    x, y:           start position in mm
+    dx:             column spacing in mm
+    nozzle_pitch:   distance between nozzles in mm, along y
+    nozzles:        number of black nozzles, taller images are printed in bands
+    alive:          bool array of working nozzles (see nozzle_health.py), the dots of dead
+                    nozzles are printed in extra passes with the stage shifted whole nozzles
+    Returns the G-code as a list of lines, see DoD.toolpath.plan_gcode().
+    """
+    return plan_gcode(drops, x, y, dx, nozzle_pitch, nozzles, quality=quality, alive=alive)
+
+
+# end
+
+
+## convert an image file to a complete prn job or a G-code file
+def convert_image(path, output, width, height=None, method='diffuse', gcode=False, printer='SX235W',
+                  color='black', posx=127000, posy=7.62):
+    """
+    width and height in inch, posx in um and posy in cm as in the GUI.
+    For G-code the image starts at 0, 0 and the pyboard setup with 90 black nozzles is assumed,
+    with the health map of the printer whose head is mounted on it.
+    """
+    from DoD.patterns import pattern_params, generate_job
+    p = pattern_params(printer, color, posx=posx, posy=posy)
+    if gcode:
+        ink = load_image(path, width, height)['black']
+        lines = drops_gcode(halftone(ink, method), alive=alive_nozzles(load_health(p.prnname), p.color, 90))
+        with open(output, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return output
+
+    pattern = functools.partial(p_image, path=path, width=width, height=height, method=method)
+    with open(output, 'wb') as f:
+        f.write(generate_job(p, pattern))
+    return output
+
+
+# end
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Halftone an image into ESC/P2 raster data or pyboard G-code')
+    parser.add_argument('image')
+    parser.add_argument('output')
+    parser.add_argument('-w', '--width', type=float, required=True, help='printed width in inch')
+    parser.add_argument('--height', type=float, default=None, help='printed height in inch')
+    parser.add_argument('-m', '--method', default='diffuse', choices=['diffuse', 'threshold'])
+    parser.add_argument('-p', '--printer', default='SX235W')
+    parser.add_argument('-c', '--color', default='black')
+    parser.add_argument('--gcode', action='store_true', help='write pyboard G-code instead of a prn file')
+    args = parser.parse_args(argv)
+
+    folder = os.path.dirname(args.output)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    print(convert_image(args.image, args.output, args.width, args.height, args.method, args.gcode,
+                        args.printer, args.color))
+
+
+if __name__ == '__main__':
+    main()
@@ -34,6 +34,7 @@ import sys
 from numpy import arctan, pi, sin, cos, tan, arcsin, arccos
 #from main import *
 from time import sleep
+from stage import ArduinoStage, find_arduino, microns_to_steps
 
 #create the window
 root = Tk()
@@ -44,49 +45,15 @@ def sleepTime(time, text):
     print("--- End of waiting for " + text + ".") 
 
 def arduino_init(): # Abel addition
-    global operatingSystem
     global arduino
     global timeToPrint, timeToStep, timeToWait
 
-    #Operating system choice
-    #Linux = 1
-    #Windows = 2
-    #Necessary for Arduino settings
-    if str(sys.platform) == "win32":
-        operatingSystem = 2
-        print("OS Windows 32")
-    elif str(sys.platform) == "linux":
-        operatingSystem = 1
-        print("OS Linux")
-    else: 
-        operatingSystem = input('Select operating system number: Linux (1), Windows 32 (2): ')
-    
-   # Path Arduino
-    linuxpathList = [ "/dev/ttyUSB0" , "/dev/ttyUSB1" , "/dev/ttyACM0" , "/dev/ttyACM1" , "/dev/ttyACM2" , "/dev/ttyACM3" ] # possible connection paths for Abel
-
-    if operatingSystem == 1:
-        ### NEW ### automatically picks right path for Linux
-        for k in range(len(linuxpathList)):
-            try:
-                arduino = serial.Serial(linuxpathList[k])
-                if arduino.is_open == 1:                    
-                    print("USB connection to Arduino working for " + str(linuxpathList[k]))
-                    linuxpath = linuxpathList[k]
-                    k = len(linuxpathList) # Abel this does not seem to work yet.
-            except:
-                pass
-                #print( "USB connection to Arduino NOT working for " + str(linuxpathList[k]))
-        
-        try:
-            if arduino.is_open == 1:
-                pass
-        except:
-            print("0002: USB connection to Arduino NOT working, check in terminal with 'dmesg' if it is connected")
-        
-    elif operatingSystem == 2:
-        arduino = serial.Serial('COM3')
-    else:
-        print("Select operating system")
+    # Arduino found by its USB vendor id, opened once and kept open without resetting it
+    arduino = ArduinoStage(find_arduino())
+    try:
+        arduino.open()
+    except serial.SerialException as e:
+        print("0002: USB connection to Arduino NOT working, check in terminal with 'dmesg' if it is connected (%s)" % e)
 
     timeToPrint = 18 # measure this before printing, otherwise you will move arduino while printer is still printing
     timeToStep = 3
@@ -717,6 +684,7 @@ def calculate():
 def client_exit():
     mExit=messagebox.askyesno(title="Quit", message="Are You Sure?")
     if mExit>0:
+        arduino.close()
         root.destroy()
         return
 
@@ -724,101 +692,21 @@ def sendtoArduino():
     print("sendtoArduino")
     calculate()
     global dy_microns
-    #print(arduino.name)
-    #sleepTime(0.1, "Arduino")
-    
-    if arduino.is_open == 1:                    
-        print("USB connection to Arduino working")   # no conflict on usb
-    else:
-        print("Open up Arduino!")
-        arduino.open()
-        sleepTime(timeToWait, "Arduino")
-        if arduino.is_open == 1:                    
-            print("USB connection to Arduino working")   # no conflict on usb
-        else:
-            print( "USB connection to Arduino NOT working")
-    
-    try:
-        # print("Read Arduino // disabled")
-        print("Wait for Arduino start")
-        sleep(timeToWait)
-        start = ""
-        while start != "Start":
-            start = arduino.readline().decode().strip() # can give errors because there is nothing to print
-        print("Arduino: " + start)
-    except:
-        print("Port " + arduino.name + " NOT really open.")
-
-    translationRate = 500 #one rotation is 500 microns
-    stepsperRotation = 200*16 #one rotation is 200*16=3200 steps using the NEMA-17 stepper motor
-    steps = round(dy_microns.get()/translationRate*stepsperRotation)
-    distanceStr = str(steps)
-    print ("steps to travel " + distanceStr)
-
-    arduino.write(distanceStr.encode())
-    
-    try:
-        # sleepTime(timeToStep, "stepping") # could be replaced by read if the arduino prints text in loop after stepping
-        # print("Read Arduino // disabled")
-        print("Wait for Arduino end")
-        sleep(timeToWait)
-        end = ""
-        while end != "End":
-            end = arduino.readline().decode().strip() # can give errors because there is nothing to print
-        print("Arduino: " + end)
-    except:
-        print("Port " + arduino.name + " NOT really open.")
-
-    arduino.close()  # if not closed, you can't print
-    print ("usb closed, program finished")
+    moveArduino(dy_microns.get())
 
 def sendValuetoArduino():
     print("sendValuetoArduino")
     global moveMicrons
-    if arduino.is_open == 1:                    
-        print("USB connection to Arduino working")   # no conflict on usb
-    else:
-        print("Open up Arduino!")
-        arduino.open()
-        sleepTime(timeToWait, "Arduino")
-        if arduino.is_open == 1:                    
-            print("USB connection to Arduino working")   # no conflict on usb
-        else:
-            print( "USB connection to Arduino NOT working")
-    
-    try:
-        # print("Read Arduino // disabled")
-        print("Wait for Arduino start")
-        sleep(timeToWait)
-        start = ""
-        while start != "Start":
-            start = arduino.readline().decode().strip() # can give errors because there is nothing to print
-        print("Arduino: " + start)
-    except:
-        print("Port " + arduino.name + " NOT really open.")
-
-    translationRate = 500 #one rotation is 500 microns
-    stepsperRotation = 200*16 #one rotation is 200*16=3200 steps using the NEMA-17 stepper motor
-    steps = round(moveMicrons.get()/translationRate*stepsperRotation)
-    distanceStr = str(steps)
-    print ("steps to travel " + distanceStr)
-  
-    arduino.write(distanceStr.encode())
-    
+    moveArduino(moveMicrons.get())
+
+def moveArduino(microns):
+    # queued, the worker thread of the stage sends it and waits for "End"
+    steps = microns_to_steps(microns)
+    print ("steps to travel " + str(steps))
     try:
-        # sleepTime(timeToStep, "stepping") # could be replaced by read if the arduino prints text in loop after stepping
-        # print("Read Arduino // disabled")
-        print("Wait for Arduino end")
-        sleep(timeToWait)
-        end = ""
-        while end != "End":
-            end = arduino.readline().decode().strip() # can give errors because there is nothing to print
-        print("Arduino: " + end)
-    except:
-        print("Port " + arduino.name + " NOT really open.")
-
-    arduino.close()  # if not closed, you can't print
-    print ("usb closed, program finished")
+        arduino.move(steps)
+    except serial.SerialException as e:
+        print("USB connection to Arduino NOT working: %s" % e)
 
 
 
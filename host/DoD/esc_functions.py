@@ -1,5 +1,6 @@
 ## ==== IMPORT MODULES ====
 import binascii
+import numpy as np
 from DoD.hex_functions import *
 
 
@@ -529,3 +530,27 @@ def ESC_i_nrs(nozzlelist, r=b'\x00', size=1):
     return total
 
 # end
+
+
+## pack droplet sizes in 2 bit pixels, 4 pixels per byte, first pixel in the highest bits
+def pack_drops(drops):
+    rows, cols = drops.shape
+    padded = np.zeros((rows, -(-cols // 4) * 4), dtype=np.uint8)
+    padded[:, :cols] = drops
+    return (padded[:, 0::4] << 6) | (padded[:, 1::4] << 4) | (padded[:, 2::4] << 2) | padded[:, 3::4]
+
+
+## compressed ESC i command of a droplet array, one row per nozzle
+def ESC_i_drops(drops, r=b'\x00'):
+    packed = pack_drops(drops)
+    m, n = packed.shape
+    prefix = b'\x1b' + str_hex('i')  # ESC i
+    c = b'\x01'  # COMPRESSED
+    b = b'\x02'
+    image = b''.join(rle_encode(row) for row in packed)
+    suffix1 = b'\x0d'
+    return prefix + r + c + b + dec_hex(n % 256) + dec_hex(n // 256) + dec_hex(m % 256) + dec_hex(m // 256) + \
+           image + suffix1
+
+
+# end
@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+"""
+Experiment runner: generate ESC/P2 files for a sweep of printers, patterns and pattern parameters
+
+A sweep specification is a dict, or a JSON file with the same content:
+
+    {
+        "name":     "exp_uni_bi",
+        "printer":  ["SX235W", "SX235W-HR"],
+        "pattern":  ["nxm raster"],
+        "color":    ["black"],
+        "values":   {"posx": 166000, "posy": 8, "n": 10, "m": 4},
+        "sweep":    {"size": [1, 2, 3], "dx": [250, 500], "umode": [0, 1], "rep": [1, 2]}
+    }
+
+Values and swept values are in GUI units (posx um, posy cm, dx and rdx um), see pattern_params().
+Every file is stored as <hash>.prn in the experiment folder. The hash covers the parameters, the
+pattern, the printer header, footer and nozzle health map and the source of the generator modules,
+so combinations that did not change are not generated again. manifest.csv in the same folder links every file to its parameters.
+
+    python3 -m DoD.experiment DoD/EXP/exp_uni_bi.json
+"""
+
+## ==== IMPORT MODULES ====
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+import itertools
+from dataclasses import asdict
+
+from DoD.patterns import pattern_params, generate_files, prns_dir, PATTERNS
+from DoD.nozzle_health import health_path
+
+
+exp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'EXP')
+
+## modules that produce the files, a change to their code gives new files
+GENERATOR_MODULES = ['patterns', 'esc_functions', 'hex_functions', 'swath', 'nozzle_health', 'text', 'assets',
+                     'logos']
+_source_digest = None
+
+
+## ==== FUNCTIONS ====
+
+## list of values, a single value is a sweep of one
+def _as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+## hash of the source of the generator modules, once per run
+def source_digest():
+    global _source_digest
+    if _source_digest is None:
+        h = hashlib.sha1()
+        folder = os.path.dirname(os.path.abspath(__file__))
+        for name in GENERATOR_MODULES:
+            with open(os.path.join(folder, name + '.py'), 'rb') as f:
+                h.update(f.read())
+        _source_digest = h.hexdigest()
+    return _source_digest
+
+
+# end
+
+
+## hash of everything that ends up in a generated file
+def job_hash(p, pattern):
+    """
+    p is a PatternParams, pattern a key of PATTERNS.
+    The header, footer and health map of the printer are included, a new printer capture gives
+    new files, and so does a change to the generator code.
+    """
+    h = hashlib.sha1()
+    h.update(source_digest().encode())
+    values = asdict(p)
+    for name in sorted(values):
+        h.update(('%s=%r;' % (name, values[name])).encode())
+    h.update(pattern.encode())
+    folder = os.path.join(prns_dir, p.prnname, p.prnname)
+    for section in ['-header.prn', '-footer.prn']:
+        with open(folder + section, 'rb') as f:
+            h.update(f.read())
+    if os.path.exists(health_path(p.prnname)):
+        with open(health_path(p.prnname), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+# end
+
+
+## all jobs of a sweep specification
+def expand_spec(spec):
+    """
+    Returns a list of dicts with printer, pattern, color, the swept values and the PatternParams
+    of one job, in a fixed order.
+    """
+    values = spec.get('values', {})
+    sweep = dict((k, _as_list(v)) for k, v in spec.get('sweep', {}).items())
+    keys = sorted(sweep)
+    jobs = []
+    for printer, pattern, color in itertools.product(_as_list(spec.get('printer', 'SX235W')),
+                                                     _as_list(spec.get('pattern', 'nxm raster')),
+                                                     _as_list(spec.get('color', 'black'))):
+        if pattern not in PATTERNS:
+            raise ValueError("Unknown pattern '%s', choose from: %s" % (pattern, ', '.join(sorted(PATTERNS))))
+        for combination in itertools.product(*[sweep[k] for k in keys]):
+            swept = dict(zip(keys, combination))
+            settings = dict(values)
+            settings.update(swept)
+            jobs.append({'printer': printer, 'pattern': pattern, 'color': color, 'swept': swept,
+                         'params': pattern_params(printer, color, **settings)})
+    return jobs
+
+
+# end
+
+
+## generate all files of an experiment that are not in the folder yet, and write the manifest
+def run_experiment(spec, folder=None, workers=None):
+    """
+    spec:       sweep specification, see the module docstring
+    folder:     output folder, default EXP/<name>
+    workers:    number of processes, default the number of cpus
+    Returns the list of manifest rows (dicts).
+    """
+    if folder is None:
+        folder = os.path.join(exp_dir, spec.get('name', 'experiment'))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    start = time.time()
+    jobs = expand_spec(spec)
+    todo = []
+    queued = set()
+    rows = []
+    for job in jobs:
+        p = job['params']
+        digest = job_hash(p, job['pattern'])
+        filename = digest[:16] + '.prn'
+        path = os.path.join(folder, filename)
+        # identical combinations in one sweep are generated once
+        if not os.path.exists(path) and path not in queued:
+            queued.add(path)
+            todo.append((p, job['pattern'], path))
+
+        row = {'file': filename, 'hash': digest, 'printer': job['printer'], 'pattern': job['pattern'],
+               'color_name': job['color']}
+        row.update(('sweep_' + k, v) for k, v in sorted(job['swept'].items()))
+        row.update(_manifest_values(p))
+        rows.append(row)
+
+    if todo:
+        generate_files(todo, workers)
+    write_manifest(rows, os.path.join(folder, 'manifest.csv'))
+
+    print('%s: %s files, %s generated, %s cached (%.1f s)' %
+          (folder, len(rows), len(todo), len(rows) - len(todo), time.time() - start))
+    return rows
+
+
+# end
+
+
+## PatternParams as manifest columns, bytes as hex
+def _manifest_values(p):
+    values = asdict(p)
+    for name in values:
+        if isinstance(values[name], bytes):
+            values[name] = values[name].hex()
+    return values
+
+
+## write the manifest as csv, one row per file
+def write_manifest(rows, path):
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# end
+
+
+## read a manifest back, values stay strings
+def read_manifest(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+# end
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the ESC/P2 files of a parameter sweep')
+    parser.add_argument('spec', help='JSON sweep specification')
+    parser.add_argument('-o', '--output', default=None, help='output folder, default EXP/<name>')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes')
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    run_experiment(spec, args.output, args.jobs)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,33 +3,233 @@ import re
 import binascii
 import os
 import math
+import mmap
+import numpy as np
 from prettytable import PrettyTable
 
 
 ## ==== Functions ====
 
-## splits the binary data into a list with delimiter ESC = b'\x1b'
-def data_splitter(data):
-    data_split = re.split(b'\x1b', data)
-    if data_split[0] == b'':
-        data_split = re.split(b'\x1b', data)
-        if data_split[0] == b'':
-            del data_split[0:1]
-            for x in range(len(data_split)):
-                data_split[x] = b'\x1b' + data_split[x]
+## ==== ESC/P2 tokenizer ====
+
+## command name of a raster command that runs past the end of the data, see escp2_iter
+TRUNCATED = b'truncated'
+
+## number of parameter bytes following 'ESC <c>' for commands without a length field
+ESC_FIXED_PARAMS = {
+    b'@': 0,  # initialize printer
+    b'U': 1,  # unidirectional mode
+    b'r': 1,  # select color (old style)
+    b'$': 2,  # absolute horizontal position (old style)
+    b'\\': 2,  # relative horizontal position (old style)
+    b'+': 1,  # set n/360 inch line spacing
+    b'\x00': 2,  # ESC 00 00 00, exit remote mode
+}
+
+
+## number of bytes a run-length compressed raster occupies in the stream
+def rle_length(data, start, size, stop=None):
+    """
+    Walk the TIFF/packbits compressed raster data starting at data[start] until
+    size bytes have been decoded. Returns the number of compressed bytes used, or None
+    if the data ends at stop (default len(data)) before size bytes are decoded.
+    counter < 128: counter+1 literal bytes follow, counter >= 128: repeat next byte 257-counter times.
+    """
+    pos = start
+    decoded = 0
+    end = len(data) if stop is None else min(stop, len(data))
+    while decoded < size and pos < end:
+        counter = data[pos]
+        if counter < 128:
+            decoded += counter + 1
+            pos += counter + 2
         else:
-            for x in range(len(data_split)):
-                data_split[x] = b'\x1b' + data_split[x]
-    else:
-        for y in range(len(data_split)):
-            if y == 0:
-                data_split[y] = data_split[y]
+            decoded += 257 - counter
+            pos += 2
+    if decoded < size or pos > end:
+        return None
+    return pos - start
+
+
+# end
+
+
+## TIFF/packbits run-length compression of one raster row
+def rle_encode(row):
+    """
+    row is a uint8 array, runs of 3 or more equal bytes become repeat packets,
+    everything in between literal packets of at most 128 bytes.
+    """
+    row = np.asarray(row, dtype=np.uint8)
+    if row.size == 0:
+        return b''
+    starts = np.flatnonzero(np.concatenate(([True], row[1:] != row[:-1])))
+    lengths = np.diff(np.append(starts, row.size))
+
+    data = row.tobytes()
+    packets = []
+    literal = 0  # start of the pending literal bytes
+    for start, length in zip(starts[lengths >= 3].tolist(), lengths[lengths >= 3].tolist()):
+        for k in range(literal, start, 128):
+            chunk = data[k:min(k + 128, start)]
+            packets.append(dec_hex(len(chunk) - 1) + chunk)
+        for k in range(start, start + length, 128):
+            count = min(128, start + length - k)
+            if count < 2:
+                packets.append(b'\x00' + data[k:k + 1])
+            else:
+                packets.append(dec_hex(257 - count) + data[k:k + 1])
+        literal = start + length
+    for k in range(literal, row.size, 128):
+        chunk = data[k:min(k + 128, row.size)]
+        packets.append(dec_hex(len(chunk) - 1) + chunk)
+    return b''.join(packets)
+
+
+# end
+
+
+## position of the next ESC byte in data[start:stop], or stop if there is none
+def _find_esc(view, find, start, stop):
+    if find is not None:
+        pos = find(b'\x1b', start, stop)
+        return stop if pos < 0 else pos
+    while start < stop and view[start] != 0x1b:
+        start += 1
+    return start
+
+
+# end
+
+
+## walk an ESC/P2 stream command by command without copying it
+def escp2_iter(data, start=0, stop=None):
+    """
+    Tokenize ESC/P2 data (bytes, bytearray, mmap or memoryview) using the nL/nH length
+    fields and the ESC i raster sizes to jump from command to command.
+    Yields (offset, end, command, params) tuples:
+        offset:     position of the ESC byte (or of the first byte of a non-ESC run)
+        end:        position right after the last byte of the command
+        command:    command name, e.g. b'(G', b'i', b'@' or b'' for bytes between commands
+                    (CR, FF, EJL text). Commands in REMOTE1 mode are indexed by their
+                    two-letter name, e.g. b'SN'.
+        params:     memoryview of the bytes after the command name, up to end
+    Raster data inside ESC i may contain 0x1b bytes, these are skipped because the
+    raster length is known. An ESC i or ESC . whose raster data runs past stop is yielded
+    as TRUNCATED up to stop and ends the iteration.
+    """
+    view = memoryview(data)
+    find = getattr(data, 'find', None)
+    if stop is None:
+        stop = len(view)
+    remote = False
+    pos = start
+
+    while pos < stop:
+        if view[pos] != 0x1b:
+            # REMOTE1 command: 2 letters nL nH data
+            if remote and pos + 4 <= stop:
+                n = view[pos + 2] + 256 * view[pos + 3]
+                end = min(pos + 4 + n, stop)
+                yield (pos, end, bytes(view[pos:pos + 2]), view[pos + 2:end])
+                pos = end
+                continue
+            # loose bytes between commands, scan to next ESC
+            end = _find_esc(view, find, pos + 1, stop)
+            yield (pos, end, b'', view[pos:end])
+            pos = end
+            continue
+
+        if pos + 1 >= stop:
+            yield (pos, stop, b'', view[pos:stop])
+            break
+        c = view[pos + 1]
+
+        if c == 0x28:  # ESC ( c nL nH data
+            command = bytes(view[pos + 1:pos + 3])
+            n = view[pos + 3] + 256 * view[pos + 4] if pos + 4 < stop else 0
+            end = min(pos + 5 + n, stop)
+            if command == b'(R':
+                remote = True
+        elif c == 0x69:  # ESC i r c b nL nH mL mH data
+            command = b'i'
+            header = pos + 2
+            end = min(header + 7, stop)
+            if end - header < 7:
+                command = TRUNCATED
+            else:
+                compressed = view[header + 1]
+                n = view[header + 3] + 256 * view[header + 4]
+                m = view[header + 5] + 256 * view[header + 6]
+                length = rle_length(view, end, n * m, stop) if compressed else n * m
+                if length is None or end + length > stop:
+                    command = TRUNCATED
+                    end = stop
+                else:
+                    end += length
+        elif c == 0x2e:  # ESC . c v h m nL nH data
+            command = b'.'
+            header = pos + 2
+            end = min(header + 6, stop)
+            if end - header < 6:
+                command = TRUNCATED
             else:
-                data_split[y] = b'\x1b' + data_split[y]
+                compressed = view[header]
+                n = (view[header + 4] + 256 * view[header + 5] + 7) // 8
+                m = view[header + 3]
+                length = rle_length(view, end, n * m, stop) if compressed else n * m
+                if length is None or end + length > stop:
+                    command = TRUNCATED
+                    end = stop
+                else:
+                    end += length
+        elif c == 0x01:  # ESC 01 @EJL ... text, runs till the next ESC
+            command = b'\x01'
+            end = _find_esc(view, find, pos + 2, stop)
+        else:
+            command = bytes([c])
+            end = min(pos + 2 + ESC_FIXED_PARAMS.get(command, 0), stop)
+            if c == 0x00:
+                remote = False
+
+        if command == TRUNCATED:
+            yield (pos, stop, command, view[pos:stop])
+            break
+        yield (pos, end, command, view[pos + 1 + len(command):end])
+        pos = end
+
+
+# end
+
+
+## index every command of an ESC/P2 stream, see escp2_iter
+def escp2_index(data, start=0, stop=None):
+    """
+    Returns a list of (offset, end, command, params) tuples for all commands in data.
+    """
+    return list(escp2_iter(data, start, stop))
+
+
+# end
+
+
+## splits the binary data into a list of commands, each starting with ESC = b'\x1b'
+def data_splitter(data):
+    """
+    Returns a list with one entry per ESC/P2 command, bytes that are not a command (CR, FF,
+    REMOTE1 commands) stay attached to the command before them.
+    Leading bytes before the first ESC are kept as a separate entry.
+    """
+    data_split = []
+    for offset, end, command, params in escp2_index(data):
+        if data[offset] != 0x1b and data_split:
+            data_split[-1] += data[offset:end]
+        else:
+            data_split.append(bytes(data[offset:end]))
     return data_split
 
 
-# end function
+# end
 
 
 ## load a prn file and splits it into a header, body and footer file
@@ -43,67 +243,64 @@ def split_prn(printername, filepath, outputfolder='prns'):
     file = filepath
     map = outputfolder + '/' + printername
 
-    ## load hex file
-    with open(file, 'rb') as f:
-        data = f.read()
-    data_hex = binascii.hexlify(data)
-    # end load
+    ## map the file instead of loading it, large captures are never copied into memory
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        startbody, endbody, startfooter = prn_sections(data)
+        if startbody is None or endbody is None or startfooter is None:
+            print('Error! ' + file + ' does not contain a header, body and footer')
+            return
+
+        if not os.path.exists(outputfolder):
+            os.makedirs(outputfolder)
+
+        ## write the sections as slices of the mapped file
+        view = memoryview(data)
+        for section, begin, end in [('header', 0, startbody),
+                                    ('body', startbody, endbody),
+                                    ('footer', startfooter, len(data))]:
+            with open(map + '-' + section + '.prn', 'wb') as fx:
+                fx.write(view[begin:end])
+        view.release()
 
 
-    data_split = data_splitter(data)
-    for y in data_split:
-        print(y)
-    # print(data_split)
-
-    endbody = []
-    for i in range(len(data_split) - 1):
-        if data_split[i][2:3] == b'\x47':
-            startbody = i
-        if data_split[i][2:3] == b'\x76':
-            endbody.append(i)
-        if data_split[i][-1:] == b'\x0c' and data_split[i + 1][1:2] == b'\x40':
-            startfooter = i + 1
-    #
-    if not os.path.exists(outputfolder):
-        os.makedirs(outputfolder)
-
-    ## get header file
-    header = b''
-    for x in range(0, startbody):
-        header += data_split[x]
-    # print(header)
-    # end header
-    ## write header file
-    f = open(map + '-header.prn', 'wb')
-    f.write(header)
-    f.close()
-    # end write header3
-
-    ## get body till ESC i
-    body = b''
-    for x in range(startbody, endbody[0]):
-        body += data_split[x]
-    # print(body)
-    # end body
-    f = open(map + '-body.prn', 'wb')
-    f.write(body)
-    f.close()
-    # end write body
-
-    ## get footer
-    footer = b''
-    for x in range((len(data_split) - 3), len(data_split)):
-        footer += data_split[x]
-    # end footer
-    f = open(map + '-footer.prn', 'wb')
-    f.write(footer)
-    f.close()
-
-
-# end write footer
 # endfunction
 
 
+## find the header, body and footer of a prn file
+def prn_sections(data):
+    """
+    Returns (startbody, endbody, startfooter) offsets, None for sections that are not found.
+    Header runs till ESC ( G, body till the first ESC ( v.
+    The footer starts at the ESC @ following the last form feed that has no raster data after
+    it. The rest of the file is walked with escp2_iter, so the raster data is skipped by its
+    length and bytes inside it are never taken for a form feed.
+    """
+    startbody = None
+    endbody = None
+    for offset, end, command, params in escp2_iter(data):
+        if command == b'(G' and startbody is None:
+            startbody = offset
+        if command == b'(v':
+            endbody = offset
+            break
+
+    ## ESC @ right after loose bytes ending in a form feed, the last one without raster data after it
+    view = memoryview(data)
+    startfooter = None
+    loose_end = None
+    for offset, end, command, params in escp2_iter(data, endbody or 0):
+        if command in (b'i', b'.'):
+            startfooter = None
+        elif command == b'@' and loose_end == offset and view[offset - 1] == 0x0c:
+            startfooter = offset
+        loose_end = end if command == b'' else None
+    view.release()
+    return startbody, endbody, startfooter
+
+
+# end
+
+
 
 ## print a hexadecimal byte in ascii
 def print_hex(hbyte):
@@ -225,213 +422,84 @@ def rsf(num, sig_figs=5):
 
 
 
+## command formats and descriptions used by the viewer
+ESC_DESCRIPTIONS = {
+    b'(G': ['    (  G nL nH  m', 'Selecting graphics mode'],
+    b'(U': ['    (  U nL nH  P  V  H mL mH', 'Set unit (expanded)'],
+    b'(K': ['    (  K nL nH  m  n', 'Monochrome/Color mode'],
+    b'(i': ['    (  i nL nH  n', 'MicroWeave mode'],
+    b'U': ['    U  n', 'Unidirectional mode'],
+    b'(e': ['    (  e nL nH  m  d', 'Select dot size'],
+    b'(D': ['    (  D nL nH rL rH  v  h', 'Set raster resolution'],
+    b'(C': ['    (  C nL nH m1 m2 m3 m4', 'Set page length'],
+    b'(c': ['    (  c nL nH t1 t2 t3 t4 b1 b2 b3 b4', 'Set page format'],
+    b'(S': ['    (  S nL nH w1 w2 w3 w4 l1 l2 l3 l4', 'Set paper dimensions'],
+    b'(m': ['    (  m nL nH n', 'Set Print method ID'],
+    b'(v': ['    (  v nL nH m1 m2 m3 m4', 'Set relative vertical position'],
+    b'(V': ['    (  V nL nH m1 m2 m3 m4', 'Set absolute vertical position'],
+    b'($': ['    (  $ nL nH m1 m2 m3 m4', 'Set absolute horizontal position'],
+    b'(/': ['    (  / nL nH m1 m2 m3 m4', 'Set relative horizontal position'],
+    b'(R': ['    (  R nL nH 00 REMOTE1', 'Enter remote mode'],
+    b'i': ['    i  r  c  b nL nH mL mH data', 'Transfer raster image'],
+    b'.': ['    .  c  v  h  m nL nH data', 'Print raster graphics'],
+    b'@': ['    @', 'Initialize printer'],
+    b'\x01': ['   01 @EJL', 'Exit packet mode'],
+    b'\x00': ['   00 00 00', 'Exit remote mode'],
+}
+
+
+## create a table of all ESC/P2 commands in data, like perl script: parse-escp2
+def escp2_table(data, full=False):
+    """
+    Returns the table as a string. Raster data of ESC i is cut off after 16 bytes,
+    unless full is True.
+    """
+    t = PrettyTable(['Offset', 'Command', 'hex format', 'Description'])
+    t.align = "l"
+
+    for offset, end, command, params in escp2_index(data):
+        if command == b'':
+            if bytes(params).strip(b'\r\x0c\x00') == b'':
+                continue
+            t.add_row([offset, '', params[:16].hex(' '), 'Data outside command'])
+            continue
+
+        if command == TRUNCATED:
+            t.add_row([offset, 'ESC ' + chr(data[offset + 1]), bytes(data[offset:min(end, offset + 16)]).hex(' '),
+                       'Truncated raster data, runs past the end'])
+            continue
+
+        if command in ESC_DESCRIPTIONS:
+            cformat, description = ESC_DESCRIPTIONS[command]
+        elif data[offset] != 0x1b:
+            cformat, description = '    ' + command.decode('ascii', 'replace') + ' nL nH', 'Remote mode command'
+        else:
+            cformat, description = '', 'Unknown ESC command'
+
+        name = ' '.join(chr(b) if 32 < b < 127 else '%02x' % b for b in command)
+        if data[offset] == 0x1b:
+            name = 'ESC ' + name
+        seq = data[offset:end] if full or command not in (b'i', b'.') else data[offset:min(end, offset + 16)]
+        seq = bytes(seq).hex(' ')
+        if len(seq) < 3 * (end - offset) - 1:
+            seq += ' ... (%s bytes)' % (end - offset)
+
+        t.add_row([offset, name, cformat, description])
+        t.add_row(['', '', seq, ''])
+    return t.get_string()
+
+
+# end
+
+
 ## view a prn file, in hexadecimal bytes. Values need to be converted to decimals for calculations.
 ## Only view, like perl script: parse-escp2
-def body_viewer(filepath):
+def body_viewer(filepath, full=False):
     ## load body file
     with open(filepath, 'rb') as f:
         data = f.read()
     # end load
 
-    ## split data
-    body_split = data_splitter(data)
-    # done
-
-    ## init table
-    t = PrettyTable(['Command', 'hex format', 'Description'])
-    t.align = "l"
-
-    ## define strings for table
-    c_escbG = ['ESC ( G ', '    (  G nL nH  m']
-    c_escbU = ['ESC ( U ', '    (  U nL nH  P  V  H mL mH']
-    c_escbK = ['ESC ( K ', '    (  K nL nH  m  n']
-    c_escbi = ['ESC ( i ', '    (  i nL nH  n']
-    c_escU = ['ESC U ', '    U  n']
-    c_escbe = ['ESC ( e ', '    (  e nL nH  m  d']
-    c_escbD = ['ESC ( D ', '    (  D nL nH rL rH  v  h']
-    c_escbC = ['ESC ( C ', '    (  C nL nH m1 m2 m3 m4']
-    c_escbc = ['ESC ( c ', '    (  c nL nH t1 t2 t3 t4 b1 b2 b3 b4']
-    c_escbS = ['ESC ( S ', '    (  S nL nH w1 w2 w3 w4 l1 l2 l3 l4']
-    c_escbm = ['ESC ( m ', '    (  m nL nH n']
-    empty_row = ['', '', '']
-
-    ## add/fill table rows
-    for x in range(len(body_split)):
-        if body_split[x][0:1] != b'\x1b':
-            print('Error! body.prn in wrong format!')
-
-        ## ESC ( G ...
-        elif body_split[x][2:3] == b'G':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            m = body_split[x][5]
-
-            # d_escbG = [c_escbG, seq,'Selecting graphics mode', c_escbG +' nL nH m']
-            t.add_row([c_escbG[0], c_escbG[1], 'Selecting graphics mode'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( U ...
-        elif body_split[x][2:3] == b'U':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            P = body_split[x][5]
-            V = body_split[x][6]
-            H = body_split[x][7]
-            mL = body_split[x][8]
-            mH = body_split[x][9]
-
-            t.add_row([c_escbU[0], c_escbU[1], 'Set unit (expanded)'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( K ...
-        elif body_split[x][2:3] == b'K':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            m = body_split[x][5]
-            n = body_split[x][6]
-
-            t.add_row([c_escbK[0], c_escbK[1], 'Monochrome/Color mode'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( i ...
-        elif body_split[x][2:3] == b'i':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            n = body_split[x][5]
-
-            t.add_row([c_escbi[0], c_escbi[1], 'MicroWeave mode'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC U ...
-        elif body_split[x][1:2] == b'U':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            n = body_split[x][2]
-
-            t.add_row([c_escU[0], c_escU[1], 'Unidirectional mode'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( e ...
-        elif body_split[x][2:3] == b'e':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            m = body_split[x][5]
-            d = body_split[x][6]
-
-            t.add_row([c_escbe[0], c_escbe[1], 'Select dot size'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( D ...
-        elif body_split[x][2:3] == b'D':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            rL = body_split[x][5]
-            rH = body_split[x][6]
-            v = body_split[x][7]
-            h = body_split[x][8]
-
-            t.add_row([c_escbD[0], c_escbD[1], 'Set raster resolution'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( C ...
-        elif body_split[x][2:3] == b'C':
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            m1 = body_split[x][5]
-            m2 = body_split[x][6]
-            m3 = body_split[x][7]
-            m4 = body_split[x][8]
-
-            t.add_row([c_escbC[0], c_escbC[1], 'Set page length'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( c ...
-        elif body_split[x][2:3] == b'c':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            tL = body_split[x][5]
-            tH = body_split[x][6]
-            bL = body_split[x][7]
-            bH = body_split[x][8]
-
-            t.add_row([c_escbc[0], c_escbc[1], 'Set page format'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( S nl ....
-        elif body_split[x][2:3] == b'S':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            w1 = body_split[x][5]
-            w2 = body_split[x][6]
-            w3 = body_split[x][7]
-            w4 = body_split[x][8]
-            l1 = body_split[x][9]
-            l2 = body_split[x][10]
-            l3 = body_split[x][11]
-            l4 = body_split[x][12]
-
-            t.add_row([c_escbS[0], c_escbS[1], 'Set paper dimensions'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        ## ESC ( m ...
-        elif body_split[x][2:3] == b'm':
-            seq = ''
-            for y in range(len(body_split[x])):
-                seq += print_hex(body_split[x][y:y + 1]) + ' '
-
-            nL = body_split[x][3]
-            nH = body_split[x][4]
-            n = body_split[x][5]
-
-            t.add_row([c_escbm[0], c_escbm[1], 'Set Print method ID'])
-            t.add_row(['', seq, ''])
-            t.add_row(empty_row)
-
-        else:
-            print('body.prn contains unknown ESC command')
     ## print table
-    print(t)
+    print(escp2_table(data, full))
     print('Done!')
\ No newline at end of file
@@ -49,6 +49,9 @@ from PIL import *#Image, ImageTk #abel
 from DoD.esc_functions import *
 from DoD.hex_functions import *
 from DoD.logos import *
+from DoD.unprint import unprint_file
+from DoD.patterns import PatternParams, job_body, pmidOpt, dotOpt, printersParDict, colorNames
+import DoD.patterns as dod_patterns
 
 from time import sleep
 
@@ -63,100 +66,11 @@ patternSelected = 'diagonal line'
 printerSelected = 'SX235W'
 curRow = 0
 
-colorNames = ['black', 'black2', 'black3', 'magenta', 'cyan', 'yellow']
 modUnits = [5760, 2880, 1440, 720, 360, 180, 120, 90]
 
 
 # ==== DICTIONARIES ====
-
-# PRINT METHODS IDs
-pmidOpt = {
-    'None' : b'',
-    'Normal2' : b'\x21',
-    'Normal1' : b'\x20',
-    'Highres' : b'\xc0'
-}
-
-# DOT QUALITY OPTIONS
-dotOpt = {
-    'Economy' : b'\x10',
-    'VSD1' : b'\x11',
-    'VSD2' : b'\x12',
-    'VSD3' : b'\x13'
-}
-
-# PRINTER MODELS + SPECS
-printersParDict = {
-    'SX600FW' : {'pmgmt' : 720,
-                'vert': 720,
-                'hor': 5760,
-                'm': 5760,
-                'nozzles' : 128,
-                'black' : b'\x60',
-                'd' : 'VSD2',
-                'pmid' : 'Normal2',
-                'linux-name': 'printer-sx600fw',
-                'prnfiles' :'sx600fw'},
-    'SX235W': {'pmgmt': 720,
-                'vert': 720,
-                'hor': 5760,
-                'm': 5760,
-                'nozzles': 30,
-                'black': b'\x00',
-                'black2' : b'\x05',
-                'black3' : b'\x06',
-                'magenta' : b'\x01',
-                'cyan' : b'\x02',
-                'yellow' : b'\x04',
-                'd': 'VSD2',
-                'pmid': 'Normal1',
-                'linux-name': 'printer-sx235w',
-                'prnfiles': 'sx235w'},
-    'SX235W-HR': {'pmgmt': 1440,
-                'vert': 1440,
-                'hor': 5760,
-                'm': 5760,
-                'nozzles': 30,
-                'black': b'\x00',
-                'black2' : b'\x05',
-                'black3' : b'\x06',
-                'magenta' : b'\x01',
-                'cyan' : b'\x02',
-                'yellow' : b'\x04',
-                'd': 'VSD2',
-                'pmid': 'Highres',
-                'linux-name': 'printer-sx235w',
-                'prnfiles': 'sx235w-highres'},
-    'DX6050': {'pmgmt': 720,
-                'vert': 720,
-                'hor': 720,
-                'm': 2880,
-                'nozzles': 90,
-                'black': b'\x00',
-                'd': 'Economy',
-                'pmid': 'None',
-                'linux-name': 'printer-dx6050',
-                'prnfiles': 'dx6050'},
-    'manual': {'pmgmt': 0,
-                'vert': 0,
-                'hor': 0,
-                'm': 0,
-                'nozzles': 0,
-                'black': b'',
-                'black2': b'',
-                'black3': b'',
-                'magenta': b'',
-                'cyan': b'',
-                'yellow': b'',
-                'd': 'Economy',
-                'pmid': 'None',
-                'linux-name': 'manual',
-                'prnfiles': 'manual'
-               } }
-
-
-
-
+# pmidOpt, dotOpt, printersParDict and colorNames are defined in DoD/patterns.py
 
 
 # =========================
@@ -164,89 +78,27 @@ printersParDict = {
 # =========================
 
 def p1_small(**kwargs):
-    nozzlelist = createnozzlelist(29, 1, 0, fan)
-    rasterdata = ESC_v(pmgmt, y) + ESC_dollar(hor, x) + ESC_i_nrs(nozzlelist, color, 1) + b'\x0c'
-    return rasterdata
+    return dod_patterns.p1_small(params)
 
 
 def p1_med(**kwargs):
-    nozzlelist = createnozzlelist(29, 1, 0, fan)
-    rasterdata = ESC_v(pmgmt, y) + ESC_dollar(hor, x) + ESC_i_nrs(nozzlelist, color, 2) + b'\x0c'
-    return rasterdata
+    return dod_patterns.p1_med(params)
 
 
 def p1_large(**kwargs):
-    nozzlelist = createnozzlelist(29, 1, 0, fan)
-    rasterdata = ESC_v(pmgmt, y) + ESC_dollar(hor, x) + ESC_i_nrs(nozzlelist, color, 3) + b'\x0c'
-    return rasterdata
+    return dod_patterns.p1_large(params)
 
 
 def p_all_nozzles(**kwargs):
-    nozzlelist = createnozzlelist(nozzles, 5, dy, 1)
-    size1 = 3
-    size2 = 2
-    size3 = 1
-    x1 = x
-    x2 = x1 + rdx
-    x3 = x2 + rdx
-    # y = y
-    raster1 = b''
-    for k in range(5):
-        raster1 += ESC_dollar(hor, (x1 + dx * k)) + ESC_i_nrs(nozzlelist, black, size1) + \
-                   ESC_dollar(hor, (x1 + (dx * 6) + dx * k)) + ESC_i_nrs(nozzlelist, cyan, size1) + \
-                   ESC_dollar(hor, (x1 + (dx * 12) + dx * k)) + ESC_i_nrs(nozzlelist, magenta, size1) + \
-                   ESC_dollar(hor, (x1 + (dx * 18) + dx * k)) + ESC_i_nrs(nozzlelist, yellow, size1)
-    raster2 = b''
-    for k in range(5):
-        raster2 += ESC_dollar(hor, x2 + dx*k) + ESC_i_nrs(nozzlelist, black, size2) + \
-                   ESC_dollar(hor, x2 + (dx*6) + dx*k) + ESC_i_nrs(nozzlelist, cyan, size2) + \
-                   ESC_dollar(hor, x2 + (dx*12) + dx*k) + ESC_i_nrs(nozzlelist, magenta, size2) + \
-                   ESC_dollar(hor, x2 + (dx*18) + dx*k) + ESC_i_nrs(nozzlelist, yellow, size2)
-        print(k)
-    raster3 = b''
-    for k in range(5):
-        raster3 += ESC_dollar(hor, x3 + dx * k) + ESC_i_nrs(nozzlelist, black, size3) + \
-                   ESC_dollar(hor, x3 + (dx * 6) + dx * k) + ESC_i_nrs(nozzlelist, cyan, size3) + \
-                   ESC_dollar(hor, x3 + (dx * 12) + dx * k) + ESC_i_nrs(nozzlelist, magenta, size3) + \
-                   ESC_dollar(hor, x3 + (dx * 18) + dx * k) + ESC_i_nrs(nozzlelist, yellow, size3)
-    rasterdata = ESC_v(pmgmt, y) + (raster1 + raster2 + raster3) * rep + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_all_nozzles(params)
 
 
 def p1_10_drops(**kwargs):
-    nozzlelist = createnozzlelist(nozzles, m, dy, fan)
-    raster = b''
-    for k in range(10):
-        raster += ESC_dollar(hor, x) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(9):
-        raster += ESC_dollar(hor, x + dx) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(8):
-        raster += ESC_dollar(hor, x + dx * 2) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(7):
-        raster += ESC_dollar(hor, x + dx * 3) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(6):
-        raster += ESC_dollar(hor, x + dx * 4) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(5):
-        raster += ESC_dollar(hor, x + dx * 5) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(4):
-        raster += ESC_dollar(hor, x + dx * 6) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(3):
-        raster += ESC_dollar(hor, x + dx * 7) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(2):
-        raster += ESC_dollar(hor, x + dx * 8) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(1):
-        raster += ESC_dollar(hor, x + dx * 9) + ESC_i_nrs(nozzlelist, color, size)
-    rasterdata = ESC_v(pmgmt, y) + raster + b'\x0c'
-    return rasterdata
+    return dod_patterns.p1_10_drops(params)
 
 
 def p_raster_nxm(**kwargs):
-    nozzlelist = createnozzlelist(nozzles, m, dy, fan)
-    raster = b''
-    for k in range(n):
-        raster += (ESC_dollar(hor, (x + dx * k)) + ESC_i_nrs(nozzlelist, color, size)) * rep
-    rasterdata = ESC_v(pmgmt, y) + raster + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_raster_nxm(params)
 
 def p_raster_nxm_diag(**kwargs): # Abel addition to draw lines
     global stepper_enable
@@ -266,112 +118,43 @@ def p_raster_nxm_diag(**kwargs): # Abel addition to draw lines
     return rasterdata
 
 def p_logo_pme_small(**kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    rasterdata = ESC_v(pmgmt, y) + (createPs(x, size=size, pmgmt=pmgmt, hor=hor, vert=vert, r=color) +
-                                    createMs(x + 4 * dx, size=size, pmgmt=pmgmt, hor=hor, vert=vert, r=color) +
-                                    createEs(x + 8 * dx, size=size, pmgmt=pmgmt, hor=hor, vert=vert, r=color))*rep + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_logo_pme_small(params)
 
 
 def p_logo_pme(**kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    rasterdata = ESC_v(pmgmt, y) + (createP(x, size=size, fn=fan, pmgmt=pmgmt, hor=hor, vert=vert, r=color) +
-                                    createM(x + 6 * dx, size=size, fn=fan, pmgmt=pmgmt, hor=hor, vert=vert, r=color) +
-                                    createE(x + 12 * dx, size=size, fn=fan, pmgmt=pmgmt, hor=hor, vert=vert, r=color))*rep + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_logo_pme(params)
 
 
 def p_logo_pme_mne(**kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    size1 = 3
-    size2 = 1
-    rasterdata = ESC_v(pmgmt, y) + (createP(x=x, r=color, size=size1, fn=fan, pmgmt=pmgmt, hor=hor, vert=vert) +
-            createM(x=(x + 6 * dx), r=color, size=size1, fn=fan, pmgmt=pmgmt, hor=hor, vert=vert) +
-            createE(x=(x + 12 * dx), r=color, size=size1, fn=fan, pmgmt=pmgmt, hor=hor,vert=vert) +
-            createM(x=(x + dx * 20), r=color, size=size2, fn=fan, pmgmt=pmgmt, hor=hor,vert=vert) +
-            createN(x=(x + 26 * dx), r=color, size=size2, fn=fan, pmgmt=pmgmt, hor=hor,vert=vert) +
-            createE(x=(x + 32 * dx), r=color, size=size2, fn=fan, pmgmt=pmgmt, hor=hor,vert=vert))*rep + b'\x0c'
-
-    return rasterdata
+    return dod_patterns.p_logo_pme_mne(params)
 
 
 def p_logo_TUPME(**kwargs):
-    rasterdata = printTUPME(x, y, size, color, rep, pmgmt=pmgmt, hor=hor, vert=vert)
-    return rasterdata
+    return dod_patterns.p_logo_TUPME(params)
 
 
 def p_logo_TUDelft(**kwargs):
-    matrix = loadlogo(2)
-    rasterdata = ESC_v(pmgmt, y) + (printLOGO(matrix, x, y, size, color, pmgmt=pmgmt, hor=hor, vert=vert)) * rep + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_logo_TUDelft(params)
 
 
 def p_logo_P(**kwargs):
-    matrix = loadlogo(3)
-    rasterdata = ESC_v(pmgmt, y) + (printLOGO(matrix, x, y, size, color, pmgmt=pmgmt, hor=hor, vert=vert)) * rep + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_logo_P(params)
 
 
 def p_nxm_sml(**kwargs):
-    nozzlelist = createnozzlelist(nozzles, m, dy, fan)
-    # dx = 1/120
-    raster1 = b''
-    raster2 = b''
-    raster3 = b''
-
-    for k in range(n):
-        raster1 += (ESC_dollar(hor, x + dx * k) + ESC_i_nrs(nozzlelist, color, 3)) * rep
-        raster2 += (ESC_dollar(hor, x + rdx + dx * k) + ESC_i_nrs(nozzlelist, color, 2)) * rep
-        raster3 += (ESC_dollar(hor, x + rdx * 2 + dx * k) + ESC_i_nrs(nozzlelist, color, 1)) * rep
-    rasterdata = ESC_v(pmgmt, y) + raster1 + raster2 + raster3 + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_nxm_sml(params)
 
 
 def p_raster_90x90(**kwargs):
-    nozzlelist = createnozzlelist(nozzles, 30, 0, 0)
-    # dx = um_in(200)
-    # size = int(input('size [1/2/3]: '))
-    raster1 = b''
-    raster2 = b''
-    raster3 = b''
-    for k in range(90):
-        raster1 += (ESC_dollar(hor, x + dx * k) + ESC_i_nrs(nozzlelist, black, size)) * rep
-        raster2 += (ESC_dollar(hor, x + dx * k) + ESC_i_nrs(nozzlelist, black2, size)) * rep
-        raster3 += (ESC_dollar(hor, x + dx * k) + ESC_i_nrs(nozzlelist, black3, size)) * rep
-    rasterdata = ESC_v(pmgmt, y) + raster1 + raster2 + raster3 + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_raster_90x90(params)
 
 
 def p_1_100_drops(**kwargs):
-    nozzlelist = createnozzlelist(nozzles, n, dy, fan)
-    raster = b''
-    for k in range(100):
-        raster += ESC_dollar(hor, x) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(80):
-        raster += ESC_dollar(hor, x + dx) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(60):
-        raster += ESC_dollar(hor, x + dx * 2) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(40):
-        raster += ESC_dollar(hor, x + dx * 3) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(20):
-        raster += ESC_dollar(hor, x + dx * 4) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(10):
-        raster += ESC_dollar(hor, x + dx * 5) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(5):
-        raster += ESC_dollar(hor, x + dx * 6) + ESC_i_nrs(nozzlelist, color, size)
-    for k in range(1):
-        raster += ESC_dollar(hor, x + dx * 4) + ESC_i_nrs(nozzlelist, color, size)
-    rasterdata = ESC_v(pmgmt, y) + raster + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_1_100_drops(params)
 
 
 def p_logo_TU_fast(**kwargs):
-    # stretch = int(input('horizontal stretch between dots (def=3): '))
-    rasterdata = ESC_v(pmgmt, y) + ESC_dollar(hor, x) + ESC_i_matrix(color, load_logo_fast(), stretch, size, fan) + b'\x0c'
-    return rasterdata
+    return dod_patterns.p_logo_TU_fast(params)
 
 
 
@@ -383,427 +166,6 @@ def p_logo_TU_fast(**kwargs):
 # =============================
 
 
-def createPs(x, r=b'\x00', size=1, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5])
-    list2 = createnozzlelistsp(29, [1, 3])
-    list3 = createnozzlelistsp(29, [1, 2, 3])
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createMs(x, size=1, r=b'\x00', **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5])
-    list2 = createnozzlelistsp(29, [2])
-    list3 = createnozzlelistsp(29, [1, 2, 3, 4, 5])
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createEs(x, r=b'\x00', size=1, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5])
-    list2 = createnozzlelistsp(29, [1, 3, 5])
-    list3 = createnozzlelistsp(29, [1, 5])
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createP(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list2 = createnozzlelistsp(29, [1, 4], fn)
-    list3 = list2
-    list4 = list2
-    list5 = createnozzlelistsp(29, [2, 3], fn)
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createE(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list2 = createnozzlelistsp(29, [1, 4, 7], fn)
-    list3 = list2
-    list4 = list2
-    list5 = createnozzlelistsp(29, [1, 7], fn)
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createM(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list2 = createnozzlelistsp(29, [2], fn)
-    list3 = createnozzlelistsp(29, [3, 4], fn)
-    list4 = list2
-    list5 = list1
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createN(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list2 = createnozzlelistsp(29, [3], fn)
-    list3 = createnozzlelistsp(29, [4], fn)
-    list4 = createnozzlelistsp(29, [5], fn)
-    list5 = list1
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createD(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list2 = createnozzlelistsp(29, [1, 7], fn)
-    list3 = list2
-    list4 = list2
-    list5 = createnozzlelistsp(29, [2, 3, 4, 5, 6], fn)
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createL(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list2 = createnozzlelistsp(29, [7], fn)
-    list3 = list2
-    list4 = list2
-    list5 = list2
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createF(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list2 = createnozzlelistsp(29, [1, 4], fn)
-    list3 = list2
-    list4 = list2
-    list5 = createnozzlelistsp(29, [1], fn)
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createT(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1], fn)
-    list2 = list1
-    list3 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6, 7], fn)
-    list4 = list1
-    list5 = list1
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def createU(x, r=b'\x00', size=1, fn=0, **kwargs):
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    hor = 5760
-
-    list1 = createnozzlelistsp(29, [1, 2, 3, 4, 5, 6], fn)
-    list2 = createnozzlelistsp(29, [7], fn)
-    list3 = list2
-    list4 = list2
-    list5 = list1
-    m = len(list1)
-    prefix = b'\x1b' + str_hex('i')  # ESC i
-    c = b'\x01'  # COMPRESSED
-    b = b'\x02'
-    n = 1
-    nL = dec_hex(n % 256)
-    nH = dec_hex(n / 256)
-    mL = dec_hex(m % 256)
-    mH = dec_hex(m / 256)
-
-    image = ESC_dollar(hor, x) + ESC_i_nrs(list1, r, size) + \
-            ESC_dollar(hor, x + dx) + ESC_i_nrs(list2, r,size) + \
-            ESC_dollar(hor,x + 2 * dx) + ESC_i_nrs(list3, r, size) + \
-            ESC_dollar(hor, x + 3 * dx) + ESC_i_nrs(list4, r, size) + \
-            ESC_dollar(hor,x + 4 * dx) + ESC_i_nrs(list5, r, size)
-
-    # suffix1 = b'\x0d' #b'\x0d\x0c'
-    total = image
-
-    return total
-
-
-def printTUDELFT(x=5, y=3, size=3, **kwargs):
-    pmgmt = 720
-    hor = 5760
-    vert = 720
-    black = b'\x00'
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    size1 = size
-    size2 = size
-
-    rasterdata = ESC_v(pmgmt, y) + \
-                 createT(x, black, size1) + \
-                 createU(x + 6 * dx, black, size1) + \
-                 createD(x + 18 * dx,black,size1) + \
-                 createE(x + dx * 24, black, size2) + \
-                 createL(x + 30 * dx, black, size2) + \
-                 createF(x + 36 * dx, black, size2) + \
-                 createT(x + 42 * dx, black, size2) + b'\x0c'
-    return rasterdata
-
-
-def printTUPME(x=5, y=3, size=3, color=b'\x00', rep=1, **kwargs):
-    pmgmt = 720
-    hor = 5760
-    vert = 720
-    black = color
-    dy = 0
-    dx = (dy + 1) * (1 / 120)
-    size1 = size
-    size2 = size
-
-    rasterdata1 = createT(x, black, size1) + \
-                  createU(x + 6 * dx, black, size1) + \
-                  createD(x + 18 * dx, black, size1) + \
-                  createE(x + dx * 24, black, size1) + \
-                  createL(x + 30 * dx, black, size1) + \
-                  createF(x + 36 * dx, black, size1) + \
-                  createT(x + 42 * dx, black, size1)
-    rasterdata2 = createP(x, black, size1, 10) + \
-                  createM(x + 6 * dx, black, size1, 10) + \
-                  createE(x + 12 * dx, black, size1, 10) + \
-                  createM(x + dx * 20, black, size2, 10) + \
-                  createN(x + 26 * dx, black, size2, 10) + \
-                  createE(x + 32 * dx, black, size2, 10)
-
-    rasterdata = ESC_v(pmgmt, y) + (rasterdata1 + rasterdata2)*rep + b'\x0c'
-    return rasterdata
-
-
 def printLOGO(matrix, x=5.5, y=3, size=3, r=b'\x00', **kwargs):
     pmgmt = 720
     hor = 5760
@@ -1773,6 +1135,7 @@ def get_values(event=None):
     global pmgmt, vert, hor, mm, nozzles, d, pmid, umode
     global black, black2, black3, yellow, magenta, cyan, color
     global prnname, linux_name
+    global params
 
     x = patternDict['posx'][1].get()/(2.54*10000) if patternDict['posx'][0] else 5
     y = patternDict['posy'][1].get()/2.54 if patternDict['posy'][0] else 3
@@ -1824,6 +1187,15 @@ def get_values(event=None):
     except:
         tk.messagebox.showerror("Color Error", "Selected color is (maybe) not set up, try default color 'black'. ")
 
+    # the same values as one object, for the functions in DoD/patterns.py
+    params = PatternParams(x=x, y=y, dx=dx, dy=dy, rdx=rdx, n=n, m=m, size=size, fan=fan, rep=rep,
+                           stretch=stretch, pmgmt=pmgmt, vert=vert, hor=hor, mm=mm, nozzles=nozzles,
+                           d=d, pmid=pmid, umode=umode, prnname=prnname,
+                           color=printerDict.get(colorSelection.get(), b''),
+                           black=printerDict.get('black', b''), black2=printerDict.get('black2', b''),
+                           black3=printerDict.get('black3', b''), magenta=printerDict.get('magenta', b''),
+                           cyan=printerDict.get('cyan', b''), yellow=printerDict.get('yellow', b''))
+
     print("Values geGet")
 
 
@@ -1835,9 +1207,7 @@ def run_program(event=None):
     header = load_prn_file('DoD/prns/' + prnname + '/' + prnname + '-header.prn')
     footer = load_prn_file('DoD/prns/' + prnname + '/' + prnname + '-footer.prn')
 
-    body = ESC_Graph() + ESC_Units(pmgmt, vert, hor, mm) + ESC_Kmode() + \
-           ESC_imode() + ESC_Umode(umode) + ESC_edot(d) + ESC_Dras() + \
-           ESC_C(pmgmt) + ESC_c(pmgmt) + ESC_S(pmgmt) + ESC_m(pmid)
+    body = job_body(params)
 
 
     try:
@@ -1940,25 +1310,18 @@ def parse_escp2(event=None):
     if option == "ghex":
         os.system("ghex "+path)
     else:
-        if option == "None":
-            popt=""
-        elif option == "V":
-            popt="-V "
-        elif option == "v":
-            popt="-v "
-        else:
-            popt=""
-
-        os.system("perl "+current_dir+"/gutenprint/parse-escp2 "+popt+path+" > "+current_dir+"/output/parse.txt")
+        # "V" shows the complete raster data, other options cut it off
+        with open(path, 'rb') as f:
+            table = escp2_table(f.read(), full=(option == "V"))
+        with open(current_dir+"/output/parse.txt", 'w') as f:
+            f.write(table)
         os.system("xdg-open "+current_dir+"/output/parse.txt")
-    # print(subprocess.check_output(["perl", "~/bep/gutenprint5/test/parse-escp2", path]))
 
 
 def unprint_escp2(event=None):
     save_temp()
-    os.system("~/gutenprint/test/unprint " + path + " " + current_dir+"/output/temp.pnm")
-    os.system("xdg-open " + current_dir+"/output/temp.pnm")
-    # print(subprocess.check_output(["~/bep/gutenprint5/test/unprint", path]))
+    unprint_file(path, current_dir+"/output/temp.png")
+    os.system("xdg-open " + current_dir+"/output/temp.png")
 
 
 def open_help_pdf(event=None):
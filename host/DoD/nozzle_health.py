@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+"""
+Nozzle health map
+
+Per printer a text file prns/<prnname>/<prnname>-nozzles.txt lists the working (1) and dead (0)
+nozzles of every nozzle row (color byte as hex), nozzle 1 first:
+
+    # nozzle health sx235w
+    00 111111111111111111111111111111
+    05 111111111111011111111111111111
+
+Nozzle rows that are not in the file, or printers without a file, have all nozzles working.
+The swath planner and the G-code generator leave the dots of dead nozzles out of the normal pass
+and print them in extra passes, with the paper (or stage) shifted a whole number of nozzles so a
+working nozzle lands on the missed row.
+
+    python3 -m DoD.nozzle_health sx235w 00 --dead 14 15
+"""
+
+## ==== IMPORT MODULES ====
+import os
+import argparse
+
+import numpy as np
+
+
+prns_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prns')
+
+# memoized health maps: prnname -> (modification time, {r: alive})
+_health_cache = {}
+
+
+## ==== FUNCTIONS ====
+
+def health_path(prnname):
+    return os.path.join(prns_dir, prnname, prnname + '-nozzles.txt')
+
+
+## read the health map of a printer, {color byte: bool array, True is working}
+def load_health(prnname):
+    """
+    Returns an empty dict if the printer has no health file. The file is read again only
+    when it changed.
+    """
+    path = health_path(prnname)
+    if not os.path.exists(path):
+        return {}
+    mtime = os.path.getmtime(path)
+    if prnname in _health_cache and _health_cache[prnname][0] == mtime:
+        return _health_cache[prnname][1]
+
+    health = {}
+    with open(path) as f:
+        for line in f:
+            line = line.split('#')[0].split()
+            if len(line) != 2:
+                continue
+            health[bytes.fromhex(line[0])] = np.array([c == '1' for c in line[1]], dtype=bool)
+    _health_cache[prnname] = (mtime, health)
+    return health
+
+
+# end
+
+
+## write the health map of a printer
+def save_health(prnname, health):
+    with open(health_path(prnname), 'w') as f:
+        f.write('# nozzle health %s, 1 = working, 0 = dead, nozzle 1 first\n' % prnname)
+        for r in sorted(health):
+            f.write('%s %s\n' % (r.hex(), ''.join('1' if a else '0' for a in health[r])))
+
+
+# end
+
+
+## mark nozzles of one nozzle row as dead (or working again)
+def set_nozzles(prnname, r, nozzles, numbers, alive=False):
+    """
+    nozzles:    number of nozzles in the row
+    numbers:    nozzle numbers, nozzle 1 first
+    """
+    health = dict(load_health(prnname))
+    row = health.get(r, np.ones(nozzles, dtype=bool)).copy()
+    for k in numbers:
+        row[k - 1] = alive
+    health[r] = row
+    save_health(prnname, health)
+    return health
+
+
+# end
+
+
+## working nozzles of one nozzle row, None if all nozzles work
+def alive_nozzles(health, r, nozzles):
+    if r not in health:
+        return None
+    # nozzles missing in the file work
+    alive = np.ones(nozzles, dtype=bool)
+    known = min(nozzles, health[r].size)
+    alive[:known] = health[r][:known]
+    if alive.all():
+        return None
+    return alive
+
+
+# end
+
+
+## paper shifts (in nozzles) that let working nozzles print the rows of the dead nozzles
+def nozzle_shifts(alive):
+    """
+    With the paper shifted s nozzles, nozzle (i - s) mod N prints the row of nozzle i.
+    Returns a list of (s, dead nozzles covered by that shift), the smallest shifts first.
+    Dead nozzles that cannot be covered (all nozzles dead) are left out.
+    """
+    n = alive.size
+    remaining = np.flatnonzero(~alive)
+    shifts = []
+    for s in range(1, n):
+        if remaining.size == 0:
+            break
+        covered = alive[(remaining - s) % n]
+        if covered.any():
+            shifts.append((s, remaining[covered]))
+            remaining = remaining[~covered]
+    return shifts
+
+
+# end
+
+
+## split droplets in the normal pass and the extra passes for dead nozzles
+def nozzle_passes(drops, alive):
+    """
+    drops:  (rows, columns) droplet sizes, row k is printed by nozzle k mod N
+    alive:  bool array of N nozzles, or None
+    Returns a list of (shift, droplets of that pass), the normal pass has shift 0.
+    Rows of the pass with shift s are printed in bands starting at s + k * N.
+    """
+    if alive is None:
+        return [(0, drops)]
+    nozzle = np.arange(drops.shape[0]) % alive.size
+    passes = [(0, drops * alive[nozzle][:, None])]
+    for shift, dead in nozzle_shifts(alive):
+        passes.append((shift, drops * np.isin(nozzle, dead)[:, None]))
+    return passes
+
+
+# end
+
+
+## bands of one pass: (first row, band droplets), bands may start above row 0
+def pass_bands(drops, shift, nozzles):
+    start = shift % nozzles
+    if start:
+        start -= nozzles
+    for row in range(start, drops.shape[0], nozzles):
+        band = drops[max(row, 0):row + nozzles]
+        if row < 0:
+            band = np.concatenate((np.zeros((-row, drops.shape[1]), dtype=drops.dtype), band))
+        yield row, band
+
+
+# end
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show or edit the nozzle health map of a printer')
+    parser.add_argument('prnname', help='printer folder in prns, e.g. sx235w')
+    parser.add_argument('color', nargs='?', help='color byte as hex, e.g. 00')
+    parser.add_argument('-n', '--nozzles', type=int, default=30, help='nozzles in the row')
+    parser.add_argument('--dead', type=int, nargs='*', default=[], help='nozzle numbers that are dead')
+    parser.add_argument('--alive', type=int, nargs='*', default=[], help='nozzle numbers that work again')
+    args = parser.parse_args(argv)
+
+    if args.color:
+        r = bytes.fromhex(args.color)
+        if args.dead:
+            set_nozzles(args.prnname, r, args.nozzles, args.dead, False)
+        if args.alive:
+            set_nozzles(args.prnname, r, args.nozzles, args.alive, True)
+    for r, alive in sorted(load_health(args.prnname).items()):
+        print('%s %s dead: %s' % (r.hex(), ''.join('1' if a else '0' for a in alive),
+                                  list(np.flatnonzero(~alive) + 1)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,490 @@
+#!/usr/bin/python3
+"""
+Headless pattern generation for ESC/P2 printer files
+
+All pattern functions take a frozen PatternParams object and return the ESC/P2 raster data,
+nothing is read from the GUI. Jobs can be generated in batch, in parallel or without a display.
+
+Example use:
+
+    p = pattern_params('SX235W', posx=166000, posy=8, n=10, m=4, size=2)
+    data = generate_job(p, 'nxm raster')
+
+From the command line, one file per combination of the swept values:
+
+    python3 -m DoD.patterns -p SX235W -t "nxm raster" -s size=1,2,3 -s dx=250,500 -o DoD/output/sweep
+"""
+
+## ==== IMPORT MODULES ====
+import os
+import argparse
+import itertools
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+
+from DoD.esc_functions import *
+from DoD.hex_functions import *
+from DoD.logos import loadlogo, load_logo_fast
+from DoD.swath import columns_escp2, columns_swaths, swaths_escp2
+from DoD.nozzle_health import load_health
+from DoD.text import text_swaths
+
+
+## ==== DICTIONARIES ====
+
+# PRINT METHODS IDs
+pmidOpt = {
+    'None' : b'',
+    'Normal2' : b'\x21',
+    'Normal1' : b'\x20',
+    'Highres' : b'\xc0'
+}
+
+# DOT QUALITY OPTIONS
+dotOpt = {
+    'Economy' : b'\x10',
+    'VSD1' : b'\x11',
+    'VSD2' : b'\x12',
+    'VSD3' : b'\x13'
+}
+
+# PRINTER MODELS + SPECS
+printersParDict = {
+    'SX600FW' : {'pmgmt' : 720,
+                'vert': 720,
+                'hor': 5760,
+                'm': 5760,
+                'nozzles' : 128,
+                'black' : b'\x60',
+                'd' : 'VSD2',
+                'pmid' : 'Normal2',
+                'linux-name': 'printer-sx600fw',
+                'prnfiles' :'sx600fw'},
+    'SX235W': {'pmgmt': 720,
+                'vert': 720,
+                'hor': 5760,
+                'm': 5760,
+                'nozzles': 30,
+                'black': b'\x00',
+                'black2' : b'\x05',
+                'black3' : b'\x06',
+                'magenta' : b'\x01',
+                'cyan' : b'\x02',
+                'yellow' : b'\x04',
+                'd': 'VSD2',
+                'pmid': 'Normal1',
+                'linux-name': 'printer-sx235w',
+                'prnfiles': 'sx235w'},
+    'SX235W-HR': {'pmgmt': 1440,
+                'vert': 1440,
+                'hor': 5760,
+                'm': 5760,
+                'nozzles': 30,
+                'black': b'\x00',
+                'black2' : b'\x05',
+                'black3' : b'\x06',
+                'magenta' : b'\x01',
+                'cyan' : b'\x02',
+                'yellow' : b'\x04',
+                'd': 'VSD2',
+                'pmid': 'Highres',
+                'linux-name': 'printer-sx235w',
+                'prnfiles': 'sx235w-highres'},
+    'DX6050': {'pmgmt': 720,
+                'vert': 720,
+                'hor': 720,
+                'm': 2880,
+                'nozzles': 90,
+                'black': b'\x00',
+                'd': 'Economy',
+                'pmid': 'None',
+                'linux-name': 'printer-dx6050',
+                'prnfiles': 'dx6050'},
+    'manual': {'pmgmt': 0,
+                'vert': 0,
+                'hor': 0,
+                'm': 0,
+                'nozzles': 0,
+                'black': b'',
+                'black2': b'',
+                'black3': b'',
+                'magenta': b'',
+                'cyan': b'',
+                'yellow': b'',
+                'd': 'Economy',
+                'pmid': 'None',
+                'linux-name': 'manual',
+                'prnfiles': 'manual'
+               } }
+
+colorNames = ['black', 'black2', 'black3', 'magenta', 'cyan', 'yellow']
+
+prns_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prns')
+
+
+## ==== PARAMETERS ====
+
+@dataclass(frozen=True)
+class PatternParams():
+    """
+    All values a pattern function needs, in the units the ESC functions use
+    (positions and spacings in inch), the same values get_values() in main_gui.py sets.
+    Use pattern_params() to create one from GUI units and a printer profile.
+    """
+    # pattern
+    x: float = 5
+    y: float = 3
+    dx: float = 250 / 25400
+    dy: int = 0
+    rdx: float = 5000 / 25400
+    n: int = 1
+    m: int = 1
+    size: int = 1
+    fan: int = 0
+    rep: int = 1
+    stretch: int = 0
+
+    # printer
+    pmgmt: int = 720
+    vert: int = 720
+    hor: int = 5760
+    mm: int = 5760
+    nozzles: int = 30
+    d: bytes = b'\x12'
+    pmid: bytes = b'\x20'
+    umode: bytes = b'\x01'
+    prnname: str = 'sx235w'
+
+    # nozzle rows
+    color: bytes = b'\x00'
+    black: bytes = b'\x00'
+    black2: bytes = b''
+    black3: bytes = b''
+    magenta: bytes = b''
+    cyan: bytes = b''
+    yellow: bytes = b''
+
+
+## create pattern parameters from GUI units and a printer profile
+def pattern_params(printer='SX235W', color='black', posx=127000, posy=7.62, dx=250, rdx=5000, umode=1,
+                   **values):
+    """
+    printer:    key of printersParDict
+    color:      name of the nozzle row, see colorNames
+    posx, dx, rdx in micrometer, posy in cm, as entered in the GUI
+    umode:      1 is unidirectional, 0 bidirectional
+    values:     any other PatternParams field, e.g. n=10, m=4, size=2 or pmgmt=1440
+    """
+    profile = printersParDict[printer]
+    rows = dict((name, profile.get(name, b'')) for name in colorNames)
+    if color not in rows:
+        raise ValueError("Color '%s' is not set up for printer %s" % (color, printer))
+
+    settings = dict(x=posx / 25400, y=posy / 2.54, dx=um_in(dx), rdx=um_in(rdx),
+                    pmgmt=profile['pmgmt'], vert=profile['vert'], hor=profile['hor'], mm=profile['m'],
+                    nozzles=profile['nozzles'], d=dotOpt[profile['d']], pmid=pmidOpt[profile['pmid']],
+                    umode=b'\x01' if umode == 1 else b'\x00', prnname=profile['prnfiles'],
+                    color=rows[color], **rows)
+    settings.update(values)
+    return PatternParams(**settings)
+
+
+# end
+
+
+## ==== PATTERN FUNCTIONS ====
+
+def p1_small(p):
+    nozzlelist = createnozzlelist(29, 1, 0, p.fan)
+    rasterdata = ESC_v(p.pmgmt, p.y) + ESC_dollar(p.hor, p.x) + ESC_i_nrs(nozzlelist, p.color, 1) + b'\x0c'
+    return rasterdata
+
+
+def p1_med(p):
+    nozzlelist = createnozzlelist(29, 1, 0, p.fan)
+    rasterdata = ESC_v(p.pmgmt, p.y) + ESC_dollar(p.hor, p.x) + ESC_i_nrs(nozzlelist, p.color, 2) + b'\x0c'
+    return rasterdata
+
+
+def p1_large(p):
+    nozzlelist = createnozzlelist(29, 1, 0, p.fan)
+    rasterdata = ESC_v(p.pmgmt, p.y) + ESC_dollar(p.hor, p.x) + ESC_i_nrs(nozzlelist, p.color, 3) + b'\x0c'
+    return rasterdata
+
+
+def p_all_nozzles(p):
+    nozzlelist = createnozzlelist(p.nozzles, 5, p.dy, 1)
+    hor, dx = p.hor, p.dx
+    x1 = p.x
+    x2 = x1 + p.rdx
+    x3 = x2 + p.rdx
+    raster = []
+    # large, medium and small drops, 5 columns per nozzle row
+    for xs, size in [(x1, 3), (x2, 2), (x3, 1)]:
+        for k in range(5):
+            raster += [ESC_dollar(hor, (xs + dx * k)), ESC_i_nrs(nozzlelist, p.black, size),
+                       ESC_dollar(hor, (xs + (dx * 6) + dx * k)), ESC_i_nrs(nozzlelist, p.cyan, size),
+                       ESC_dollar(hor, (xs + (dx * 12) + dx * k)), ESC_i_nrs(nozzlelist, p.magenta, size),
+                       ESC_dollar(hor, (xs + (dx * 18) + dx * k)), ESC_i_nrs(nozzlelist, p.yellow, size)]
+    rasterdata = ESC_v(p.pmgmt, p.y) + b''.join(raster) * p.rep + b'\x0c'
+    return rasterdata
+
+
+def p1_10_drops(p):
+    nozzlelist = createnozzlelist(p.nozzles, p.m, p.dy, p.fan)
+    raster = []
+    for k in range(10):
+        raster.append((ESC_dollar(p.hor, p.x + p.dx * k) + ESC_i_nrs(nozzlelist, p.color, p.size)) * (10 - k))
+    rasterdata = ESC_v(p.pmgmt, p.y) + b''.join(raster) + b'\x0c'
+    return rasterdata
+
+
+def p_raster_nxm(p):
+    nozzlelist = createnozzlelist(p.nozzles, p.m, p.dy, p.fan)
+    columns = [(p.x + p.dx * k, nozzlelist, p.size) for k in range(p.n)]
+    rasterdata = columns_escp2(columns, p.color, p.nozzles, p.y, p.pmgmt, p.hor, p.rep, load_health(p.prnname)) + \
+                 b'\x0c'
+    return rasterdata
+
+
+def p_nxm_sml(p):
+    nozzlelist = createnozzlelist(p.nozzles, p.m, p.dy, p.fan)
+    swaths = []
+    for xs, size in [(p.x, 3), (p.x + p.rdx, 2), (p.x + p.rdx * 2, 1)]:
+        columns = [(xs + p.dx * k, nozzlelist, size) for k in range(p.n)]
+        swaths += columns_swaths(columns, p.color, p.nozzles, p.hor, load_health(p.prnname))
+    rasterdata = swaths_escp2(swaths, p.y, p.pmgmt, p.hor, p.rep) + b'\x0c'
+    return rasterdata
+
+
+def p_raster_90x90(p):
+    nozzlelist = createnozzlelist(p.nozzles, 30, 0, 0)
+    columns = [(p.x + p.dx * k, nozzlelist, p.size) for k in range(90)]
+    swaths = []
+    for r in [p.black, p.black2, p.black3]:
+        swaths += columns_swaths(columns, r, p.nozzles, p.hor, load_health(p.prnname))
+    rasterdata = swaths_escp2(swaths, p.y, p.pmgmt, p.hor, p.rep) + b'\x0c'
+    return rasterdata
+
+
+def p_1_100_drops(p):
+    nozzlelist = createnozzlelist(p.nozzles, p.n, p.dy, p.fan)
+    raster = []
+    # (column, number of drops)
+    for k, drops in [(0, 100), (1, 80), (2, 60), (3, 40), (4, 20), (5, 10), (6, 5), (4, 1)]:
+        raster.append((ESC_dollar(p.hor, p.x + p.dx * k) + ESC_i_nrs(nozzlelist, p.color, p.size)) * drops)
+    rasterdata = ESC_v(p.pmgmt, p.y) + b''.join(raster) + b'\x0c'
+    return rasterdata
+
+
+def p_logo_TUDelft(p):
+    matrix = loadlogo(2)
+    rasterdata = print_logo(matrix, p.x, p.y, p.size, p.color, p.pmgmt, p.hor, p.rep, load_health(p.prnname)) + \
+                 b'\x0c'
+    return rasterdata
+
+
+def p_logo_P(p):
+    matrix = loadlogo(3)
+    rasterdata = print_logo(matrix, p.x, p.y, p.size, p.color, p.pmgmt, p.hor, p.rep, load_health(p.prnname)) + \
+                 b'\x0c'
+    return rasterdata
+
+
+def p_logo_TU_fast(p):
+    rasterdata = ESC_v(p.pmgmt, p.y) + ESC_dollar(p.hor, p.x) + \
+                 ESC_i_matrix(p.color, load_logo_fast(), p.stretch, p.size, p.fan) + b'\x0c'
+    return rasterdata
+
+
+def p_logo_pme_small(p):
+    swaths = text_swaths('PME', p.x, p.color, p.nozzles, p.size, 'small', hor=p.hor, health=load_health(p.prnname))
+    return swaths_escp2(swaths, p.y, p.pmgmt, p.hor, p.rep) + b'\x0c'
+
+
+def p_logo_pme(p):
+    swaths = text_swaths('PME', p.x, p.color, p.nozzles, p.size, top=1 + p.fan, hor=p.hor,
+                         health=load_health(p.prnname))
+    return swaths_escp2(swaths, p.y, p.pmgmt, p.hor, p.rep) + b'\x0c'
+
+
+def p_logo_pme_mne(p):
+    dx = 1 / 120
+    health = load_health(p.prnname)
+    swaths = text_swaths('PME', p.x, p.color, p.nozzles, 3, top=1 + p.fan, hor=p.hor, health=health) + \
+             text_swaths('MNE', p.x + 20 * dx, p.color, p.nozzles, 1, top=1 + p.fan, hor=p.hor, health=health)
+    return swaths_escp2(swaths, p.y, p.pmgmt, p.hor, p.rep) + b'\x0c'
+
+
+def p_logo_TUPME(p):
+    dx = 1 / 120
+    health = load_health(p.prnname)
+    swaths = text_swaths('TU DELFT', p.x, p.color, p.nozzles, p.size, hor=p.hor, health=health) + \
+             text_swaths('PME', p.x, p.color, p.nozzles, p.size, top=11, hor=p.hor, health=health) + \
+             text_swaths('MNE', p.x + 20 * dx, p.color, p.nozzles, p.size, top=11, hor=p.hor, health=health)
+    return swaths_escp2(swaths, p.y, p.pmgmt, p.hor, p.rep) + b'\x0c'
+
+
+## print a matrix of nozzle lists, one column per 1/120 inch
+def print_logo(matrix, x=5.5, y=3, size=3, r=b'\x00', pmgmt=720, hor=5760, rep=1, health=None):
+    dx = 1 / 120
+    columns = [(x + k * dx, matrix[k], size) for k in range(len(matrix))]
+    nozzles = max(len(column) for column in matrix)
+    return columns_escp2(columns, r, nozzles, y, pmgmt, hor, rep, health)
+
+
+# end
+
+
+## patterns that only depend on PatternParams, names as in the GUI
+PATTERNS = {
+    'nxm raster': p_raster_nxm,
+    'single drop': p_raster_nxm,
+    '90x90 raster': p_raster_90x90,
+    'all nozzles': p_all_nozzles,
+    '1-10 drops stacked': p1_10_drops,
+    'raster nxm all dropsizes': p_nxm_sml,
+    'logo TUDELFT': p_logo_TUDelft,
+    'logo P': p_logo_P,
+    '1-100 drops stacked': p_1_100_drops,
+    'logo TU-FAST': p_logo_TU_fast,
+    'logo PME small': p_logo_pme_small,
+    'logo PME': p_logo_pme,
+    'logo PME-MNE': p_logo_pme_mne,
+    'logo TU-PME': p_logo_TUPME,
+    'single small': p1_small,
+    'single medium': p1_med,
+    'single large': p1_large,
+}
+
+
+## ==== JOB FUNCTIONS ====
+
+## ESC/P2 body: graphics mode, units, dot size and page settings
+def job_body(p):
+    return ESC_Graph() + ESC_Units(p.pmgmt, p.vert, p.hor, p.mm) + ESC_Kmode() + \
+           ESC_imode() + ESC_Umode(p.umode) + ESC_edot(p.d) + ESC_Dras() + \
+           ESC_C(p.pmgmt) + ESC_c(p.pmgmt) + ESC_S(p.pmgmt) + ESC_m(p.pmid)
+
+
+# end
+
+
+## write a complete job (header, body, raster data, footer) to a file-like writer
+def write_job(p, pattern, writer):
+    """
+    pattern is a key of PATTERNS or a function taking PatternParams.
+    Returns the number of bytes written.
+    """
+    if not callable(pattern):
+        pattern = PATTERNS[pattern]
+    folder = os.path.join(prns_dir, p.prnname, p.prnname)
+    written = 0
+    for section in [load_prn_file(folder + '-header.prn'), job_body(p), pattern(p),
+                    load_prn_file(folder + '-footer.prn')]:
+        writer.write(section)
+        written += len(section)
+    return written
+
+
+# end
+
+
+## generate a complete job as bytes
+def generate_job(p, pattern):
+    folder = os.path.join(prns_dir, p.prnname, p.prnname)
+    if not callable(pattern):
+        pattern = PATTERNS[pattern]
+    return load_prn_file(folder + '-header.prn') + job_body(p) + pattern(p) + \
+           load_prn_file(folder + '-footer.prn')
+
+
+# end
+
+
+## all combinations of the swept values
+def sweep_params(settings, sweep):
+    """
+    settings is a dict of pattern_params arguments (printer, color and values in GUI units),
+    sweep a dict with a list of values per argument, e.g. {'size': [1, 2, 3], 'dx': [250, 500]}.
+    Every combination is built by pattern_params, so swept printers, colors and umode are
+    converted as a single job would be.
+    Returns a list of (values, PatternParams) tuples.
+    """
+    keys = sorted(sweep)
+    result = []
+    for combination in itertools.product(*[sweep[k] for k in keys]):
+        values = dict(zip(keys, combination))
+        combined = dict(settings)
+        combined.update(values)
+        result.append((values, pattern_params(**combined)))
+    return result
+
+
+# end
+
+
+## generate one file, used by the process pool
+def _write_file(args):
+    p, pattern, path = args
+    # write to a temporary file first, an interrupted run never leaves a half written job
+    with open(path + '.part', 'wb') as f:
+        write_job(p, pattern, f)
+    os.replace(path + '.part', path)
+    return path
+
+
+## generate all jobs in parallel, returns the list of written paths
+def generate_files(jobs, workers=None):
+    """
+    jobs is a list of (PatternParams, pattern name, output path) tuples.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_write_file, jobs, chunksize=max(1, len(jobs) // 64)))
+
+
+# end
+
+
+## parse a command line value: int, float or string
+def _value(text):
+    for kind in (int, float):
+        try:
+            return kind(text)
+        except ValueError:
+            pass
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate ESC/P2 files for a sweep of pattern parameters')
+    parser.add_argument('-p', '--printer', default='SX235W', choices=sorted(printersParDict))
+    parser.add_argument('-t', '--pattern', default='nxm raster', choices=sorted(PATTERNS))
+    parser.add_argument('-c', '--color', default='black', choices=colorNames)
+    parser.add_argument('-v', '--value', action='append', default=[], metavar='NAME=VALUE',
+                        help='fixed parameter, GUI units (posx um, posy cm, dx um)')
+    parser.add_argument('-s', '--sweep', action='append', default=[], metavar='NAME=V1,V2,...',
+                        help='swept parameter, one file per combination')
+    parser.add_argument('-o', '--output', default='output/sweep')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes')
+    args = parser.parse_args(argv)
+
+    values = dict((k, _value(v)) for k, v in (item.split('=', 1) for item in args.value))
+    sweep = dict((k, [_value(v) for v in vs.split(',')]) for k, vs in (item.split('=', 1) for item in args.sweep))
+    values.update(printer=args.printer, color=args.color)
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+    jobs = []
+    for swept, p in sweep_params(values, sweep):
+        name = '-'.join([p.prnname, args.pattern.replace(' ', '_')] +
+                        ['%s%s' % (k, v) for k, v in sorted(swept.items())])
+        jobs.append((p, args.pattern, os.path.join(args.output, name + '.prn')))
+
+    for path in generate_files(jobs, args.jobs):
+        print(path)
+    print('Generated %s files' % (len(jobs)))
+
+
+if __name__ == '__main__':
+    main()
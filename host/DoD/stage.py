@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+"""
+Serial connection to the Arduino that drives the stage of the micro positioning tool
+
+The port is opened once and kept open. DTR is held low so opening does not reset the Arduino,
+reading uses a timeout instead of busy loops. Moves are queued and sent one after the other by
+a worker thread; the Arduino acknowledges every move with "End" when the stepper is done.
+
+    stage = ArduinoStage(find_arduino())
+    stage.open()
+    stage.move_microns(250)
+    stage.wait()
+
+Protocol of the Arduino sketch: "Start" after a reset, then per move the number of steps as
+text and "End" when done. The steps are terminated with a newline, so Serial.parseInt() on the
+Arduino returns at once instead of after its one second timeout.
+"""
+
+## ==== IMPORT MODULES ====
+import os
+import time
+import queue
+import threading
+
+import serial
+
+try:
+    from serial.tools import list_ports
+except ImportError:
+    list_ports = None
+
+
+## ==== Constants ====
+
+## one rotation of the spindle is 500 micron, 200 * 16 microsteps with the NEMA-17 stepper
+TRANSLATION_RATE = 500
+STEPS_PER_ROTATION = 200 * 16
+
+## USB vendor ids of Arduino boards and the usual USB-serial chips on clones (FTDI, CH340)
+ARDUINO_VIDS = (0x2341, 0x2a03, 0x0403, 0x1a86)
+
+## fallback paths when no USB metadata is available
+LINUX_PATHS = ["/dev/ttyUSB0", "/dev/ttyUSB1", "/dev/ttyACM0", "/dev/ttyACM1", "/dev/ttyACM2", "/dev/ttyACM3"]
+
+
+## ==== Functions ====
+
+## convert a stage movement in micron to motor steps
+def microns_to_steps(microns):
+    return round(microns / TRANSLATION_RATE * STEPS_PER_ROTATION)
+
+
+# end
+
+
+## port of the Arduino, found by USB vendor id without opening any port, None if not found
+def find_arduino():
+    if list_ports is not None:
+        ports = sorted(list_ports.comports(), key=lambda p: p.device)
+        for port in ports:
+            if port.vid in ARDUINO_VIDS:
+                return port.device
+    if os.name == 'nt':
+        return 'COM3'
+    for path in LINUX_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+# end
+
+
+class ArduinoStage():
+    def __init__(self, port, baudrate=9600, timeout=0.05, boot_timeout=2, move_timeout=30):
+        """
+        timeout:        read timeout of the serial port in s
+        boot_timeout:   time to wait for "Start" after opening, when opening can reset the
+                        Arduino (see reset_on_open)
+        move_timeout:   time to wait for "End" after a move
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.boot_timeout = boot_timeout
+        self.move_timeout = move_timeout
+
+        self.ser = None
+        self.moves = queue.Queue()
+        self.worker = None
+        self.last_error = None
+        # (steps, seconds from sending to "End") of the last move
+        self.last_move = None
+
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open
+
+    ## open the port once, without resetting the Arduino, and start the worker thread
+    def open(self):
+        if self.is_open():
+            return
+        if self.port is None:
+            raise serial.SerialException('No Arduino found')
+        self.ser = serial.Serial()
+        self.ser.port = self.port
+        self.ser.baudrate = self.baudrate
+        self.ser.timeout = self.timeout
+        self.ser.dsrdtr = False
+        self.ser.rtscts = False
+        # set before open, so the port opens with DTR low and the bootloader is not started
+        self.ser.dtr = False
+        self.ser.open()
+        print("USB connection to Arduino working for " + self.port)
+
+        # after a reset the Arduino prints "Start" when it has booted
+        if self.reset_on_open():
+            self.read_until("Start", self.boot_timeout)
+        self.ser.reset_input_buffer()
+
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    ## whether opening the port can reset the Arduino. On Windows the port opens with DTR low,
+    ## on Linux and macOS the driver raises DTR while opening, before pyserial can lower it
+    @staticmethod
+    def reset_on_open():
+        return os.name != 'nt'
+
+    def close(self):
+        if self.worker is not None:
+            self.moves.put(None)
+            self.worker.join()
+            self.worker = None
+        if self.ser is not None:
+            self.ser.close()
+
+    ## read lines until `text` arrives, returns False after `timeout` seconds
+    def read_until(self, text, timeout):
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            line = self.ser.readline().decode(errors='replace').strip()
+            if line == text:
+                return True
+        return False
+
+    ## queue a move in motor steps, returns at once
+    def move(self, steps):
+        self.open()
+        self.moves.put(int(steps))
+
+    def move_microns(self, microns):
+        self.move(microns_to_steps(microns))
+
+    ## block until all queued moves are acknowledged, False on timeout
+    def wait(self, timeout=None):
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.moves.unfinished_tasks:
+            if end is not None and time.monotonic() > end:
+                return False
+            time.sleep(0.001)
+        return True
+
+    ## worker thread: send the queued moves one by one and wait for their acknowledgement
+    def _run(self):
+        while True:
+            steps = self.moves.get()
+            if steps is None:
+                self.moves.task_done()
+                return
+            try:
+                start = time.monotonic()
+                self.ser.write(b'%d\n' % steps)
+                if self.read_until("End", self.move_timeout):
+                    self.last_move = (steps, time.monotonic() - start)
+                else:
+                    self.last_error = "No acknowledgement of move %d steps" % steps
+                    print(self.last_error)
+            except serial.SerialException as e:
+                self.last_error = str(e)
+                print("Arduino: " + self.last_error)
+            finally:
+                self.moves.task_done()
@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+"""
+Swath planner: print droplet arrays in bands the height of the nozzle array
+
+Instead of one ESC ( $ + ESC i per nozzle column, every band of `nozzles` rows is sent as one
+ESC i per color, with ESC ( v paper feeds between the bands. Empty bands and empty columns at
+the sides of a band are skipped.
+
+Columns that do not fall on the dot pitch of the raster (1/360 inch, ESC ( D) are grouped by
+their offset to that grid, every group gets its own ESC ( $ so all droplets keep their exact
+position in 1/hor inch.
+"""
+
+## ==== IMPORT MODULES ====
+from collections import namedtuple
+
+import numpy as np
+
+from DoD.esc_functions import ESC_v, ESC_dollar, ESC_i_drops
+from DoD.nozzle_health import alive_nozzles, nozzle_passes, pass_bands
+
+
+## ==== Constants ====
+
+## ESC ( D as sent by ESC_Dras(): nozzle pitch 120/14400 inch, dot pitch 40/14400 inch
+NOZZLE_PITCH = 1 / 120
+DOT_PITCH = 1 / 360
+
+## ESC_i_nrs() sends one byte per nozzle with the droplet in the last of its 4 pixels
+NRS_PIXEL = 3
+
+## one ESC i: first nozzle row of the band, position of the first column in 1/hor inch,
+## color byte and the (rows, columns) droplet sizes
+Swath = namedtuple('Swath', ['row', 'x', 'r', 'drops'])
+
+
+## ==== Functions ====
+
+## split droplet arrays in swaths of at most `nozzles` rows
+def plan_swaths(layers, x, nozzles, hor=5760, dot_pitch=DOT_PITCH, health=None):
+    """
+    layers:     dict with color byte as key, (rows, columns) droplet sizes as value,
+                one row per nozzle, one column per dot
+    x:          position of column 0 in 1/hor inch
+    health:     nozzle health map (see nozzle_health.py), the dots of dead nozzles are
+                printed in extra passes by working nozzles
+    Returns a list of Swath, sorted by band. Empty bands, empty columns at both sides and
+    empty rows at the bottom of a band are left out.
+    """
+    dot = int(round(hor * dot_pitch))
+    swaths = []
+    for r, drops in layers.items():
+        alive = alive_nozzles(health, r, nozzles) if health else None
+        for shift, layer in nozzle_passes(drops, alive):
+            for row, band in pass_bands(layer, shift, nozzles):
+                used = np.flatnonzero(band.any(axis=0))
+                if used.size == 0:
+                    continue
+                rows = np.flatnonzero(band.any(axis=1))[-1] + 1
+                swaths.append(Swath(row, x + int(used[0]) * dot, r, band[:rows, used[0]:used[-1] + 1]))
+    return sorted(swaths, key=lambda s: s.row)
+
+
+# end
+
+
+## ESC/P2 commands of a list of swaths, the paper is fed from band to band
+def swaths_escp2(swaths, y, pmgmt=720, hor=5760, rep=1, nozzle_pitch=NOZZLE_PITCH):
+    """
+    y is the paper feed to row 0 in inch, extra passes for dead nozzles can start above
+    row 0. The form feed is not included. Every swath is sent rep times.
+    """
+    swaths = sorted(swaths, key=lambda s: s.row)
+    row = min([0] + [swath.row for swath in swaths])
+    rasterdata = [ESC_v(pmgmt, y + row * nozzle_pitch)]
+    for swath in swaths:
+        if swath.row != row:
+            rasterdata.append(ESC_v(pmgmt, (swath.row - row) * nozzle_pitch))
+            row = swath.row
+        # ESC_dollar truncates, half a unit extra gives exactly swath.x
+        rasterdata.append((ESC_dollar(hor, (swath.x + 0.5) / hor) + ESC_i_drops(swath.drops, swath.r)) * rep)
+    return b''.join(rasterdata)
+
+
+# end
+
+
+## droplet arrays of nozzle columns at arbitrary x positions
+def columns_to_layers(columns, hor=5760, dot_pitch=DOT_PITCH):
+    """
+    columns:    list of (x in inch, nozzlelist, size) as sent by ESC_dollar + ESC_i_nrs
+    Returns a list of (x in 1/hor inch, droplet array), one per offset to the dot grid.
+    Columns that put a droplet on the same nozzle and position are stacked droplets, they go
+    into further arrays with the same offset so every droplet is printed.
+    """
+    dot = int(round(hor * dot_pitch))
+    # the same positions ESC_dollar + ESC_i_nrs would print at
+    positions = np.array([int(x * hor) + NRS_PIXEL * dot for x, nozzlelist, size in columns], dtype=np.int64)
+    nozzles = max(len(nozzlelist) for x, nozzlelist, size in columns)
+    phases = positions % dot
+
+    result = []
+    for phase in np.unique(phases).tolist():
+        select = np.flatnonzero(phases == phase)
+        first = int(positions[select].min())
+        width = int(positions[select].max() - first) // dot + 1
+        stack = []
+        for k in select.tolist():
+            x, nozzlelist, size = columns[k]
+            fire = np.asarray(nozzlelist, dtype=np.uint8) * size
+            col = (positions[k] - first) // dot
+            # first array without a droplet on these nozzles at this position
+            for drops in stack:
+                if not drops[:len(fire), col][fire > 0].any():
+                    break
+            else:
+                drops = np.zeros((nozzles, width), dtype=np.uint8)
+                stack.append(drops)
+            column = drops[:len(fire), col]
+            np.maximum(column, fire, out=column)
+        result += [(first, drops) for drops in stack]
+    return result
+
+
+# end
+
+
+## swaths of nozzle columns of one color
+def columns_swaths(columns, r, nozzles, hor=5760, health=None):
+    swaths = []
+    for x, drops in columns_to_layers(columns, hor):
+        swaths += plan_swaths({r: drops}, x, nozzles, hor, health=health)
+    return swaths
+
+
+# end
+
+
+## ESC/P2 commands for nozzle columns, as swaths instead of one ESC i per column
+def columns_escp2(columns, r, nozzles, y, pmgmt=720, hor=5760, rep=1, health=None):
+    return swaths_escp2(columns_swaths(columns, r, nozzles, hor, health), y, pmgmt, hor, rep)
+
+
+# end
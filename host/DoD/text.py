@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+Text rendering
+
+Renders any string from a bitmap font in assets/fonts (see assets.py) into one droplet array.
+The swath planner prints that array as one ESC i per band, instead of one ESC ( $ + ESC i per
+column as the old createP(), createM(), ... functions did.
+
+    drops = render_text('TU DELFT')
+    data = text_escp2('SAMPLE 12', x=5, y=3, r=b'\\x00', nozzles=30, size=2)
+
+Glyph columns are 1/120 inch apart by default (dx), the glyph rows are one nozzle apart.
+"""
+
+## ==== IMPORT MODULES ====
+from functools import lru_cache
+
+import numpy as np
+
+from DoD.assets import load_glyph, glyph_names
+from DoD.swath import plan_swaths, columns_swaths, swaths_escp2, NOZZLE_PITCH, DOT_PITCH, NRS_PIXEL
+
+
+## ==== Functions ====
+
+## glyph of a character, lowercase letters without a glyph use the capital
+def _glyph(font, char):
+    glyph = load_glyph(font, char)
+    if glyph is None and char != char.upper():
+        glyph = load_glyph(font, char.upper())
+    return glyph
+
+
+## height of the glyphs and width of a space: the largest glyph of the font
+@lru_cache(maxsize=None)
+def _font_box(font):
+    shapes = [load_glyph(font, name).shape for name in glyph_names(font)]
+    if not shapes:
+        raise ValueError("Font '%s' has no glyphs" % font)
+    return max(s[0] for s in shapes), max(s[1] for s in shapes)
+
+
+# end
+
+
+## droplet array of a string
+def render_text(text, font='regular', size=3, spacing=1, scale=1):
+    """
+    text:       lines separated by newlines, a space is as wide as the widest glyph
+    size:       droplet size (1 small, 2 medium, 3 large) of the glyph pixels
+    spacing:    empty columns between glyphs and empty rows between lines, in glyph pixels
+    scale:      every glyph pixel becomes scale x scale droplets
+    Returns a (rows, columns) uint8 array, row 0 is the top row of the first line.
+    Raises ValueError for characters that have no glyph in the font.
+    """
+    height, space = _font_box(font)
+    lines = []
+    for line in text.split('\n'):
+        parts = []
+        for char in line:
+            glyph = np.zeros((height, space), dtype=np.uint8) if char == ' ' else _glyph(font, char)
+            if glyph is None:
+                raise ValueError("Font '%s' has no glyph for '%s', available: %s" %
+                                 (font, char, ''.join(glyph_names(font))))
+            parts.append(np.pad(glyph, ((0, height - glyph.shape[0]), (0, spacing))))
+        lines.append(np.concatenate(parts, axis=1)[:, :-spacing or None] if parts else
+                     np.zeros((height, 0), dtype=np.uint8))
+
+    width = max(line.shape[1] for line in lines)
+    drops = np.zeros((len(lines) * (height + spacing) - spacing, width), dtype=np.uint8)
+    for k, line in enumerate(lines):
+        drops[k * (height + spacing):k * (height + spacing) + height, :line.shape[1]] = line
+    if scale > 1:
+        drops = drops.repeat(scale, axis=0).repeat(scale, axis=1)
+    return drops * np.uint8(size)
+
+
+# end
+
+
+## swaths of a string, the top row of the text on nozzle index `top`
+def text_swaths(text, x, r, nozzles, size=3, font='regular', dx=NOZZLE_PITCH, top=1, spacing=1, scale=1,
+                hor=5760, health=None):
+    """
+    x:          position of the first column in inch, as ESC_dollar(hor, x) + ESC_i_nrs() would print it
+    dx:         distance between the glyph columns in inch
+    top:        nozzle index of the top row, index 1 is the first row of the old createP() etc.
+    health:     nozzle health map, see nozzle_health.py
+    Text taller than the nozzle array is printed in several bands.
+    """
+    drops = render_text(text, font, size, spacing, scale)
+    if not drops.any():
+        return []
+    drops = np.concatenate((np.zeros((top, drops.shape[1]), dtype=np.uint8), drops))
+
+    dot = int(round(hor * DOT_PITCH))
+    step = dx * hor / dot
+    if abs(step - round(step)) > 1e-6:
+        # columns off the dot grid, grouped by their offset to it
+        columns = [(x + k * dx, drops[:, k], 1) for k in range(drops.shape[1])]
+        return columns_swaths(columns, r, nozzles, hor, health)
+
+    # all columns on the dot grid: one droplet array with empty dots between the columns
+    step = int(round(step))
+    layer = np.zeros((drops.shape[0], (drops.shape[1] - 1) * step + 1), dtype=np.uint8)
+    layer[:, ::step] = drops
+    return plan_swaths({r: layer}, int(x * hor) + NRS_PIXEL * dot, nozzles, hor, health=health)
+
+
+# end
+
+
+## ESC/P2 commands of a string, including the paper feed to y (inch) but not the form feed
+def text_escp2(text, x, y, r, nozzles, size=3, font='regular', dx=NOZZLE_PITCH, top=1, spacing=1, scale=1,
+               pmgmt=720, hor=5760, rep=1, health=None):
+    swaths = text_swaths(text, x, r, nozzles, size, font, dx, top, spacing, scale, hor, health)
+    return swaths_escp2(swaths, y, pmgmt, hor, rep)
+
+
+# end
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+"""
+Toolpath planner for the pyboard setup
+
+Assigns the droplets of a droplet field to the nozzle rows of the head and prints the field in
+stage passes: one pass per band of `nozzles` rows, with a G1 to every column that has droplets
+and one P1 per droplet size that fires all nozzles of that column at once (hex nozzle masks).
+The field comes from a halftoned bitmap (DoD.bitmap) or from vector G-code (droplets along the
+G1 moves, see vector_drops()).
+
+Rows finer than the nozzle pitch are printed interlaced: row k of the field is printed in pass
+k mod interlace, with the stage shifted (k mod interlace) / interlace nozzle pitches.
+
+    python3 -m DoD.toolpath gcode/Spiral.nc gcode/Spiral.plan.nc --spacing 25
+"""
+
+## ==== IMPORT MODULES ====
+import math
+import argparse
+
+import numpy as np
+
+from DoD.nozzle_health import nozzle_passes, pass_bands, load_health, alive_nozzles
+from DoD.swath import NOZZLE_PITCH, DOT_PITCH
+
+
+## ==== Constants ====
+
+## droplet size as P1 S parameter
+GCODE_SIZES = {1: 'S', 2: 'M', 3: 'L'}
+
+## nozzles per P1 channel: black, cyan, magenta, yellow
+CHANNEL_NOZZLES = {'B': 90, 'C': 30, 'M': 30, 'Y': 30}
+
+## nozzle row of a P1 channel, as in DoD.patterns.colorNames
+CHANNEL_COLORS = {'B': 'black', 'C': 'cyan', 'M': 'magenta', 'Y': 'yellow'}
+
+
+## ==== Functions ====
+
+## nozzle mask as P1 parameter: x and the hex digits of a number with bit n-1 set for nozzle n
+def gcode_mask(fire):
+    value = sum(1 << n for n, f in enumerate(fire) if f)
+    return 'x%x' % value
+
+
+# end
+
+
+## G-code of a droplet field, printed in passes of `nozzles` rows
+def plan_gcode(drops, x=0, y=0, dx=DOT_PITCH * 25.4, nozzle_pitch=NOZZLE_PITCH * 25.4, nozzles=None,
+               channel='B', interlace=1, quality='E', alive=None, serpentine=False):
+    """
+    drops:          (rows, columns) droplet sizes, row k at y + k * nozzle_pitch / interlace
+    x, y:           position of droplet [0, 0] in mm
+    dx:             column spacing in mm
+    nozzles:        nozzles of the channel, all of them by default (see CHANNEL_NOZZLES)
+    channel:        P1 parameter of the nozzle mask, B for black or C, M, Y for a color
+    alive:          bool array of working nozzles (see nozzle_health.py), the rows of dead
+                    nozzles are printed in extra passes with the stage shifted whole nozzles
+    serpentine:     every other pass runs from right to left, less travel but the backlash of
+                    the stage shows between the passes
+    Returns the G-code as a list of lines.
+    """
+    nozzles = CHANNEL_NOZZLES[channel] if nozzles is None else nozzles
+    lines = ['G0 X%s Y%s' % (round(x, 4), round(y, 4))]
+    reverse = False
+    for sub in range(interlace):
+        for shift, layer in nozzle_passes(drops[sub::interlace], alive):
+            for row, band in pass_bands(layer, shift, nozzles):
+                columns = np.flatnonzero(band.any(axis=0)).tolist()
+                if not columns:
+                    continue
+                if reverse:
+                    columns.reverse()
+                reverse = serpentine and not reverse
+                yb = y + (row + sub / interlace) * nozzle_pitch
+                for col in columns:
+                    column = band[:, col]
+                    lines.append('G1 X%s Y%s' % (round(x + col * dx, 4), round(yb, 4)))
+                    for size in (1, 2, 3):
+                        fire = column == size
+                        if fire.any():
+                            lines.append('P1 %s%s S%s Q%s' % (channel, gcode_mask(fire.tolist()), GCODE_SIZES[size],
+                                                             quality))
+    return lines
+
+
+# end
+
+
+## droplet positions in mm along the G1 moves of vector G-code, `spacing` mm apart
+def vector_points(lines, spacing):
+    points = []
+    position = None
+    for line in lines:
+        words = line.split(';')[0].split()
+        if not words or words[0] not in ('G0', 'G1'):
+            continue
+        code = dict((w[0], w[1:]) for w in words[1:] if len(w) > 1)
+        if 'X' not in code and 'Y' not in code:
+            continue
+        target = (float(code.get('X', position[0] if position else 0)),
+                  float(code.get('Y', position[1] if position else 0)))
+        if words[0] == 'G1' and position is not None:
+            length = math.hypot(target[0] - position[0], target[1] - position[1])
+            steps = max(1, int(round(length / spacing)))
+            points += [(position[0] + (target[0] - position[0]) * k / steps,
+                        position[1] + (target[1] - position[1]) * k / steps) for k in range(steps + 1)]
+        position = target
+    return points
+
+
+# end
+
+
+## droplet field of vector G-code: droplets along the G1 moves on a grid of dx by dy mm
+def vector_drops(lines, spacing, dx=None, dy=None, size=3):
+    """
+    spacing:    droplet distance along the moves in mm
+    dx, dy:     grid of the field, spacing by default
+    Returns the (rows, columns) droplet sizes and the position (x, y) of droplet [0, 0].
+    """
+    dx = spacing if dx is None else dx
+    dy = spacing if dy is None else dy
+    points = np.array(vector_points(lines, spacing)).reshape(-1, 2)
+    if not len(points):
+        return np.zeros((0, 0), dtype=np.uint8), (0, 0)
+    origin = points.min(axis=0)
+    cols = np.rint((points[:, 0] - origin[0]) / dx).astype(int)
+    rows = np.rint((points[:, 1] - origin[1]) / dy).astype(int)
+    drops = np.zeros((rows.max() + 1, cols.max() + 1), dtype=np.uint8)
+    drops[rows, cols] = size
+    return drops, (float(origin[0]), float(origin[1]))
+
+
+# end
+
+
+## plan vector G-code: rows interlaced so the field has about `spacing` between rows as well
+def plan_vectors(lines, spacing, nozzle_pitch=NOZZLE_PITCH * 25.4, size=3, **kwargs):
+    interlace = max(1, int(round(nozzle_pitch / spacing)))
+    drops, (x, y) = vector_drops(lines, spacing, dy=nozzle_pitch / interlace, size=size)
+    return plan_gcode(drops, x, y, spacing, nozzle_pitch, interlace=interlace, **kwargs)
+
+
+# end
+
+
+## number of droplets, P1 commands and stage passes (runs of G1 moves at one Y) of planned G-code
+def plan_stats(lines):
+    fires = [l.split() for l in lines if l.startswith('P1')]
+    drops = sum(bin(int(words[1][2:], 16)).count('1') for words in fires)
+    ys = [l.split()[2] for l in lines if l.startswith('G1')]
+    passes = sum(1 for k in range(len(ys)) if k == 0 or ys[k] != ys[k - 1])
+    return drops, len(fires), passes
+
+
+# end
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Plan vector G-code as multi-nozzle passes with P1 nozzle masks')
+    parser.add_argument('gcode')
+    parser.add_argument('output')
+    parser.add_argument('-s', '--spacing', type=float, default=25, help='droplet spacing in um')
+    parser.add_argument('-c', '--channel', default='B', choices=sorted(CHANNEL_NOZZLES))
+    parser.add_argument('--size', type=int, default=3, choices=[1, 2, 3], help='droplet size')
+    parser.add_argument('--serpentine', action='store_true', help='print every other pass from right to left')
+    parser.add_argument('--health', metavar='PRINTER', help='skip the dead nozzles in the health map of PRINTER')
+    args = parser.parse_args(argv)
+
+    alive = None
+    if args.health:
+        from DoD.patterns import pattern_params
+        p = pattern_params(args.health, CHANNEL_COLORS[args.channel])
+        alive = alive_nozzles(load_health(p.prnname), p.color, CHANNEL_NOZZLES[args.channel])
+    with open(args.gcode) as f:
+        lines = plan_vectors(f.readlines(), args.spacing / 1000, size=args.size, channel=args.channel,
+                             serpentine=args.serpentine, alive=alive)
+    with open(args.output, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    drops, fires, passes = plan_stats(lines)
+    print('%d droplets in %d P1 commands (%.1f droplets per P1), %d passes' % (drops, fires, drops / max(fires, 1), passes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+## ==== IMPORT MODULES ====
+import numpy as np
+from PIL import Image
+from DoD.hex_functions import escp2_iter
+
+
+## ==== Constants ====
+
+## color byte r of ESC i, with the RGB color of the ink
+UNPRINT_COLORS = {
+    0: (0, 0, 0),        # black
+    1: (255, 0, 255),    # magenta
+    2: (0, 255, 255),    # cyan
+    4: (255, 255, 0),    # yellow
+    5: (0, 0, 0),        # black2
+    6: (0, 0, 0),        # black3
+}
+
+## ink coverage of the small, medium and large droplet
+UNPRINT_DROP_ALPHA = np.array([0, 0.35, 0.65, 1.0])
+
+
+## ==== Functions ====
+
+## decode TIFF/packbits run-length compressed data
+def rle_decode(data, size):
+    """
+    data is the compressed raster (bytes or memoryview), size the number of decoded bytes.
+    Only the packet headers are walked in Python, the bytes are gathered with numpy.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    starts = []
+    lengths = []
+    repeats = []
+    pos = 0
+    decoded = 0
+    while decoded < size and pos < len(buf):
+        counter = int(buf[pos])
+        if counter < 128:
+            starts.append(pos + 1)
+            lengths.append(counter + 1)
+            repeats.append(0)
+            pos += counter + 2
+            decoded += counter + 1
+        else:
+            starts.append(pos + 1)
+            lengths.append(257 - counter)
+            repeats.append(1)
+            pos += 2
+            decoded += 257 - counter
+
+    starts = np.array(starts, dtype=np.int64)
+    lengths = np.array(lengths, dtype=np.int64)
+    repeats = np.array(repeats, dtype=np.int64)
+
+    # index of every decoded byte in buf: packet start + position inside literal packets
+    first = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    inside = np.arange(first.size) - first
+    index = np.repeat(starts, lengths) + inside * np.repeat(1 - repeats, lengths)
+    index = np.minimum(index, len(buf) - 1)
+    return buf[index][:size]
+
+
+# end
+
+
+## decode the data of an ESC i command to an array of droplet sizes
+def decode_raster(params):
+    """
+    params are the bytes after 'ESC i': r c b nL nH mL mH data.
+    Returns (r, raster) with raster an (m, pixels) uint8 array holding 0 (no drop) to 3 (large).
+    """
+    r, c, b = params[0], params[1], params[2]
+    n = params[3] + 256 * params[4]
+    m = params[5] + 256 * params[6]
+    if c:
+        data = rle_decode(params[7:], n * m)
+    else:
+        data = np.frombuffer(params[7:7 + n * m], dtype=np.uint8)
+    data = np.pad(data, (0, n * m - data.size))
+
+    bits = np.unpackbits(data).reshape(m, n * 8 // b, b)
+    raster = np.zeros((m, n * 8 // b), dtype=np.uint8)
+    for k in range(b):
+        raster = (raster << 1) | bits[:, :, k]
+    return r, raster
+
+
+# end
+
+
+## 4 byte little endian integer from ESC ( parameters
+def _long(params, signed=False):
+    return int.from_bytes(bytes(params[2:6]), 'little', signed=signed)
+
+
+## render the droplets of an ESC/P2 stream into arrays
+def unprint_array(data, square=False):
+    """
+    Decodes positions from ESC ( $, ESC ( /, ESC ( v and ESC ( V and the ESC i raster data
+    of the first page in data.
+    Returns (layers, origin, units):
+        layers:     dict with color byte r as key and a (height, width) uint8 array of droplet
+                    sizes (0-3) as value, one pixel per vertical and horizontal unit
+        origin:     (y, x) position of pixel [0, 0] on the page, in pixels
+        units:      (vert, hor) units per inch, as set by ESC ( U
+    With square=True one pixel is one vertical unit wide as well, droplets that end up in
+    the same pixel are merged.
+    Nozzle pitch and dot spacing are taken from ESC ( D.
+    Returns (None, None, units) if the data contains no droplets.
+    """
+    vert = 720
+    hor = 5760
+    nozzle_pitch = 120 / 14400  # inch, ESC ( D v/r
+    dot_pitch = 40 / 14400  # inch, ESC ( D h/r
+    x = 0
+    y = 0
+    dots = []
+
+    for offset, end, command, params in escp2_iter(data):
+        if command == b'(U':
+            if params[0] == 5:
+                m = params[5] + 256 * params[6]
+                vert = m / params[3]
+                hor = m / params[4]
+            else:
+                vert = hor = 3600 / params[2]
+        elif command == b'(D':
+            r = params[2] + 256 * params[3]
+            nozzle_pitch = params[4] / r
+            dot_pitch = params[5] / r
+        elif command == b'(v':
+            y += _long(params)
+        elif command == b'(V':
+            y = _long(params)
+        elif command == b'($':
+            x = _long(params)
+        elif command == b'(/':
+            x += _long(params, signed=True)
+        elif command == b'i':
+            r, raster = decode_raster(params)
+            rows, cols = np.nonzero(raster)
+            if rows.size:
+                ys = y + np.rint(rows * nozzle_pitch * vert).astype(np.int64)
+                xs = x + np.rint(cols * dot_pitch * hor).astype(np.int64)
+                dots.append((r, ys, xs, raster[rows, cols]))
+            # print position moves to the right end of the raster
+            x += int(round(raster.shape[1] * dot_pitch * hor))
+        elif command == b'' and 0x0d in params:
+            x = 0
+        if command == b'' and 0x0c in params:
+            break
+
+    if not dots:
+        return None, None, (vert, hor)
+
+    colors = sorted(set(d[0] for d in dots))
+    ys = {r: np.concatenate([d[1] for d in dots if d[0] == r]) for r in colors}
+    xs = {r: np.concatenate([d[2] for d in dots if d[0] == r]) for r in colors}
+    sizes = {r: np.concatenate([d[3] for d in dots if d[0] == r]) for r in colors}
+    if square and hor > vert:
+        for r in colors:
+            xs[r] = (xs[r] * vert / hor).astype(np.int64)
+
+    y0 = min(int(ys[r].min()) for r in colors)
+    x0 = min(int(xs[r].min()) for r in colors)
+    height = max(int(ys[r].max()) for r in colors) - y0 + 1
+    width = max(int(xs[r].max()) for r in colors) - x0 + 1
+
+    layers = {}
+    for r in colors:
+        layers[r] = np.zeros((height, width), dtype=np.uint8)
+        # write small to large, so the largest droplet on a pixel remains
+        for size in (1, 2, 3):
+            select = sizes[r] == size
+            layers[r][ys[r][select] - y0, xs[r][select] - x0] = size
+    return layers, (y0, x0), (vert, hor)
+
+
+# end
+
+
+## render an ESC/P2 stream to a droplet map image
+def unprint_image(data, square=True):
+    """
+    Returns a PIL RGB image of the droplets in data on a white background, darker means
+    larger droplets. One pixel per vertical unit and per horizontal unit, with square=True
+    columns are merged so one pixel is one vertical unit wide as well.
+    """
+    layers, origin, units = unprint_array(data, square)
+    if layers is None:
+        return Image.new('RGB', (1, 1), 'white')
+
+    # only the pixels with droplets are blended, the rest of the page stays white
+    shape = next(iter(layers.values())).shape
+    rows, cols = np.nonzero(np.maximum.reduce(list(layers.values())))
+    pixels = np.ones((rows.size, 3))
+    for r, layer in layers.items():
+        color = np.array(UNPRINT_COLORS.get(r, (0, 0, 0))) / 255
+        alpha = UNPRINT_DROP_ALPHA[layer[rows, cols]][:, None]
+        pixels *= 1 - alpha * (1 - color)
+
+    image = np.full(shape + (3,), 255, dtype=np.uint8)
+    image[rows, cols] = (pixels * 255).astype(np.uint8)
+    return Image.fromarray(image, 'RGB')
+
+
+# end
+
+
+## render a prn file and save it as png
+def unprint_file(filepath, outputpath, square=True):
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    image = unprint_image(data, square)
+    image.save(outputpath)
+    return image
+
+
+# end
@@ -1,11 +1,89 @@
 from tkinter import *
 import tkinter
+import os
 import sys
-import glob
 import serial
 import random
 import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from serial.tools import list_ports
+
+from DoD.stage import ARDUINO_VIDS
+from latency import split_timing
+
+
+# USB vendor id of MicroPython boards (pyboard), all product ids
+PYBOARD_VID = 0xf055
+
+# interval of the check for plugged or unplugged ports in ms
+PORT_POLL_INTERVAL = 1000
+
+# where plugging in a device cannot be seen (Windows, macOS), the ports are listed again this often, in s
+PORT_RESCAN_INTERVAL = 10
+
+
+def port_kind(port):
+    if port.vid == PYBOARD_VID: return 'pyboard'
+    if port.vid in ARDUINO_VIDS: return 'arduino'
+    return 'serial'
+
+
+def probe_port(port, timeout=0.2):
+    s = serial.Serial(port, timeout=timeout, write_timeout=timeout)
+    s.close()
+    return port
+
+
+class PortScanner():
+    """
+    Serial ports from the USB metadata of the OS (serial.tools.list_ports), no port is opened
+    unless probe is set. The result is cached until a device is plugged in or removed: on
+    Linux udev creates and removes the device nodes, which changes the modification time of /dev.
+    Elsewhere it is cached for PORT_RESCAN_INTERVAL seconds.
+    """
+    def __init__(self, probe=False, probe_timeout=0.5):
+        self.probe = probe
+        self.probe_timeout = probe_timeout
+        self.signature = None
+        self.ports = []
+
+    def get_signature(self):
+        if sys.platform.startswith('linux'):
+            try:
+                return os.stat('/dev').st_mtime_ns
+            except OSError:
+                pass
+        return ('rescan', int(time.monotonic() // PORT_RESCAN_INTERVAL))
+
+    def changed(self):
+        return self.get_signature() != self.signature
+
+    def scan(self, refresh=False):
+        """
+        Returns a list of (device, kind), kind is 'pyboard', 'arduino' or 'serial', pyboards first.
+        Ports without USB metadata (the many /dev/ttyS* nodes) are left out.
+        """
+        signature = self.get_signature()
+        if not refresh and signature == self.signature:
+            return self.ports
+
+        ports = [(p.device, port_kind(p)) for p in list_ports.comports() if p.vid is not None]
+        if self.probe and ports:
+            # open all candidates at once, ports that block or fail are dropped
+            pool = ThreadPoolExecutor(max_workers=len(ports))
+            futures = {pool.submit(probe_port, device, self.probe_timeout): (device, kind)
+                       for device, kind in ports}
+            done, not_done = wait(futures, timeout=self.probe_timeout * 2)
+            # do not wait for ports that hang in open()
+            pool.shutdown(wait=False)
+            ports = [futures[f] for f in done if f.exception() is None]
+
+        order = {'pyboard': 0, 'arduino': 1, 'serial': 2}
+        self.ports = sorted(ports, key=lambda p: (order[p[1]], p[0]))
+        self.signature = signature
+        return self.ports
 
 
 class ConnectModule():
@@ -16,6 +94,7 @@ class ConnectModule():
 
         self.ser = serial.Serial()
         self.test_entries = test_entries
+        self.scanner = PortScanner()
 
         self.update_bt = Button(self.frame, command=self.update_pressed, text='Refresh')
 
@@ -33,8 +112,18 @@ class ConnectModule():
         self.connect_bt.grid(row=3, column=1)
         self.disconnect_bt.grid(row=3, column=2)
 
+        self.root.after(PORT_POLL_INTERVAL, self.poll_ports)
+
     def update_pressed(self):
-        self.update_ports()
+        self.update_ports(refresh=True)
+
+    def poll_ports(self):
+        # the list is only rebuilt when ports appeared or disappeared, so the selection stays
+        if not self.is_connected and self.scanner.changed():
+            ports = self.scanner.ports
+            if self.scanner.scan() != ports:
+                self.update_ports()
+        self.root.after(PORT_POLL_INTERVAL, self.poll_ports)
 
     def connect_pressed(self):
         if not self.lb.curselection(): return
@@ -79,6 +168,7 @@ class ConnectModule():
     def send_command(self, command, response=True, encode=True):
         if not self.is_connected: return 'Error: not connected'
 
+        start = time.perf_counter()
         if encode: self.ser.write(command.encode('ascii'))
         else: self.ser.write(command)
 
@@ -86,7 +176,14 @@ class ConnectModule():
             while True:
                 r = self.get_response()
                 if r != None:
+                    latency = round((time.perf_counter() - start) * 1000, 3)
+                    # phase times in us appended by the board with config.PROFILE
+                    r, phases = split_timing(r)
                     print(r)
+                    if isinstance(command, bytes): command = command.decode('ascii', 'replace')
+                    # round trip in ms, written by the logger thread
+                    self.master.status_module.log(command=command.strip(), response=r.strip(), latency=latency,
+                                                  phases=phases, status=False)
                     return r
 
         return True
@@ -111,14 +208,14 @@ class ConnectModule():
                 print('Skipping homing')
                 continue
 
-            self.send_command(l.strip().encode('ascii'))
+            self.send_command(l.strip())
             time.sleep(0.22)
 
         self.master.status_module.set_status_light('green')
         self.master.status_module.log('Finished printing '+str(file))
 
-    def update_ports(self):
-        available_ports = self.serial_ports()
+    def update_ports(self, refresh=False):
+        available_ports = self.serial_ports(refresh)
         self.lb.delete(0, self.lb.size())
         for i, port in enumerate(available_ports):
             self.lb.insert(i, port)
@@ -126,23 +223,11 @@ class ConnectModule():
             for i in range(10):
                 self.lb.insert(i, 'test entry '+str(random.random()))
 
-    def serial_ports(self):
-        if sys.platform.startswith('win'):
-            ports = ['COM%s' % (i + 1) for i in range(256)]
-        elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-            # this excludes your current terminal "/dev/tty"
-            ports = glob.glob('/dev/tty[A-Za-z]*')
-        elif sys.platform.startswith('darwin'):
-            ports = glob.glob('/dev/tty.*')
-        else:
-            raise EnvironmentError('Unsupported platform')
-
-        result = []
-        for port in ports:
-            try:
-                s = serial.Serial(port)
-                s.close()
-                result.append(port)
-            except (OSError, serial.SerialException):
-                pass
-        return result
+        # select the first pyboard
+        pyboards = [port for port, kind in self.scanner.ports if kind == 'pyboard']
+        if pyboards and pyboards[0] in self.lb.get(0, END):
+            self.lb.selection_clear(0, END)
+            self.lb.selection_set(self.lb.get(0, END).index(pyboards[0]))
+
+    def serial_ports(self, refresh=False):
+        return [port for port, kind in self.scanner.scan(refresh)]
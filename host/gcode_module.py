@@ -123,6 +123,7 @@ class GcodeModule(Frame):
 
 
 from script import interpolate_gcode as interp
+from DoD import toolpath
 class GcodeProcessorDialog():
     def __init__(self, master, gcode_file):
         self.root = Tk()
@@ -136,6 +137,7 @@ class GcodeProcessorDialog():
 
 
         self.bt_interp = Button(self.frame, text='Interpolate!', command=self.interp_pressed)
+        self.bt_plan = Button(self.frame, text='Plan passes!', command=self.plan_pressed)
 
 
         self.frame.grid(row=1, column=1)
@@ -145,6 +147,7 @@ class GcodeProcessorDialog():
         self.lbl_spacing_unit.grid(row=1, column=3, sticky='W')
 
         self.bt_interp.grid(row=2, column=1)
+        self.bt_plan.grid(row=2, column=2)
 
         self.root.title('Interpolate Gcode')
         self.root.mainloop()
@@ -162,3 +165,20 @@ class GcodeProcessorDialog():
         self.master.selected_file = new_file
         self.master.open_pressed(select_new=False)
         self.root.destroy()
+
+    def plan_pressed(self):
+        # droplets along the paths, printed with all nozzles of the head, see DoD/toolpath.py
+        try:
+            entry = float(self.ent_spacing.get().strip())
+        except Exception as e:
+            print('Invalid entry')
+            return
+        with open(self.gcode_file) as f:
+            lines = toolpath.plan_vectors(f.readlines(), entry/1000)
+        new_file = self.gcode_file[:-3]+'.plan.nc'
+        with open(new_file, 'w') as f:
+            f.write('\n'.join(lines)+'\n')
+        print('%s droplets in %s P1 commands, %s passes' % toolpath.plan_stats(lines))
+        self.master.selected_file = new_file
+        self.master.open_pressed(select_new=False)
+        self.root.destroy()
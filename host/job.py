@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Precompiled print jobs
+
+Compiles G-code (interpolated, or planned with DoD.toolpath) into the binary job format of
+pyboard/main/job_runner.py: moves as integer step deltas, fires as ids into a table of decoded
+nozzle masks and waveform selections as ids into a table of waveform names. The board stores
+the job in flash with J1 and runs it with J2 from there, without USB or G-code parsing in the
+print loop; a stored job runs again with J2 alone.
+
+    python3 job.py gcode/Spiral.plan.nc --out spiral.job
+    python3 job.py gcode/Spiral.plan.nc --upload spiral --run
+
+Positions are rounded to whole steps once, on the absolute position, so rounding errors do not
+add up over the job.
+"""
+
+import os
+import sys
+import time
+import base64
+import struct
+import runpy
+import argparse
+
+import serial
+
+from latency import split_timing, FIRMWARE_CONFIG
+from waveforms import find_pyboard, send_commands
+
+
+# record opcodes, as in job_runner.py
+OP_END = 0
+OP_MOVE = 1
+OP_FIRE = 2
+OP_WAVE = 3
+OP_HOME = 4
+OP_FIRE_ALL = 5
+OP_SET = 6
+
+# P1 S parameter -> size id on the board (small, medium, large), medium for anything else
+SIZE_IDS = {'S': 0, 'M': 1, 'L': 2}
+
+# raw job bytes per J1 command, 256 characters of base64
+CHUNK = 192
+
+
+def steps_per_mm(config_path=FIRMWARE_CONFIG):
+    config = runpy.run_path(config_path)
+    return config['STAGE_STEPS_PER_REV'] * config['STAGE_MICROSTEPPING'] / config['STAGE_PITCH']
+
+
+def stage_range(config_path=FIRMWARE_CONFIG):
+    # travel in mm, the board refuses moves outside it
+    return tuple(runpy.run_path(config_path)['STAGE_RANGE'])
+
+
+def nozzle_mask(value):
+    # as sequence_table.mask() on the board: bytes with bit 0 of byte 0 for nozzle 1
+    value = value.strip()
+    if value[:1] == 'x':
+        number = int(value[1:] or '0', 16)
+        return number.to_bytes((number.bit_length() + 7) // 8, 'little')
+    mask = bytearray((len(value) + 7) // 8)
+    for i, c in enumerate(value):
+        if c == '1': mask[i >> 3] |= 1 << (i & 7)
+    return bytes(mask)
+
+
+def compile_job(lines, steps=None, travel=None):
+    """
+    Returns the job bytes and a dict of record counts per opcode name. Raises ValueError for a
+    move outside the travel of the stage (mm, from the firmware config by default).
+    """
+    steps = steps_per_mm() if steps is None else steps
+    travel = stage_range() if travel is None else travel
+    waveforms = []
+    masks = []
+    mask_ids = {}
+    records = []
+    counts = {}
+    position = [0, 0]
+
+    def emit(name, op, fmt='', *args):
+        records.append(struct.pack('<B' + fmt, op, *args))
+        counts[name] = counts.get(name, 0) + 1
+
+    for line in lines:
+        words = line.split(';')[0].split()
+        if not words: continue
+        code = dict((w[0], w[1:]) for w in words[1:] if w)
+        op = words[0]
+
+        if op in ('G0', 'G1') and ('X' in code or 'Y' in code):
+            target = [int(round(float(code['X']) * steps)) if 'X' in code else position[0],
+                      int(round(float(code['Y']) * steps)) if 'Y' in code else position[1]]
+            if not all(0 <= t <= int(round(r * steps)) for t, r in zip(target, travel)):
+                raise ValueError('%s: target out of range %s mm' % (line.strip(), travel))
+            # split moves that do not fit in a signed 16-bit delta
+            while target != position:
+                dx = max(-32768, min(32767, target[0] - position[0]))
+                dy = max(-32768, min(32767, target[1] - position[1]))
+                emit('move', OP_MOVE, 'hh', dx, dy)
+                position = [position[0] + dx, position[1] + dy]
+        elif op == 'G28':
+            emit('home', OP_HOME)
+            position = [0, 0]
+        elif op == 'G92':
+            position = [int(round(float(code.get('X', 0)) * steps)), int(round(float(code.get('Y', 0)) * steps))]
+            emit('set', OP_SET, 'ii', position[0], position[1])
+        elif op in ('P1', 'P2'):
+            if 'W' in code:
+                if code['W'] not in waveforms: waveforms.append(code['W'])
+                emit('wave', OP_WAVE, 'B', waveforms.index(code['W']))
+            size = SIZE_IDS.get(code.get('S', 'M'), 1)
+            if op == 'P2':
+                emit('fire all', OP_FIRE_ALL, 'B', size)
+                continue
+            cyan = nozzle_mask(code.get('C', '0'))
+            key = (nozzle_mask(code.get('B', '0')), cyan, nozzle_mask(code['M']) if 'M' in code else cyan,
+                   nozzle_mask(code['Y']) if 'Y' in code else cyan, size)
+            if key not in mask_ids:
+                mask_ids[key] = len(masks)
+                masks.append(key)
+            emit('fire', OP_FIRE, 'H', mask_ids[key])
+    emit('end', OP_END)
+
+    data = b'JOB1' + struct.pack('<HH', len(waveforms), len(masks))
+    for name in waveforms:
+        data += struct.pack('<B', len(name)) + name.encode()
+    for black, cyan, magenta, yellow, size in masks:
+        data += struct.pack('<B', size)
+        for mask in (black, cyan, magenta, yellow):
+            data += struct.pack('<B', len(mask)) + mask
+    counts['masks'] = len(masks)
+    return data + b''.join(records), counts
+
+
+def upload(ser, name, data, chunk=CHUNK, timeout=10):
+    """
+    Sends the job in J1 chunks, returns the responses without timing.
+    """
+    commands = ['J1 N%s O%d D%s\n' % (name, offset, base64.b64encode(data[offset:offset + chunk]).decode('ascii'))
+                for offset in range(0, len(data), chunk)]
+    return send_commands(ser, commands, timeout)
+
+
+def run(ser, name, timeout=None):
+    ser.write(('J2 N%s\n' % name).encode('ascii'))
+    end = None if timeout is None else time.monotonic() + timeout
+    while end is None or time.monotonic() < end:
+        line = ser.readline().decode('ascii', errors='replace').strip()
+        if line: return split_timing(line)[0]
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile G-code into a job for the board and optionally store and run it')
+    parser.add_argument('gcode')
+    parser.add_argument('-o', '--out', help='write the job file')
+    parser.add_argument('-u', '--upload', metavar='NAME', help='store the job on the board under NAME')
+    parser.add_argument('-r', '--run', action='store_true', help='run the stored job')
+    parser.add_argument('-p', '--port', help='serial port of the pyboard, found by USB id by default')
+    args = parser.parse_args(argv)
+
+    with open(args.gcode) as f:
+        lines = f.readlines()
+    data, counts = compile_job(lines)
+    text = sum(len(l.strip()) + 1 for l in lines if l.strip() and l.strip()[0] in 'GP')
+    print('%d bytes (G-code %d bytes): %s' % (len(data), text, ', '.join('%s %d' % c for c in sorted(counts.items()))))
+
+    if args.out:
+        with open(args.out, 'wb') as f:
+            f.write(data)
+    if not (args.upload or args.run): return
+
+    name = args.upload or os.path.splitext(os.path.basename(args.gcode))[0].split('.')[0]
+    port = args.port or find_pyboard()
+    if port is None: sys.exit('No pyboard found')
+    with serial.Serial(port, timeout=0.5) as ser:
+        if args.upload:
+            responses = upload(ser, name, data)
+            print(responses[-1] if responses else 'No response')
+            if len(responses) < (len(data) + CHUNK - 1) // CHUNK or not responses[-1].startswith('Stored job'):
+                sys.exit('Upload failed: %s' % responses)
+        if args.run:
+            print(run(ser, name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Per-command latency report
+
+With PROFILE = True in pyboard/main/config.py the board appends its phase times in us to every
+response ('<response> |T parse=.. move=.. fire=.. total=..'). ConnectModule.send_command logs
+them with the round trip time in log.txt, see StatusModule.log(). This tool sums them per opcode
+(G1, P1, ...) and over time, the part of the round trip the board did not account for is USB and
+host time ('usb').
+
+    python3 latency.py log.txt
+    python3 latency.py --standin gcode/Spiral.nc
+
+--standin replays a G-code file against a local stand-in of the board that models the move and
+fire times from the firmware config, to compare jobs without the printer.
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import runpy
+import argparse
+
+
+TIMING_RE = re.compile(r' \|T ((?:\w+=-?\d+ ?)+)\s*$')
+
+PHASES = ['usb', 'parse', 'move', 'fire']
+
+FIRMWARE_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pyboard', 'main', 'config.py')
+
+
+def split_timing(response):
+    """
+    Splits a board response in the text and a dict of phase times in us, the dict is empty
+    when the board does not profile.
+    """
+    match = TIMING_RE.search(response)
+    if not match: return response, {}
+    phases = {}
+    for item in match.group(1).split():
+        name, value = item.split('=')
+        phases[name] = int(value)
+    return response[:match.start()], phases
+
+
+class BoardStandIn():
+    """
+    Local stand-in of the pyboard firmware. Moves take the time of the step pulses at the
+    maximum step frequency (acceleration is ignored), P1/P2 take fire_us, colour nozzles are
+    refused as by the firmware. G0/G1 are answered when queued, the next other command waits
+    for the moves as in the firmware. Responses carry the same timing suffix as the firmware with PROFILE = True.
+    """
+    def __init__(self, config_path=FIRMWARE_CONFIG, fire_us=200, usb_us=1000):
+        config = runpy.run_path(config_path)
+        self.steps_per_mm = config['STAGE_STEPS_PER_REV'] * config['STAGE_MICROSTEPPING'] / config['STAGE_PITCH']
+        self.max_freq = config['STAGE_MAX_FREQ']
+        self.valid_gcodes = config['VALID_GCODES']
+        self.fire_us = fire_us
+        self.usb_us = usb_us
+        self.position = [0.0, 0.0]
+        self.moving_us = 0
+
+    def execute_command(self, command):
+        words = command.split()
+        if not words or words[0] not in self.valid_gcodes:
+            return 'Invalid command: ' + command + ' |T total=0'
+        gcode = dict((w[0], w[1:]) for w in words)
+        phases = [('parse', 20 + 5 * len(words))]
+
+        if words[0] in ('G0', 'G1') and 'X' in gcode and 'Y' in gcode:
+            target = [float(gcode['X']), float(gcode['Y'])]
+            # both axes step one after the other, as _move_square() does
+            steps = sum(abs(t - p) for t, p in zip(target, self.position)) * self.steps_per_mm
+            self.position = target
+            self.moving_us += int(steps / self.max_freq * 1e6)
+            response = 'Queued move to [%s, %s]' % (gcode['X'], gcode['Y'])
+            total = sum(t for name, t in phases)
+            return '%s |T %s total=%d' % (response, ' '.join('%s=%d' % p for p in phases), total)
+
+        # everything else waits until the queued moves are done
+        phases.append(('move', self.moving_us))
+        self.moving_us = 0
+        if words[0] in ('P1', 'P2') and any(gcode.get(k, '').strip('x0') for k in 'CMY'):
+            # the sequence table has black data only, see sequenceTable.check()
+            response = 'execute_gcode() failed: no colour nozzle data'
+        elif words[0] in ('P1', 'P2'):
+            phases.append(('fire', self.fire_us))
+            response = 'Queued'
+        else:
+            response = 'OK'
+
+        total = sum(t for name, t in phases)
+        return '%s |T %s total=%d' % (response, ' '.join('%s=%d' % p for p in phases), total)
+
+    def replay(self, lines):
+        # log records as ConnectModule.send_command writes them, time advances by the modelled round trips
+        records = []
+        now = 0.0
+        for line in lines:
+            line = line.split(';')[0].strip()
+            if not line or line[0] not in 'GP' or line.startswith('G28'): continue
+            response = self.execute_command(line)
+            text, phases = split_timing(response)
+            latency = (phases.get('total', 0) + self.usb_us) / 1000
+            records.append({'time': now, 'command': line, 'response': text, 'latency': latency, 'phases': phases})
+            now += latency / 1000
+        return records
+
+
+def load_records(path):
+    """
+    Command records of a log file and its rotations (path.N ... path.1, path), oldest first.
+    Phase times from old logs without a 'phases' field are taken from the response.
+    """
+    paths = []
+    k = 1
+    while os.path.exists('%s.%d' % (path, k)):
+        paths.insert(0, '%s.%d' % (path, k))
+        k += 1
+    paths.append(path)
+
+    records = []
+    for p in paths:
+        if not os.path.exists(p): continue
+        with open(p) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict) or 'command' not in record or record.get('latency') is None: continue
+                if 'phases' not in record:
+                    record['response'], record['phases'] = split_timing(record.get('response', ''))
+                records.append(record)
+    return records
+
+
+def phase_times(record):
+    # phase times of one command in ms, 'usb' is the round trip minus the time on the board
+    phases = record.get('phases') or {}
+    times = dict((name, phases.get(name, 0) / 1000) for name in PHASES[1:])
+    times['usb'] = record['latency'] - phases['total'] / 1000 if 'total' in phases else record['latency']
+    return times
+
+
+def opcode(record):
+    words = record['command'].split()
+    return words[0] if words else '?'
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def histogram(values, width=40):
+    # log2 bins of latency in ms
+    bins = {}
+    for v in values:
+        b = math.floor(math.log2(v)) if v > 0 else -20
+        bins[b] = bins.get(b, 0) + 1
+    most = max(bins.values())
+    lines = []
+    for b in range(min(bins), max(bins) + 1):
+        n = bins.get(b, 0)
+        label = '%9.3f-%-9.3f ms' % (2.0 ** b, 2.0 ** (b + 1))
+        lines.append('  %s %6d %s' % (label, n, '#' * int(round(width * n / most))))
+    return lines
+
+
+def report(records, interval=1.0):
+    lines = []
+    if not records: return ['No command records']
+
+    total = sum(r['latency'] for r in records)
+    lines.append('%d commands, %.1f ms round trip in total' % (len(records), total))
+    lines.append('')
+
+    groups = {}
+    for r in records: groups.setdefault(opcode(r), []).append(r)
+    lines.append('%-6s %7s %10s %9s %9s %9s  ' % ('opcode', 'count', 'total ms', 'mean', 'p50', 'p95') +
+                 ' '.join('%9s' % p for p in PHASES))
+    for name in sorted(groups, key=lambda n: -sum(r['latency'] for r in groups[n])):
+        group = groups[name]
+        latencies = [r['latency'] for r in group]
+        sums = dict((p, sum(phase_times(r)[p] for r in group)) for p in PHASES)
+        lines.append('%-6s %7d %10.1f %9.3f %9.3f %9.3f  ' % (name, len(group), sum(latencies), sum(latencies) / len(group),
+                                                              percentile(latencies, 0.5), percentile(latencies, 0.95)) +
+                     ' '.join('%9.1f' % sums[p] for p in PHASES))
+
+    for name in sorted(groups):
+        lines.append('')
+        lines.append('%s round trip histogram' % name)
+        lines += histogram([r['latency'] for r in groups[name]])
+
+    # timeline: ms spent per phase in every interval of the job
+    lines.append('')
+    lines.append('timeline (%g s per line, ms per phase)' % interval)
+    lines.append('%8s %7s  ' % ('t s', 'count') + ' '.join('%9s' % p for p in PHASES))
+    start = records[0].get('time', 0)
+    slots = {}
+    for r in records:
+        k = int((r.get('time', start) - start) // interval)
+        slot = slots.setdefault(k, dict((p, 0.0) for p in PHASES + ['count']))
+        slot['count'] += 1
+        for p, t in phase_times(r).items(): slot[p] += t
+    for k in sorted(slots):
+        slot = slots[k]
+        lines.append('%8.1f %7d  ' % (k * interval, slot['count']) + ' '.join('%9.1f' % slot[p] for p in PHASES))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Latency report per opcode and over time')
+    parser.add_argument('log', nargs='?', default='log.txt', help='log file written by the host GUI')
+    parser.add_argument('--standin', metavar='GCODE', help='replay a G-code file against the board stand-in instead')
+    parser.add_argument('--fire-us', type=float, default=200, help='stand-in time per firing in us')
+    parser.add_argument('--usb-us', type=float, default=1000, help='stand-in USB and host time per command in us')
+    parser.add_argument('-i', '--interval', type=float, default=1.0, help='timeline interval in s')
+    args = parser.parse_args(argv)
+
+    if args.standin:
+        with open(args.standin) as f:
+            records = BoardStandIn(fire_us=args.fire_us, usb_us=args.usb_us).replay(f)
+    else:
+        records = load_records(args.log)
+    print('\n'.join(report(records, args.interval)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+#!/bin/sh
+# Compile the printhead timing, copy the changed firmware files in pyboard/main to the pyboard and reset it.
+# Usage: script/flash_pyboard.sh [device] [extra pyboard.py options, e.g. --mpy]
+DIR="$(cd "$(dirname "$0")/../.." && pwd)"
+DEVICE="${1:-/dev/ttyACM0}"
+[ $# -gt 0 ] && shift
+(cd "$DIR/host" && python3 timing.py) || exit 1
+python3 "$DIR/pyboard/pyboard.py" --device "$DEVICE" --sync "$DIR/pyboard/main" "$@" -c "import machine; machine.reset()"
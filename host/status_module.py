@@ -1,6 +1,79 @@
 from tkinter import *
 import tkinter
 import os
+import json
+import time
+import queue
+import atexit
+import threading
+
+
+# refresh interval of the status bar in ms, status updates in between only keep the last text
+STATUS_REFRESH = 100
+
+
+class AsyncLogger():
+    """
+    Writes JSON-lines records from a background thread, the caller only puts the record in a
+    queue. Records are written in batches with one flush per batch, the file is rotated to
+    <path>.1, <path>.2, ... when it gets larger than max_bytes.
+    """
+    def __init__(self, path, max_bytes=1000000, backups=3, flush_interval=0.5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+
+        open(self.path, 'w').close()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log(self, **record):
+        record.setdefault('time', time.time())
+        self.queue.put(record)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def rotate(self):
+        for k in range(self.backups - 1, 0, -1):
+            if os.path.exists('%s.%d' % (self.path, k)):
+                os.replace('%s.%d' % (self.path, k), '%s.%d' % (self.path, k + 1))
+        if self.backups:
+            os.replace(self.path, self.path + '.1')
+        else:
+            open(self.path, 'w').close()
+
+    def run(self):
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # everything that arrived in the meantime goes in the same write
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [record for record in batch if record is not None]
+
+            try:
+                with open(self.path, 'a') as f:
+                    f.write(''.join(json.dumps(record, default=str) + '\n' for record in batch))
+                    size = f.tell()
+                if size > self.max_bytes:
+                    self.rotate()
+            except Exception as e:
+                print('Logging failed: %s' % (e))
+
 
 class StatusModule():
     def __init__(self, root, master):
@@ -17,13 +90,15 @@ class StatusModule():
         self.status_light = Label(self.frame, image=self.red_light)
 
         self.status_bar = Label(self.frame)
-        self.log_file = 'log.txt'
-        self.log = open(self.log_file, 'w')
-        self.log.close()
+        self.log_path = 'log.txt'
+        self.logger = AsyncLogger(self.log_path)
+        self.status_text = None
 
         self.status_light.grid(row=1, column=1, padx=10)
         self.status_bar.grid(row=1, column=2)
 
+        self.root.after(STATUS_REFRESH, self.refresh_status)
+
 
     def set_status_light(self, color):
         if color == 'green': self.status_light['image'] = self.green_light
@@ -34,12 +109,19 @@ class StatusModule():
         self.status_bar['text'] = txt
         self.status_bar.grid(row=1, column=2)
 
-    def log_file(self, txt):
-        self.set_status(txt)
-        self.master.root.update_idletasks()
-        try:
-            self.log = open(self.log_file, 'a')
-            self.log.write(txt+'\n')
-            self.log.close()
-        except Exception:
-            pass
+    def refresh_status(self):
+        # shown by the Tk loop, never from the print path
+        if self.status_text is not None:
+            self.set_status(self.status_text)
+            self.status_text = None
+        self.root.after(STATUS_REFRESH, self.refresh_status)
+
+    def log(self, txt=None, status=True, **fields):
+        """
+        Log a message and/or fields such as command, response and latency, returns at once.
+        With status the message is shown in the status bar at the next refresh.
+        """
+        if txt is not None:
+            fields['message'] = txt
+            if status: self.status_text = txt
+        self.logger.log(**fields)
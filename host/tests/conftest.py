@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the host tools import the DoD package from the host folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,53 @@
+"""
+The G-code generators read the health map of the printer folder (prns/<prnname>) and never
+fire a dead nozzle.
+"""
+import numpy as np
+from PIL import Image
+
+from DoD import nozzle_health
+from DoD.bitmap import convert_image
+from DoD import toolpath
+
+DEAD = [1, 2, 3]
+
+
+def _health_map(tmp_path, monkeypatch):
+    # black row (00) of the sx235w with nozzles 1-3 dead
+    folder = tmp_path / 'sx235w'
+    folder.mkdir()
+    states = ''.join('0' if n in DEAD else '1' for n in range(1, 91))
+    (folder / 'sx235w-nozzles.txt').write_text('# nozzle health sx235w\n00 %s\n' % states)
+    monkeypatch.setattr(nozzle_health, 'prns_dir', str(tmp_path))
+    monkeypatch.setattr(nozzle_health, '_health_cache', {})
+
+
+def _masks(path):
+    with open(path) as f:
+        fires = [line.split() for line in f if line.startswith('P1')]
+    assert fires
+    return [int(fire[1][2:], 16) for fire in fires]
+
+
+def _dead_bits():
+    return sum(1 << (n - 1) for n in DEAD)
+
+
+def test_image_gcode_skips_dead_nozzles(tmp_path, monkeypatch):
+    _health_map(tmp_path, monkeypatch)
+    image = tmp_path / 'black.png'
+    Image.fromarray(np.zeros((90, 4), dtype=np.uint8)).save(str(image))
+    output = convert_image(str(image), str(tmp_path / 'black.gcode'), 4 / 1440, 90 / 120, gcode=True)
+    masks = _masks(output)
+    assert all(mask & _dead_bits() == 0 for mask in masks)
+    # the rows of the dead nozzles are printed by shifted working nozzles
+    assert any(mask & 1 << 3 for mask in masks)
+
+
+def test_toolpath_health_skips_dead_nozzles(tmp_path, monkeypatch):
+    _health_map(tmp_path, monkeypatch)
+    gcode = tmp_path / 'lines.gcode'
+    gcode.write_text(''.join('G0 X0 Y%.3f\nG1 X1 Y%.3f\n' % (y * 0.2, y * 0.2) for y in range(30)))
+    output = tmp_path / 'planned.gcode'
+    toolpath.main([str(gcode), str(output), '--health', 'SX235W'])
+    assert all(mask & _dead_bits() == 0 for mask in _masks(output))
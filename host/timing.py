@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Printhead timing compiler
+
+Compiles the declarative timing in timing_spec.py into a word template and patch offsets for the
+firmware, see pyboard/main/sequence_table.py. The template holds the words for a firing without
+any nozzle; a nozzle is added by OR-ing its patch masks into the template at the patch offsets.
+
+    python3 timing.py                   compile, check and write pyboard/main/sequence.bin
+    python3 timing.py --check           only compile and check
+
+The output is checked word for word against SequenceFactory.get_sequence2() of the firmware for
+no nozzles, all nozzles, every single nozzle and random nozzle sets before anything is written.
+
+Table file (little endian): b'SEQ1', number of words (2 bytes), number of patches (2), the words
+(2 each), then per patch channel (1), nozzle (1), droplet sizes (1, bit 0 small, 1 medium,
+2 large), offset (2) and mask (2).
+"""
+
+import os
+import sys
+import random
+import struct
+import runpy
+import argparse
+
+import timing_spec
+from latency import FIRMWARE_CONFIG
+
+
+FIRMWARE_DIR = os.path.normpath(os.path.dirname(FIRMWARE_CONFIG))
+TABLE_FILE = os.path.join(FIRMWARE_DIR, 'sequence.bin')
+
+
+def gpio_bits(config_path=FIRMWARE_CONFIG):
+    # signal name -> bit of the output word, from the GPIO_<name> constants of the firmware
+    config = runpy.run_path(config_path)
+    return dict((name[5:], value) for name, value in config.items() if name.startswith('GPIO_'))
+
+
+def compile_sequence(sequence=timing_spec.SEQUENCE, idle=timing_spec.IDLE, gpio=None):
+    """
+    Returns the template (list of words) and the patches as (channel, nozzle, sizes, offset, mask).
+    """
+    gpio = gpio_bits() if gpio is None else gpio
+    words = []
+    patches = []
+    for phase in sequence:
+        period = phase.get('period', 1)
+        samples = phase['clocks'] * period if 'clocks' in phase else phase['samples']
+        start = len(words)
+
+        levels = dict(idle, **phase.get('levels', {}))
+        level = sum(1 << gpio[name] for name, value in levels.items() if value)
+        words.extend([level] * samples)
+
+        for name, (first, width) in phase.get('pulses', {}).items():
+            for i in range(start + first, start + first + width): words[i] |= 1 << gpio[name]
+        for name, (first, width) in phase.get('clock', {}).items():
+            for c in range(phase.get('clocks', 0)):
+                for i in range(start + c * period + first, start + c * period + first + width): words[i] |= 1 << gpio[name]
+
+        for bits in phase.get('bits', []):
+            channel = timing_spec.CHANNELS.index(bits['channel'])
+            sizes = sum(1 << timing_spec.SIZES.index(s) for s in bits.get('sizes', timing_spec.SIZES))
+            stride = period // bits['per_clock']
+            for k in range(phase['clocks'] * bits['per_clock']):
+                for i in range(bits['width']):
+                    offset = start + bits['offset'] + k * stride + i
+                    patches.append((channel, bits['first'] + k, sizes, offset, 1 << gpio[bits['signal']]))
+    for channel, nozzle, sizes, offset, mask in patches:
+        if not 0 <= offset < len(words): raise ValueError('patch of nozzle %d outside the sequence' % nozzle)
+        if words[offset] & mask: raise ValueError('patch of nozzle %d on a high template bit' % nozzle)
+    return words, patches
+
+
+def apply(words, patches, nozzles, size='medium'):
+    # what the firmware does: nozzles is a dict channel name -> nozzle numbers
+    size_bit = 1 << timing_spec.SIZES.index(size)
+    selected = set((timing_spec.CHANNELS.index(c), n) for c, ns in nozzles.items() for n in ns)
+    out = list(words)
+    for channel, nozzle, sizes, offset, mask in patches:
+        if sizes & size_bit and (channel, nozzle) in selected: out[offset] |= mask
+    return out
+
+
+def pack(words, patches):
+    data = b'SEQ1' + struct.pack('<HH', len(words), len(patches))
+    data += struct.pack('<%dH' % len(words), *words)
+    for patch in patches:
+        data += struct.pack('<BBBHH', *patch)
+    return data
+
+
+def reference_factory():
+    # SequenceFactory of the firmware, it imports the firmware config
+    sys.path.insert(0, FIRMWARE_DIR)
+    try:
+        return runpy.run_path(os.path.join(FIRMWARE_DIR, 'sequence_factory.py'))['SequenceFactory']()
+    finally:
+        sys.path.remove(FIRMWARE_DIR)
+
+
+def check(words, patches, trials=200, seed=1):
+    """
+    Compares the compiled output with get_sequence2() word for word, returns a list of failures.
+    """
+    factory = reference_factory()
+    rng = random.Random(seed)
+    cases = [[], list(range(1, 91))] + [[n] for n in range(0, 91)]
+    cases += [sorted(rng.sample(range(1, 91), rng.randint(1, 90))) for i in range(trials)]
+
+    failures = []
+    for black in cases:
+        colour = black[:30]
+        for size in timing_spec.SIZES:
+            expected = factory.get_sequence2(nozzles_black=black, nozzles_cyan=colour, nozzles_magenta=colour,
+                                             nozzles_yellow=colour, size=size)
+            got = apply(words, patches, {'black': black, 'cyan': colour, 'magenta': colour, 'yellow': colour}, size)
+            if got != expected:
+                first = next((i for i, (a, b) in enumerate(zip(got, expected)) if a != b), min(len(got), len(expected)))
+                failures.append('size %s, black %s: %d words instead of %d, first difference at word %d' %
+                                (size, black, len(got), len(expected), first))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile timing_spec.py into the sequence table of the firmware')
+    parser.add_argument('-o', '--out', default=TABLE_FILE, help='table file, copy it to the board with pyboard.py --sync')
+    parser.add_argument('--check', action='store_true', help='only compile and check against get_sequence2()')
+    args = parser.parse_args(argv)
+
+    words, patches = compile_sequence()
+    failures = check(words, patches)
+    for failure in failures[:10]: print(failure)
+    if failures: sys.exit('%d mismatches with get_sequence2(), nothing written' % len(failures))
+    print('%d words, %d patches, identical to get_sequence2()' % (len(words), len(patches)))
+
+    if not args.check:
+        with open(args.out, 'wb') as f:
+            f.write(pack(words, patches))
+        print('Wrote %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
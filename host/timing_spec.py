@@ -0,0 +1,42 @@
+"""
+Timing of the printhead control signals for one firing, compiled by timing.py
+
+Every phase lasts `samples` samples of the output engine, or `clocks` periods of `period`
+samples. Signals are named as in pyboard/main/config.py (GPIO_<name>).
+
+    levels      signal levels during the phase, IDLE for the signals not given
+    pulses      signal: [start, width], high once, relative to the start of the phase
+    clock       signal: [start, width], high in every clock period
+    bits        nozzle data: the bit of nozzle first+k is high on `width` samples from
+                offset + k * period / per_clock, on `signal`; `sizes` limits the droplet
+                sizes the block is used for (all sizes when left out)
+"""
+
+IDLE = {'NCHG': 1}
+
+# CH pulse in the middle of a 48 sample NCHG low period
+PULSE = {'samples': 48, 'levels': {'NCHG': 0}, 'pulses': {'CH': [24, 12]}}
+
+DATA_BLOCK = {'clocks': 32, 'period': 4, 'clock': {'CK': [0, 2]},
+              'bits': [{'channel': 'black', 'signal': 'SIBL', 'first': 0, 'per_clock': 2, 'width': 2, 'offset': -1}]}
+
+SEQUENCE = [
+    {'name': 'start', 'samples': 1},
+    dict(PULSE, name='first pulse', pulses={'CH': [24, 12], 'LAT': [0, 12]}),
+    {'name': 'idle', 'samples': 440},
+    dict(PULSE, name='second pulse'),
+    {'name': 'idle', 'samples': 56},
+    dict(DATA_BLOCK, name='data block 1'),
+    {'name': 'idle', 'samples': 151},
+    dict(PULSE, name='third pulse'),
+    {'name': 'idle', 'samples': 56},
+    dict(DATA_BLOCK, name='data block 2'),
+    {'name': 'idle', 'samples': 151},
+    dict(PULSE, name='fourth pulse'),
+    {'name': 'idle', 'samples': 27},
+    {'name': 'quality block', 'clocks': 16, 'period': 4, 'clock': {'CK': [0, 2]}, 'levels': {'SIBL': 1, 'SICL': 1}},
+    {'name': 'end', 'samples': 1},
+]
+
+CHANNELS = ['black', 'cyan', 'magenta', 'yellow']
+SIZES = ['small', 'medium', 'large']
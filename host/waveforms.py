@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Waveform sweeps for drop formation tuning
+
+Builds variants of the piezo waveform in pyboard/main/config.py (amplitude around the rest level,
+stretched or compressed in time) and stores them in the waveform table of the board, see
+printheadController.store_waveform(). The samples are normalised to 8 bit here, so the board only
+copies them; P1 ... W<slot or name> selects one per firing.
+
+    python3 waveforms.py --amplitude 0.8 0.9 1.0 --stretch 1 1.25
+    python3 waveforms.py --amplitude 0.9 1.1 --write waveforms.bin
+
+All W1 commands of a sweep and the W2 that saves the table go out in one write, the responses
+are read afterwards. --write only writes the table file, which pyboard.py --sync or fs_put can
+copy to /flash instead (the board loads it at boot).
+"""
+
+import sys
+import time
+import base64
+import struct
+import runpy
+import argparse
+
+import serial
+from serial.tools import list_ports
+
+from latency import split_timing, FIRMWARE_CONFIG
+
+
+PYBOARD_VID = 0xf055
+
+
+def normalise(values):
+    # as the firmware does with config.WAVEFORM: 0 .. max(values) to 0 .. 255
+    factor = max(values)
+    return bytes(int(255 * (v / factor)) for v in values)
+
+
+def scaled(samples, amplitude, rest=None):
+    # amplitude around the rest level, by default the first sample
+    rest = samples[0] if rest is None else rest
+    return bytes(min(255, max(0, int(round(rest + (s - rest) * amplitude)))) for s in samples)
+
+
+def stretched(samples, factor):
+    # resampled to round(n * factor) samples by linear interpolation
+    n = max(2, int(round(len(samples) * factor)))
+    out = []
+    for k in range(n):
+        t = k * (len(samples) - 1) / (n - 1)
+        i = min(int(t), len(samples) - 2)
+        out.append(int(round(samples[i] + (samples[i + 1] - samples[i]) * (t - i))))
+    return bytes(out)
+
+
+def sweep(base, amplitudes=(1,), stretches=(1,), us_per_sample=0.125, first_slot=1):
+    """
+    One waveform per combination of amplitude and stretch, as (slot, name, samples, us_per_sample).
+    The name (at most 8 characters) holds both in percent: a90s125 is 90 % amplitude, 125 % length.
+    """
+    waveforms = []
+    slot = first_slot
+    for a in amplitudes:
+        for s in stretches:
+            name = 'a%ds%d' % (round(a * 100), round(s * 100))
+            waveforms.append((slot, name, stretched(scaled(base, a), s), us_per_sample))
+            slot += 1
+    return waveforms
+
+
+def upload_command(slot, name, samples, us_per_sample):
+    return 'W1 I%d N%s T%g D%s\n' % (slot, name, us_per_sample, base64.b64encode(bytes(samples)).decode('ascii'))
+
+
+def table_bytes(waveforms):
+    # same layout as printheadController.save_waveforms()
+    data = b'WAVE'
+    for slot, name, samples, us in waveforms:
+        data += struct.pack('<BHH8s', slot, len(samples), int(us * 1000 + 0.5), name.encode()) + bytes(samples)
+    return data
+
+
+def find_pyboard():
+    for port in sorted(list_ports.comports(), key=lambda p: p.device):
+        if port.vid == PYBOARD_VID: return port.device
+    return None
+
+
+def send_commands(ser, commands, timeout=5, window=None):
+    """
+    Sends the commands in writes of at most `window` commands (config.COMMAND_QUEUE, what the
+    board queues, it refuses more) and waits for their responses in between. Returns the
+    responses without timing, fewer than the commands after a timeout.
+    """
+    window = runpy.run_path(FIRMWARE_CONFIG)['COMMAND_QUEUE'] if window is None else window
+    ser.reset_input_buffer()
+    responses = []
+    end = time.monotonic() + timeout
+    for first in range(0, len(commands), window):
+        batch = commands[first:first + window]
+        ser.write(''.join(batch).encode('ascii'))
+        while len(responses) < first + len(batch) and time.monotonic() < end:
+            line = ser.readline().decode('ascii', errors='replace').strip()
+            if line: responses.append(split_timing(line)[0])
+        if len(responses) < first + len(batch): break
+    return responses
+
+
+def push(ser, waveforms, save=True, timeout=5):
+    """
+    Sends all waveforms (and W2 with save), returns the responses without timing.
+    """
+    commands = [upload_command(*w) for w in waveforms]
+    if save: commands.append('W2\n')
+    return send_commands(ser, commands, timeout)
+
+
+def main(argv=None):
+    config = runpy.run_path(FIRMWARE_CONFIG)
+    parser = argparse.ArgumentParser(description='Upload a sweep of piezo waveforms to the waveform table of the board')
+    parser.add_argument('-p', '--port', help='serial port of the pyboard, found by USB id by default')
+    parser.add_argument('-a', '--amplitude', type=float, nargs='+', default=[1.0], help='amplitudes relative to config.WAVEFORM')
+    parser.add_argument('-s', '--stretch', type=float, nargs='+', default=[1.0], help='lengths relative to config.WAVEFORM')
+    parser.add_argument('-t', '--us-per-sample', type=float, default=config['WAVEFORM_US_PER_SAMPLE'])
+    parser.add_argument('--first-slot', type=int, default=1)
+    parser.add_argument('--no-save', action='store_true', help='do not save the table to flash')
+    parser.add_argument('--write', metavar='FILE', help='write the table file instead of sending it')
+    args = parser.parse_args(argv)
+
+    waveforms = sweep(normalise(config['WAVEFORM']), args.amplitude, args.stretch, args.us_per_sample, args.first_slot)
+    last = args.first_slot + len(waveforms) - 1
+    if args.first_slot < 1 or last >= config['WAVEFORM_SLOTS']:
+        parser.error('slots %d-%d do not fit the table, slot 0 is config.WAVEFORM and the last is %d' %
+                     (args.first_slot, last, config['WAVEFORM_SLOTS'] - 1))
+    for slot, name, samples, us in waveforms:
+        if len(samples) > config['WAVEFORM_MAX_SAMPLES']:
+            parser.error('%s has %d samples, at most %d fit' % (name, len(samples), config['WAVEFORM_MAX_SAMPLES']))
+
+    if args.write:
+        with open(args.write, 'wb') as f:
+            f.write(table_bytes(waveforms))
+        print('Wrote %d waveforms to %s' % (len(waveforms), args.write))
+        return
+
+    port = args.port or find_pyboard()
+    if port is None: sys.exit('No pyboard found')
+    with serial.Serial(port, timeout=0.5) as ser:
+        for response in push(ser, waveforms, not args.no_save):
+            print(response)
+    for slot, name, samples, us in waveforms:
+        print('P1 ... W%d  or  W%s  %d samples' % (slot, name, len(samples)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,27 @@
 import pyb
 from motion_stage_controller import stageController
 from printhead_controller import printheadController
+from job_runner import jobRunner
 import config
 import machine
+import time
+import ubinascii
+
+# G-codes that step the stage themselves, their functions are coroutines
+ASYNC_GCODES = ('G28', 'J2')
 
 class commandInterpreter():
     def __init__(self, stage_controller, printhead_controller):
         self.stage_controller = stage_controller
         self.printhead_controller = printhead_controller
+        self.job_runner = jobRunner(stage_controller, printhead_controller)
 
         self.valid_gcodes = config.VALID_GCODES
 
+        # phase timing, see config.PROFILE
+        self.profile = config.PROFILE
+        self.phases = []
+        self.t_phase = 0
 
 
     def _get_gcode_components(self, gcode):
@@ -25,17 +36,39 @@ class commandInterpreter():
 
     def _is_gcode(self, command):
         try:
-            if command.split(' ')[0][0] == 'G' or command.split(' ')[0][0] == 'P':
+            if command.split(' ')[0][0] in 'GPWJ':
                 return command.split(' ')[0] in self.valid_gcodes
         except Exception as e:
             return False
         return False
 
 
-    def execute_command(self, command):
+    def _mark(self, phase):
+        # time since the previous mark is booked on phase
+        if not self.profile: return
+        t = time.ticks_us()
+        self.phases.append((phase, time.ticks_diff(t, self.t_phase)))
+        self.t_phase = t
+
+
+    async def execute_command(self, command):
+        # a coroutine, homing and jobs let the other tasks run, see ASYNC_GCODES
+        if not self.profile: return await self._execute_command(command)
+
+        t_start = time.ticks_us()
+        self.phases = []
+        self.t_phase = t_start
+        response = await self._execute_command(command)
+        timing = ' '.join('%s=%d' % p for p in self.phases)
+        return '%s |T %s total=%d' % (response, timing, time.ticks_diff(time.ticks_us(), t_start))
+
+
+    async def _execute_command(self, command):
+        # commands arrive with or without their newline
+        command = command.strip()
         try:
             if self._is_gcode(command):
-                return self.execute_gcode(command)
+                return await self.execute_gcode(command)
             elif command in config.VALID_COMMANDS:
                 if command == 'RESET': machine.reset()
             return 'Invalid command: '+str(command)
@@ -43,7 +76,7 @@ class commandInterpreter():
             return 'execute_command() failed: '+str(e)
 
 
-    def execute_gcode(self, gcode):
+    async def execute_gcode(self, gcode):
 
         function_dict = {'G0':self._G1,
                          'G1':self._G1,
@@ -52,11 +85,20 @@ class commandInterpreter():
                          'G28': self._G28,
                          'G92': self._G92,
                          'P1': self._P1,
-                         'P2': self._P2}
+                         'P2': self._P2,
+                         'W1': self._W1,
+                         'W2': self._W2,
+                         'W3': self._W3,
+                         'J1': self._J1,
+                         'J2': self._J2}
 
         gcode_dict = self._get_gcode_components(gcode)
+        self._mark('parse')
 
-        try: return function_dict[gcode.split(' ')[0]](gcode_dict)
+        op = gcode.split(' ')[0]
+        try:
+            if op in ASYNC_GCODES: return await function_dict[op](gcode_dict)
+            return function_dict[op](gcode_dict)
         except Exception as e: return 'execute_gcode() failed: '+str(e)
 
         return 'execute_gcode() failed: something went really wrong'
@@ -65,8 +107,12 @@ class commandInterpreter():
     def _G1(self, gcode_dict):
         if 'X' not in gcode_dict: return 'Missing X coordinate in Gcode'
         if 'Y' not in gcode_dict: return 'Missing Y coordinate in Gcode'
-        self.stage_controller.move_to_position((float(gcode_dict['X']), float(gcode_dict['Y'])))
-        return 'Moved stage to ['+gcode_dict['X']+', '+gcode_dict['Y']+']'
+        self.printhead_controller.flush()
+        self._mark('fire')
+        error = self.stage_controller.queue_position((gcode_dict['X'], gcode_dict['Y']))
+        self._mark('move')
+        if error: return error
+        return 'Queued move to ['+gcode_dict['X']+', '+gcode_dict['Y']+']'
 
     def _G10(self, gcode_dict):
         self.stage_controller.enable_stages(False)
@@ -76,8 +122,12 @@ class commandInterpreter():
         self.stage_controller.enable_stages(True)
         return 'Enabled steppers'
 
-    def _G28(self, gcode_dict):
-        self.stage_controller.home_stages()
+    async def _G28(self, gcode_dict):
+        self.printhead_controller.flush()
+        self._mark('fire')
+        error = await self.stage_controller.home_stages()
+        self._mark('move')
+        if error: return error
         return 'Homed stage'
 
     def _G92(self, gcode_dict):
@@ -91,11 +141,47 @@ class commandInterpreter():
         if 'C' not in gcode_dict: gcode_dict['C'] = '0'
         if 'S' not in gcode_dict: gcode_dict['S'] = 'M'
         if 'Q' not in gcode_dict: gcode_dict['Q'] = 'E'
-        self.printhead_controller.fire(B=str(gcode_dict['B']), C=str(gcode_dict['C']), S=str(gcode_dict['S']), Q=str(gcode_dict['Q']))
-        return 'Fired black: '+str(gcode_dict['B'])+' color: '+str(gcode_dict['C'])+' size: '+str(gcode_dict['S'])+' quality: '+str(gcode_dict['Q'])
+        if 'W' not in gcode_dict: gcode_dict['W'] = None
+        if 'M' not in gcode_dict: gcode_dict['M'] = None
+        if 'Y' not in gcode_dict: gcode_dict['Y'] = None
+        self.printhead_controller.fire(B=str(gcode_dict['B']), C=str(gcode_dict['C']), S=str(gcode_dict['S']), Q=str(gcode_dict['Q']),
+                                       W=gcode_dict['W'], M=gcode_dict['M'], Y=gcode_dict['Y'])
+        self._mark('fire')
+        return 'Queued black: '+str(gcode_dict['B'])+' color: '+str(gcode_dict['C'])+' size: '+str(gcode_dict['S'])+' quality: '+str(gcode_dict['Q'])
 
     def _P2(self, gcode_dict):
         if 'S' not in gcode_dict: gcode_dict['S'] = 'M'
         if 'Q' not in gcode_dict: gcode_dict['Q'] = 'E'
-        self.printhead_controller.fire_all(S=str(gcode_dict['S']), Q=str(gcode_dict['Q']))
-        return 'Fired all nozzles'
+        if 'W' not in gcode_dict: gcode_dict['W'] = None
+        self.printhead_controller.fire_all(S=str(gcode_dict['S']), Q=str(gcode_dict['Q']), W=gcode_dict['W'])
+        self._mark('fire')
+        return 'Queued all nozzles'
+
+    def _W1(self, gcode_dict):
+        if 'I' not in gcode_dict: return 'Missing slot in Gcode'
+        if 'D' not in gcode_dict: return 'Missing samples in Gcode'
+        if 'T' not in gcode_dict: gcode_dict['T'] = config.WAVEFORM_US_PER_SAMPLE
+        if 'N' not in gcode_dict: gcode_dict['N'] = ''
+        samples = ubinascii.a2b_base64(gcode_dict['D'])
+        self.printhead_controller.store_waveform(int(gcode_dict['I']), samples, float(gcode_dict['T']), gcode_dict['N'])
+        return 'Stored waveform '+gcode_dict['I']+': '+str(len(samples))+' samples'
+
+    def _W2(self, gcode_dict):
+        self.printhead_controller.save_waveforms()
+        return 'Saved waveforms'
+
+    def _W3(self, gcode_dict):
+        return 'Waveforms: '+self.printhead_controller.list_waveforms()
+
+    def _J1(self, gcode_dict):
+        if 'N' not in gcode_dict: return 'Missing job name in Gcode'
+        if 'D' not in gcode_dict: return 'Missing data in Gcode'
+        if 'O' not in gcode_dict: gcode_dict['O'] = '0'
+        size = self.job_runner.write(gcode_dict['N'], int(gcode_dict['O']), ubinascii.a2b_base64(gcode_dict['D']))
+        return 'Stored job '+gcode_dict['N']+': '+str(size)+' bytes'
+
+    async def _J2(self, gcode_dict):
+        if 'N' not in gcode_dict: return 'Missing job name in Gcode'
+        records = await self.job_runner.run(gcode_dict['N'])
+        self._mark('fire')
+        return 'Finished job '+gcode_dict['N']+': '+str(records)+' records'
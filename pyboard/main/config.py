@@ -35,7 +35,7 @@ GPIO_NCHG =          8
 DAC =           'X5'
 
 ####################### GCODE ##########################
-VALID_GCODES = ['G0', 'G1', 'G10', 'G11', 'G28', 'G92', 'P1', 'P2']
+VALID_GCODES = ['G0', 'G1', 'G10', 'G11', 'G28', 'G92', 'P1', 'P2', 'W1', 'W2', 'W3', 'J1', 'J2']
 VALID_COMMANDS = ['RESET']
 # G0    Positioning move
 # G1    Print move
@@ -43,6 +43,31 @@ VALID_COMMANDS = ['RESET']
 # G11   Enable steppers
 # G28   Home
 # G92   Set coords
+# P1    Fire: P1 B<black> C<cyan> M<magenta> Y<yellow> S<size S/M/L> Q<quality> W<waveform>, nozzle masks
+#       as x<hex> (bit n-1 is nozzle n) or as '0'/'1' per nozzle, M and Y are C when left out
+# P2    Fire all nozzles
+# W1    Store waveform: W1 I<slot> N<name> T<us per sample> D<base64 of the 8-bit samples>
+# W2    Save the waveform table to flash
+# W3    List the waveform table
+# J1    Store part of a job: J1 N<name> O<offset> D<base64 of the job bytes>, see host/job.py
+# J2    Run a stored job: J2 N<name>
+
+# Append the phase times in us to every response: '<response> |T parse=.. move=.. fire=.. total=..'
+PROFILE = False
+
+
+###################### MAIN LOOP #######################
+
+# uasyncio tasks, see main.py. Real-time queries on a line of their own are answered by the USB
+# task at once, also during moves, homing and jobs (the steps are output by the STEP_TIMER interrupt).
+# While firing a query waits up to one repetition, about 11 ms, see printheadController.poll():
+#   ?   status: state, position in mm and steps, queued moves, commands and firings
+#   !   feed hold, the stage and a running job stop until ~
+#   ~   resume
+COMMAND_QUEUE = 8 # commands received and not executed yet, more are refused (host tools send at most this many at once)
+MOTION_QUEUE = 16 # G0/G1 targets
+HEARTBEAT_MS = 500
+IDLE_GC_MS = 1000 # idle time before a garbage collection
 
 
 ###################### STAGES #########################
@@ -51,7 +76,9 @@ STAGE_MICROSTEPPING = 16
 STAGE_RANGE = (100, 100) #mm
 STAGE_PITCH = 1 #mm
 STAGE_STEPS_PER_REV = 200
-ENABLE_ENDSTOPS = False
+ENABLE_ENDSTOPS = False # stop moves at the endswitches, homing always uses them
+STAGE_STEP_US = 200 # half step period of moves
+STEP_TIMER = 7 # one tick per step of all moves, timers 2 and 4 drive the printhead
 
 STAGE_MIN_FREQ = 100
 STAGE_MAX_FREQ = 80000
@@ -59,6 +86,30 @@ STAGE_FREQ_RAMP = 0.5
 
 X_HOME_DIR = 1
 Y_HOME_DIR = 1
+HOME_FAST_US = 25 # half step period of the approach
+HOME_SLOW_US = 250 # half step period of the re-approach
+HOME_BACKOFF = '0.2' # mm
+
+# folder of the precompiled jobs, '/sd' to keep them on the SD card
+JOB_DIR = '/flash'
+
+# printhead signal words and nozzle patches, compiled by host/timing.py
+SEQUENCE_FILE = 'sequence.bin'
+
+# repetitions of a P1/P2 firing and the pause between them
+FIRE_REPEATS = 100
+FIRE_INTERVAL_MS = 1
+
+# piezo waveform, normalised to 8 bit at boot and played WAVEFORM_REPEATS times per fire by DMA,
+# with a CH pulse of CH_PULSE_SAMPLES samples at the end of every waveform but the last
+WAVEFORM_US_PER_SAMPLE = 0.125
+WAVEFORM_REPEATS = 4
+CH_PULSE_SAMPLES = 3
+
+# waveform table: slot 0 is WAVEFORM, slots 1.. are uploaded with W1 and selected with P1 ... W<slot or name>
+WAVEFORM_SLOTS = 8
+WAVEFORM_MAX_SAMPLES = 256
+WAVEFORM_FILE = 'waveforms.bin'
 
 WAVEFORM = [500,475,450,425,400,375,350,325,300,275,250,225,200,175,150,125,100,75,50,25,0,0,0,0,0,0,0,0,125,250,375,500,625,750,875,1000,1000,1000,1000,1000,1000,1000,1000,1000,1000,1000,1000,975,950,925,900,875,850,825,800,775,750,725,700,675,650,625,600,575,550,525,500,500,500,500,500,500,500,500,500,500,500,500,500,500,500,500,500,500,500,500]
 
@@ -43,9 +43,12 @@ def output_signal(signal):
     signal = signal_factory.get_sequence()     <-- this should return a list of words
     dma_controller.output_signal(signal)
 
+    An array('i') is output as it is, without a copy (see sequence_table.py).
+
     '''
     #print("Outputting signal of length %s..."%(len(signal)), end='')
-    _output_signal_ass(addressof(array('i', signal)), len(signal))
+    if not isinstance(signal, array): signal = array('i', signal)
+    _output_signal_ass(addressof(signal), len(signal))
     #print("Done")
     return True
 
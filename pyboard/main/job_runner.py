@@ -0,0 +1,135 @@
+import config
+import struct
+import os
+import uasyncio as asyncio
+
+# record opcodes, see host/job.py
+OP_END = 0
+OP_MOVE = 1
+OP_FIRE = 2
+OP_WAVE = 3
+OP_HOME = 4
+OP_FIRE_ALL = 5
+OP_SET = 6
+
+# bytes after the opcode
+RECORD_SIZES = {OP_END: 0, OP_MOVE: 4, OP_FIRE: 2, OP_WAVE: 1, OP_HOME: 0, OP_FIRE_ALL: 1, OP_SET: 8}
+SIZES = ('small', 'medium', 'large')
+
+
+class jobRunner():
+    """
+    Runs precompiled jobs from flash (or SD), written by host/job.py with J1 and started with J2.
+    The job is read record by record into one preallocated buffer, so a job of any length
+    runs without the USB connection and can be run again without sending it again. run() is a
+    coroutine: moves and homing are stepped by the stage timer and firings are output while the
+    other tasks run, so real-time queries are answered during a job and a feed hold pauses it.
+
+    Job file: b'JOB1', number of waveforms (2 bytes), number of masks (2), the waveform names
+    (length and name), the masks (droplet size and per channel length and mask bytes, see
+    sequence_table.mask()), then the records: an opcode and its arguments.
+        OP_MOVE     x and y steps relative to the previous position (2 bytes each, signed)
+        OP_FIRE     mask id (2)
+        OP_WAVE     waveform id (1)
+        OP_HOME     home the stages
+        OP_FIRE_ALL droplet size (1)
+        OP_SET      set the position in steps (4 bytes each, signed)
+    """
+
+    def __init__(self, stage_controller, printhead_controller):
+        self.stage_controller = stage_controller
+        self.printhead_controller = printhead_controller
+        self.record = bytearray(8)
+        self.view = memoryview(self.record)
+
+    def _path(self, name):
+        if not name or '/' in name or '.' in name: raise ValueError('invalid job name ' + name)
+        return config.JOB_DIR + '/' + name + '.job'
+
+    def write(self, name, offset, data):
+        # chunks arrive in order, offset 0 starts a new file
+        path = self._path(name)
+        if offset == 0:
+            f = open(path, 'wb')
+        else:
+            size = os.stat(path)[6]
+            if size != offset: raise ValueError('job %s has %d bytes, chunk is at %d' % (name, size, offset))
+            f = open(path, 'ab')
+        f.write(data)
+        f.close()
+        return offset + len(data)
+
+    def _read(self, f, n):
+        if n and f.readinto(self.view[:n]) != n: raise ValueError('job ends in a record')
+
+    async def _output(self):
+        # output all queued firings, before the stage moves or the waveform changes
+        while self.printhead_controller.poll(): await asyncio.sleep_ms(0)
+        self.printhead_controller.flush()
+
+    async def _free_buffer(self):
+        # a firing is queued once the previous pending one has started
+        while self.printhead_controller.pending is not None:
+            self.printhead_controller.poll()
+            await asyncio.sleep_ms(0)
+
+    async def run(self, name):
+        f = open(self._path(name), 'rb')
+        try:
+            header = f.read(8)
+            if header[:4] != b'JOB1': raise ValueError('%s is not a job' % name)
+            n_waveforms, n_masks = struct.unpack('<HH', header[4:8])
+
+            # ids to waveform slots and decoded masks, once per run
+            slots = []
+            for i in range(n_waveforms):
+                slots.append(self.printhead_controller.find_waveform(f.read(f.read(1)[0]).decode()))
+            masks = []
+            for i in range(n_masks):
+                size = SIZES[f.read(1)[0]]
+                channels = tuple(bytearray(f.read(f.read(1)[0])) for c in range(4))
+                # refuse the job before anything moves
+                self.printhead_controller.sequences.check(channels)
+                masks.append((channels, size))
+
+            records = 0
+            while f.readinto(self.view[:1]) == 1:
+                op = self.record[0]
+                if op not in RECORD_SIZES: raise ValueError('unknown record %d' % op)
+                self._read(f, RECORD_SIZES[op])
+                records += 1
+                if op == OP_END: break
+                # the other tasks run between records, a feed hold pauses the job until resume
+                await asyncio.sleep_ms(0)
+                while self.stage_controller.hold: await asyncio.sleep_ms(0)
+                if op == OP_MOVE:
+                    dx, dy = struct.unpack_from('<hh', self.record)
+                    x = self.stage_controller.steps[0] + dx
+                    y = self.stage_controller.steps[1] + dy
+                    # G1 refuses these as well
+                    if not (0 <= x <= self.stage_controller.range[0] and 0 <= y <= self.stage_controller.range[1]):
+                        raise ValueError('job moves to [%d, %d] steps, out of range after %d records' % (x, y, records))
+                    await self._output()
+                    error = await self.stage_controller.move_steps(dx, dy)
+                    if error: raise ValueError(error)
+                elif op == OP_FIRE:
+                    channels, size = masks[struct.unpack_from('<H', self.record)[0]]
+                    await self._free_buffer()
+                    self.printhead_controller.fire_masks(channels, size)
+                elif op == OP_WAVE:
+                    await self._output()
+                    self.printhead_controller.select_waveform(slots[self.record[0]])
+                elif op == OP_HOME:
+                    await self._output()
+                    error = await self.stage_controller.home_stages()
+                    if error: raise ValueError(error)
+                elif op == OP_FIRE_ALL:
+                    await self._free_buffer()
+                    self.printhead_controller.fire_all(S='SML'[self.record[0]])
+                elif op == OP_SET:
+                    x, y = struct.unpack_from('<ii', self.record)
+                    self.stage_controller.set_steps(x, y)
+            await self._output()
+        finally:
+            f.close()
+        return records
@@ -5,14 +5,31 @@ from printhead_controller import printheadController
 from serial_controller import serialListener
 from command_interpreter import commandInterpreter
 
+import uasyncio as asyncio
 import time
 import pyb
+import gc
 
+# real-time queries, see config.py
+STATUS = '?'
+HOLD = '!'
+RESUME = '~'
 
 
 class mainController():
     """
     Main print machine controller
+
+    The firmware runs as uasyncio tasks:
+        _receive()      reads USB, answers real-time queries at once and queues the other commands
+                        (refused while COMMAND_QUEUE commands wait)
+        _execute()      executes the commands in order and outputs the queued firings in between
+        run_queue()     the motion task of the stage controller, starts the timer stepping of each move
+        _heartbeat()    blinks LED 4 and shows on LED 3 whether the steppers are enabled
+        _idle()         garbage collection while nothing is happening
+    G0/G1 only queue the move, every other command waits until the stage has stopped, so moves
+    and firings never overlap and the host can send the next command during a move. G28 and J2
+    step the stage from _execute() with the same step timer, the other tasks keep running.
     """
 
     def __init__(self):
@@ -21,26 +38,116 @@ class mainController():
         self.serial = serialListener()
         self.commander = commandInterpreter(self.stage_controller, self.printhead_controller)
 
+        self.commands = []
+        self.executing = False
+        self.last_command = time.ticks_ms()
+
+        # LED 2 while executing a command, 3 when the steppers are enabled, 4 heartbeat
+        self.led_busy = pyb.LED(2)
+        self.led_enabled = pyb.LED(3)
+        self.led_heartbeat = pyb.LED(4)
+
         print('finished main_controler initialization')
 
 
-    def main_loop(self):
-        print('entering main_loop')
+    def _status(self):
+        stage = self.stage_controller
+        if stage.hold: state = 'Hold'
+        elif stage.busy() or self.executing: state = 'Run'
+        else: state = 'Idle'
+        position = stage.get_position()
+        return 'Status %s X%.4f Y%.4f steps %d %d moves %d commands %d fires %d' % (
+            state, position[0], position[1], stage.steps[0], stage.steps[1], len(stage.queue),
+            len(self.commands), self.printhead_controller.queued())
+
+    def _realtime(self, command):
+        # answer of a real-time query, or None for a normal command
+        if command == STATUS: return self._status()
+        if command == HOLD:
+            self.stage_controller.hold = True
+            return 'Feed hold'
+        if command == RESUME:
+            self.stage_controller.hold = False
+            return 'Resumed'
+        return None
+
+    async def _receive(self):
         while True:
-            command = self.serial.get_message()
-
-            # turn on Led 2 when processing a command
+            # always read, so real-time queries are answered while the command queue is full
+            command = self.serial.poll_message()
             if command:
-                pyb.LED(2).on()
-                f = self.commander.execute_command(command)
-                pyb.LED(2).off()
-                self.serial.send_message(f)
-
-            if self.stage_controller.is_enabled(): pyb.LED(3).on()
-            else: pyb.LED(3).off()
-
+                response = self._realtime(command.strip())
+                if response: self.serial.send_message(response)
+                elif len(self.commands) < config.COMMAND_QUEUE: self.commands.append(command)
+                else: self.serial.send_message('Command queue full: ' + command.strip())
+            await asyncio.sleep_ms(0)
+
+    async def _settle(self, op):
+        # moves wait for room in the motion queue, everything else for the stage to stop
+        if op in ('G0', 'G1'):
+            while self.stage_controller.queue_full(): await asyncio.sleep_ms(0)
+        else:
+            while self.stage_controller.busy(): await asyncio.sleep_ms(0)
+
+        # a firing waits for a free buffer, anything else until all firings are output
+        if op in ('P1', 'P2'):
+            while self.printhead_controller.pending is not None:
+                self.printhead_controller.poll()
+                await asyncio.sleep_ms(0)
+        else:
+            while self.printhead_controller.poll(): await asyncio.sleep_ms(0)
+
+    async def _execute(self):
+        while True:
+            if not self.commands:
+                # queued P1/P2 firings are output in between commands
+                self.printhead_controller.poll()
+                await asyncio.sleep_ms(0)
+                continue
+
+            command = self.commands[0]
+            await self._settle(command.strip().split(' ')[0])
+            self.commands.pop(0)
+
+            # a move stopped by an endstop fails the next command, the motion queue is empty
+            if self.stage_controller.error:
+                response = self.stage_controller.error
+                self.stage_controller.error = None
+            else:
+                self.led_busy.on()
+                self.executing = True
+                response = await self.commander.execute_command(command)
+                self.executing = False
+                self.led_busy.off()
+            self.serial.send_message(response)
+            self.last_command = time.ticks_ms()
+            await asyncio.sleep_ms(0)
+
+    async def _heartbeat(self):
+        while True:
+            self.led_heartbeat.toggle()
+            if self.stage_controller.is_enabled(): self.led_enabled.on()
+            else: self.led_enabled.off()
+            await asyncio.sleep_ms(config.HEARTBEAT_MS)
 
+    async def _idle(self):
+        # collect garbage while idle instead of in the middle of a move or firing
+        while True:
+            await asyncio.sleep_ms(config.IDLE_GC_MS)
+            if self.commands or self.executing or self.stage_controller.busy() or self.printhead_controller.queued(): continue
+            if time.ticks_diff(time.ticks_ms(), self.last_command) < config.IDLE_GC_MS: continue
+            gc.collect()
+
+    async def main(self):
+        asyncio.create_task(self._receive())
+        asyncio.create_task(self._execute())
+        asyncio.create_task(self.stage_controller.run_queue())
+        asyncio.create_task(self._heartbeat())
+        await self._idle()
 
+    def main_loop(self):
+        print('entering main_loop')
+        asyncio.run(self.main())
 
 
 
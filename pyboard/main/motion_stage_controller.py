@@ -1,8 +1,9 @@
-from pyb import Pin, LED, Timer
+from pyb import Pin, LED, Timer, ExtInt
 import config
 import time
 import math
 import micropython
+import uasyncio as asyncio
 micropython.alloc_emergency_exception_buf(100)
 
 class stageController():
@@ -12,36 +13,161 @@ class stageController():
                              config.X_STEP,
                              config.X_DIR,
                              config.X_END_MAX,
-                             config.X_END_MIN)
+                             config.X_END_MIN,
+                             config.X_HOME_DIR)
         self.y_stage = stage('y',
                               config.Y_STEP,
                               config.Y_DIR,
                               config.Y_END_MAX,
-                              config.Y_END_MIN)
+                              config.Y_END_MIN,
+                              config.Y_HOME_DIR)
 
         # Define enable pin and disable steppers
         self.stage_ena = Pin(config.STEP_ENA, Pin.OUT_PP)
         self.stage_ena.value(1)
 
-        # Define other properties
-        self.range = config.STAGE_RANGE
+        # Steps per mm as the fraction steps_num / steps_den (pitch in um), the position is
+        # kept in whole steps and mm are converted once per command, see mm_to_steps()
+        self.steps_num = config.STAGE_STEPS_PER_REV * config.STAGE_MICROSTEPPING * 1000
+        self.steps_den = int(round(config.STAGE_PITCH * 1000))
+        self.range = (self.mm_to_steps(config.STAGE_RANGE[0]), self.mm_to_steps(config.STAGE_RANGE[1]))
 
         # Init position at 0,0 and set homed to False
-        self.position = [0, 0]
+        self.steps = [0, 0]
         self.homed = False
 
+        # G1 targets in steps, moved by the motion task run_queue()
+        self.queue = []
+        self.moving = False
+        self.hold = False
+        self.error = None
+
+        # All moves are stepped by the timer interrupt _step_tick(), one axis at a time
+        self.step_timer = Timer(config.STEP_TIMER, freq=500000 // config.STAGE_STEP_US)
+        self.step_tick = self._step_tick # bound once, the interrupt must not allocate
+        self.active = self.x_stage
+        self.active_index = 0
+        self.sign = 1
+        self.remaining = 0
+        self.endstops = config.ENABLE_ENDSTOPS
+        self.stepping = False
+
         print('stage controller initialized')
 
 
-    def move_to_position(self, position):
+    def mm_to_steps(self, mm):
+        '''
+        Whole steps of a distance in mm, given as G-code text (or a number), rounded half away
+        from zero with integer arithmetic only. Rounding the absolute position instead of every
+        move means errors cannot add up.
+        '''
+        text = str(mm).strip()
+        if 'e' in text or 'E' in text: return int(round(float(text) * self.steps_num / self.steps_den))
+        negative = text[:1] == '-'
+        parts = text.lstrip('+-').split('.')
+        frac = parts[1] if len(parts) > 1 else ''
+        scale = 10 ** len(frac)
+        value = int(parts[0] or '0') * scale + int(frac or '0')
+        den = scale * self.steps_den
+        steps = (2 * value * self.steps_num + den) // (2 * den)
+        return -steps if negative else steps
+
+    def get_position(self):
+        # position in mm, for reporting only
+        return [s * self.steps_den / self.steps_num for s in self.steps]
+
+    async def move_to_position(self, position):
+        # position in mm as G-code text or numbers
+        return await self.move_to_steps([self.mm_to_steps(position[0]), self.mm_to_steps(position[1])])
+
+    async def move_to_steps(self, target):
         # Check if target position is within stage range
-        if position[0] < 0 or position[0] > self.range[0]:
+        if target[0] < 0 or target[0] > self.range[0]:
             return 'target out of range'
-        if position[1] < 0 or position[1] > self.range[1]:
+        if target[1] < 0 or target[1] > self.range[1]:
             return 'target out of range'
 
         # Move
-        self._move_square(position)
+        return await self._move_square(target)
+
+    def queue_position(self, position):
+        # position in mm as G-code text, moved later by run_queue()
+        target = [self.mm_to_steps(position[0]), self.mm_to_steps(position[1])]
+        if target[0] < 0 or target[0] > self.range[0]:
+            return 'target out of range'
+        if target[1] < 0 or target[1] > self.range[1]:
+            return 'target out of range'
+        self.queue.append(target)
+
+    def queue_full(self):
+        return len(self.queue) >= config.MOTION_QUEUE
+
+    def busy(self):
+        return self.moving or self.stepping or len(self.queue) > 0
+
+    def _step_tick(self, timer):
+        # Step timer interrupt, a whole step per tick: the step pulse lasts while the position is
+        # counted. A feed hold or a triggered endswitch ends the stepping before the next step.
+        if self.hold or (self.endstops and self.active.stopped):
+            timer.callback(None)
+            self.stepping = False
+            return
+        step = self.active.p_step
+        step.value(1)
+        self.steps[self.active_index] += self.sign
+        self.remaining -= 1
+        step.value(0)
+        if self.remaining == 0:
+            timer.callback(None)
+            self.stepping = False
+
+    def _start_steps(self, index, steps, half_us, endstops):
+        # starts the timer stepping of one axis, relative in whole steps
+        self.active = self.x_stage if index == 0 else self.y_stage
+        self.active.prepare(self.active.direction(steps), endstops)
+        self.active_index = index
+        self.sign = 1 if steps > 0 else -1
+        self.remaining = abs(steps)
+        self.endstops = endstops
+        self.stepping = True
+        self.step_timer.freq(500000 // half_us)
+        self.step_timer.callback(self.step_tick)
+
+    async def _step_axis(self, index, steps, half_us=config.STAGE_STEP_US, endstops=config.ENABLE_ENDSTOPS):
+        '''
+        Steps one axis at half_us per half period while the other tasks run, a feed hold pauses
+        it until resume. Returns the steps taken, fewer than abs(steps) when a switch in the
+        direction of travel stopped the axis (`stopped` of the stage is left set).
+        '''
+        end = self.steps[index] + steps
+        while self.steps[index] != end:
+            self._start_steps(index, end - self.steps[index], half_us, endstops)
+            while self.stepping: await asyncio.sleep_ms(0)
+            if endstops and self.active.stopped: break
+            while self.hold: await asyncio.sleep_ms(0)
+        return abs(steps) - abs(end - self.steps[index])
+
+    async def _home_end(self, index, max_steps, half_us):
+        # run into the home switch, returns the steps taken or None when it was not found
+        steps = await self._step_axis(index, -max_steps, half_us, True)
+        return steps if self.active.stopped else None
+
+    async def run_queue(self):
+        '''
+        Motion task: moves to the queued targets, x then y as _move_square(). The steps are output
+        by the step timer, so the other tasks run during a move and `steps` is the position at
+        any time. A feed hold stops the stage after the current step, the move goes on at resume.
+        An endstop hit clears the queue and is kept in `error`.
+        '''
+        while True:
+            if not self.queue or self.hold:
+                await asyncio.sleep_ms(0)
+                continue
+            target = self.queue.pop(0)
+            self.moving = True
+            self.error = await self._move_square(target)
+            if self.error: self.queue = []
+            self.moving = False
 
     def enable_stages(self, bool):
         if bool: self.stage_ena.value(0)
@@ -50,53 +176,54 @@ class stageController():
     def is_enabled(self):
         return not self.stage_ena.value()
 
-    def home_stages(self):
+    async def home_stages(self):
+        '''
+        Per axis a fast approach to the home switch, a short backoff and a slow re-approach for
+        a repeatable switch point. Returns an error message when a switch is not found.
+        '''
         self.enable_stages(True)
 
-        self.x_stage.move_end(config.X_HOME_DIR)
-        time.sleep(0.5)
-        self.x_stage.move_delta(0.1, not config.X_HOME_DIR)
-        time.sleep(0.5)
-        self.x_stage.move_end(config.X_HOME_DIR, accel=False)
-
-        self.y_stage.move_end(config.Y_HOME_DIR)
-        time.sleep(0.5)
-        self.y_stage.move_delta(0.1, not config.Y_HOME_DIR)
-        time.sleep(0.5)
-        self.y_stage.move_end(config.Y_HOME_DIR, accel=False)
+        backoff = self.mm_to_steps(config.HOME_BACKOFF)
+        for index, axis, travel in ((0, self.x_stage, self.range[0]), (1, self.y_stage, self.range[1])):
+            if await self._home_end(index, travel + travel // 10, config.HOME_FAST_US) is None:
+                return 'endstop %s not found' % axis.name
+            await self._step_axis(index, backoff, config.HOME_FAST_US, False)
+            if await self._home_end(index, 2 * backoff, config.HOME_SLOW_US) is None:
+                return 'endstop %s not found' % axis.name
 
-        self.position = [0, 0]
+        self.steps[0] = 0
+        self.steps[1] = 0
+        self.homed = True
 
+    async def _move_square(self, target):
+        return await self.move_steps(target[0] - self.steps[0], target[1] - self.steps[1])
 
-    def _move_square(self, position):
-        # Calculate distance to move
-        delta_x = position[0] - self.position[0]
-        delta_y = position[1] - self.position[1]
-
-        # Determine directions
-        if position[0] < self.position[0]: x_dir = 0
-        else: x_dir = 1
-        if position[1] < self.position[1]: y_dir = 0
-        else: y_dir = 1
+    def set_position(self, x, y):
+        # x, y in mm as G-code text or numbers
+        self.steps = [self.mm_to_steps(x), self.mm_to_steps(y)]
+        return True
 
-        # Enable steppers
+    async def move_steps(self, x_steps, y_steps):
+        # relative move in whole steps, as in precompiled jobs (see job_runner.py)
         self.enable_stages(True)
+        if await self._step_axis(0, x_steps) < abs(x_steps) or await self._step_axis(1, y_steps) < abs(y_steps):
+            return 'endstop hit at [%d, %d] steps' % (self.steps[0], self.steps[1])
 
-        # Execute move
-        self.x_stage.move_delta(abs(delta_x), x_dir)
-        self.y_stage.move_delta(abs(delta_y), y_dir)
-
-        self.position = position
-
-    def set_position(self, x, y):
-        self.position = [x, y]
-        return True
+    def set_steps(self, x_steps, y_steps):
+        self.steps = [x_steps, y_steps]
 
 
 
 
 class stage():
-    def __init__(self, name, p_step, p_dir, p_max, p_min):
+    '''
+    One axis: a step and a direction pin and two endswitches on ExtInt. Homing runs into the
+    home switch (min for home_dir 1, max for 0, the dir pin level towards it is home_dir),
+    position 0 is there and positive steps run away from it, towards the far switch. Moving
+    towards an endswitch that triggers sets `stopped` in the interrupt, the step timer of the
+    stage controller checks it before every step, so a move stops within one step.
+    '''
+    def __init__(self, name, p_step, p_dir, p_max, p_min, home_dir):
         self.name = name
 
         self.p_step = Pin(p_step, Pin.OUT_PP)
@@ -104,35 +231,37 @@ class stage():
         self.p_max = Pin(p_max, Pin.IN)
         self.p_min = Pin(p_min, Pin.IN)
 
-        self.ms = config.STAGE_MICROSTEPPING
-        self.pitch = config.STAGE_PITCH
-        self.mm_per_step = float(self.pitch) / float(self.ms*config.STAGE_STEPS_PER_REV)
+        self.home_dir = home_dir
+        self.p_home, self.p_far = (self.p_min, self.p_max) if home_dir == 1 else (self.p_max, self.p_min)
+
+        self.dir = 0
+        self.stopped = False
+        self.ext_home = ExtInt(p_min if home_dir == 1 else p_max, ExtInt.IRQ_RISING, Pin.PULL_NONE, self._home_hit)
+        self.ext_far = ExtInt(p_max if home_dir == 1 else p_min, ExtInt.IRQ_RISING, Pin.PULL_NONE, self._far_hit)
 
         print('stage %s initialized'%(self.name))
 
+    # Endswitch interrupts, only a switch in the direction of travel stops the axis
+    def _home_hit(self, line):
+        if self.dir == self.home_dir: self.stopped = True
+
+    def _far_hit(self, line):
+        if self.dir != self.home_dir: self.stopped = True
+
     # Functions for checking whether endswitch is triggered
     def at_min(self): return self.p_min.value()
     def at_max(self): return self.p_max.value()
 
-    def move_end(self, dir):
-        self.p_dir.value(dir)
-
-        while True:
-            if dir == 1 and self.p_min.value() == 1: break
-            if dir == 0 and self.p_max.value() == 1: break
-
-            self.p_step.value(1)
-            time.sleep_us(200)
-            self.p_step.value(0)
-            time.sleep_us(200)
-
+    def _at_end(self):
+        return self.p_home.value() if self.dir == self.home_dir else self.p_far.value()
 
+    def direction(self, steps):
+        # dir pin level of a move of `steps`, negative runs towards the home switch
+        return self.home_dir if steps < 0 else 1 - self.home_dir
 
-    def move_delta(self, delta, dir):
+    def prepare(self, dir, endstops):
+        # sets the direction before stepping, with endstops a switch already triggered stops at once
+        self.stopped = False
         self.p_dir.value(dir)
-        n_steps = int(delta / self.mm_per_step)
-        for i in range(n_steps):
-            self.p_step.value(1)
-            time.sleep_us(200)
-            self.p_step.value(0)
-            time.sleep_us(200)
+        self.dir = dir
+        if endstops and self._at_end(): self.stopped = True
@@ -1,10 +1,10 @@
 import config
 import dma_functions
-from sequence_factory import SequenceFactory
-from pyb import Pin, DAC
+from sequence_table import sequenceTable, mask, all_nozzles
+from pyb import Pin, DAC, Timer
 import time
-from array import array
-from uctypes import addressof
+import stm
+import struct
 
 
 
@@ -23,11 +23,140 @@ class printheadController():
         self.dac = DAC(1)
         self.dac.write(127)
 
-        waveform = config.WAVEFORM
-        factor = max(waveform)
-        for i in range(len(waveform)):
-            waveform[i] = int(255*(waveform[i]/factor))
-        self.waveform = array('i', waveform)
+        # compiled signal words, see host/timing.py. Two buffers: the next P1 is patched into one
+        # while the other is output, see poll()
+        self.sequences = sequenceTable()
+        self.signals = [self.sequences.new_buffer(), self.sequences.new_buffer()]
+        self.back = 0
+        self.active = None
+        self.pending = None
+        self.repeats_left = 0
+        self.next_repeat = time.ticks_ms()
+        # P2: every nozzle the sequence table has data for
+        self.all_masks = tuple(all_nozzles(n) if self.sequences.patches[c] else bytearray() for c, n in enumerate((90, 30, 30, 30)))
+
+        self.firing = False
+        self.periods = 0
+        self.fired_deadline = 0
+        self._init_timers()
+
+        # waveform table: per slot (buffer with WAVEFORM_REPEATS copies, samples, timer ticks per sample,
+        # us per sample, name), the buffers are allocated once and uploads only copy into them
+        self.waveform_buffers = [bytearray(config.WAVEFORM_MAX_SAMPLES * config.WAVEFORM_REPEATS)
+                                 for i in range(config.WAVEFORM_SLOTS)]
+        self.waveforms = [None] * config.WAVEFORM_SLOTS
+        self.selected = None
+        factor = max(config.WAVEFORM)
+        self.store_waveform(0, bytes([int(255*(v/factor)) for v in config.WAVEFORM]), config.WAVEFORM_US_PER_SAMPLE, 'default')
+        self.load_waveforms()
+        self.select_waveform(0)
+
+    def _init_timers(self):
+        '''
+        The DAC plays the selected waveform by DMA, WAVEFORM_REPEATS times per fire.
+
+        TIM2 triggers the DAC, TIM4 counts the TIM2 triggers (slave mode, external clock from
+        ITR1) and drives NCHG (Y3 = TIM4_CH3) and CH (Y4 = TIM4_CH4) in PWM mode, so the CH
+        pulses are locked to the samples of the waveform without the CPU.
+        '''
+        # TIM2: one update (TRGO) per sample, stopped until a pulse is fired
+        self.sample_timer = Timer(2, prescaler=0, period=99)
+        stm.mem16[stm.TIM2 + stm.TIM_CR1] &= 0xfffe
+        stm.mem16[stm.TIM2 + stm.TIM_CR2] = (stm.mem16[stm.TIM2 + stm.TIM_CR2] & 0xff8f) | 0x0020
+
+        # TIM4: counts samples, wraps after every waveform period. NCHG is high until just before
+        # the CH pulse, CH is high during the last CH_PULSE_SAMPLES samples of a period
+        self.pulse_timer = Timer(4, prescaler=0, period=99)
+        self.pulse_timer.channel(3, Timer.PWM, pin=self.p_NCHG, pulse_width=0)
+        self.pulse_timer.channel(4, Timer.PWM_INVERTED, pin=self.p_CH, pulse_width=0)
+        # no compare preload, so a new pulse width takes effect at once
+        stm.mem16[stm.TIM4 + stm.TIM_CCMR2] &= ~((1 << 3) | (1 << 11)) & 0xffff
+        # slave mode: external clock mode 1 (SMS=111) from ITR1 = TIM2 TRGO (TS=001)
+        stm.mem16[stm.TIM4 + stm.TIM_SMCR] = 0x0017
+        self.pulse_timer.callback(self._period_done)
+
+        # the pins stay GPIO outputs for the bit-banged data, they are switched to TIM4 when firing
+        self.p_NCHG.init(Pin.OUT_PP)
+        self.p_CH.init(Pin.OUT_PP)
+
+    def store_waveform(self, slot, samples, us_per_sample, name=''):
+        '''
+        Stores 8-bit samples (already normalised, 0-255) in a slot of the table, played at one
+        sample per us_per_sample (rounded to whole ticks of the timer clock). Slot 0 is
+        config.WAVEFORM, names are at most 8 characters.
+        '''
+        if not 0 <= slot < config.WAVEFORM_SLOTS: raise ValueError('waveform slot out of range')
+        if len(name) > 8: raise ValueError('waveform name longer than 8 characters')
+        if slot == self.selected: self.flush()
+        n = len(samples)
+        if not config.CH_PULSE_SAMPLES + 2 <= n <= config.WAVEFORM_MAX_SAMPLES: raise ValueError('waveform length out of range')
+        buffer = self.waveform_buffers[slot]
+        for k in range(config.WAVEFORM_REPEATS):
+            buffer[k*n:(k+1)*n] = samples
+        ticks = max(1, round(us_per_sample * self.sample_timer.source_freq() / 1000000))
+        self.waveforms[slot] = (memoryview(buffer)[:n*config.WAVEFORM_REPEATS], n, ticks, us_per_sample, name)
+        if self.selected == slot:
+            self.selected = None
+            self.select_waveform(slot)
+
+    def find_waveform(self, W):
+        # slot of a waveform by slot number or name
+        if W.isdigit() and int(W) < config.WAVEFORM_SLOTS and self.waveforms[int(W)] is not None: return int(W)
+        for slot, w in enumerate(self.waveforms):
+            if w is not None and w[4] == W: return slot
+        raise ValueError('no waveform ' + W)
+
+    def select_waveform(self, slot):
+        # only timer periods change, nothing is computed at fire time
+        if slot == self.selected: return
+        if not 0 <= slot < config.WAVEFORM_SLOTS or self.waveforms[slot] is None: raise ValueError('no waveform %s' % slot)
+        self.flush()
+        self.waveform, self.waveform_length, ticks, self.waveform_us, name = self.waveforms[slot]
+        self.sample_timer.period(ticks - 1)
+        stm.mem16[stm.TIM2 + stm.TIM_CR1] &= 0xfffe
+        self.pulse_timer.period(self.waveform_length - 1)
+        self.selected = slot
+
+    def save_waveforms(self):
+        # table file: b'WAVE', then per waveform slot (1 byte), length (2), ns per sample (2),
+        # name (8) and the samples. Slot 0 comes from config.py and is not stored
+        f = open(config.WAVEFORM_FILE, 'wb')
+        f.write(b'WAVE')
+        for slot in range(1, config.WAVEFORM_SLOTS):
+            if self.waveforms[slot] is None: continue
+            buffer, n, ticks, us, name = self.waveforms[slot]
+            f.write(struct.pack('<BHH8s', slot, n, int(us * 1000 + 0.5), name.encode()))
+            f.write(buffer[:n])
+        f.close()
+
+    def load_waveforms(self):
+        try:
+            f = open(config.WAVEFORM_FILE, 'rb')
+        except OSError:
+            return
+        data = f.read()
+        f.close()
+        if data[:4] != b'WAVE': return
+        i = 4
+        while i + 13 <= len(data):
+            slot, n, ns, name = struct.unpack('<BHH8s', data[i:i+13])
+            if 0 < slot < config.WAVEFORM_SLOTS:
+                self.store_waveform(slot, data[i+13:i+13+n], ns / 1000, name.rstrip(b'\x00').decode())
+            i += 13 + n
+
+    def list_waveforms(self):
+        return ' '.join('%d:%s:%d@%gus' % (slot, w[4], w[1], w[3]) for slot, w in enumerate(self.waveforms) if w is not None)
+
+    def _period_done(self, timer):
+        # TIM4 update IRQ at the end of every waveform period, no allocation allowed here
+        self.periods += 1
+        if self.periods == config.WAVEFORM_REPEATS - 1:
+            # no NCHG/CH pulse after the last waveform
+            stm.mem32[stm.TIM4 + stm.TIM_CCR3] = self.waveform_length
+            stm.mem32[stm.TIM4 + stm.TIM_CCR4] = self.waveform_length
+        elif self.periods >= config.WAVEFORM_REPEATS:
+            stm.mem16[stm.TIM2 + stm.TIM_CR1] &= 0xfffe
+            self.firing = False
 
     def _latch(self):
         self.p_NCHG.value(1)
@@ -37,30 +166,110 @@ class printheadController():
 
 
     def _fire_nozzles(self):
+        # starts the waveform and returns, see _init_timers()
+        self._wait_fired()
+        n = self.waveform_length
+        w = config.CH_PULSE_SAMPLES
+        if config.WAVEFORM_REPEATS > 1:
+            stm.mem32[stm.TIM4 + stm.TIM_CCR3] = n - w - 1
+            stm.mem32[stm.TIM4 + stm.TIM_CCR4] = n - w
+        else:
+            stm.mem32[stm.TIM4 + stm.TIM_CCR3] = n
+            stm.mem32[stm.TIM4 + stm.TIM_CCR4] = n
+        stm.mem32[stm.TIM2 + stm.TIM_CNT] = 0
+        stm.mem32[stm.TIM4 + stm.TIM_CNT] = 0
+        self.periods = 0
+        self.firing = True
+        # twice the length of the waveforms, see _wait_fired()
+        self.fired_deadline = time.ticks_add(time.ticks_us(), int(2 * n * config.WAVEFORM_REPEATS * self.waveform_us) + 1000)
+
+        self.p_NCHG.value(1)
+        self.p_NCHG.init(Pin.ALT, af=Pin.AF2_TIM4)
+        self.p_CH.init(Pin.ALT, af=Pin.AF2_TIM4)
+        self.dac.write_timed(self.waveform, self.sample_timer, mode=DAC.NORMAL)
+        # DAC and TIM4 both start at the first TIM2 update
+        stm.mem16[stm.TIM2 + stm.TIM_CR1] |= 1
+
+    def _wait_fired(self):
+        # wait for the waveform to finish and give NCHG and CH back to the GPIO port. Without the
+        # TIM4 update IRQ (timers not running) TIM2 is stopped at the deadline instead of hanging
+        timeout = False
+        while self.firing:
+            if time.ticks_diff(time.ticks_us(), self.fired_deadline) > 0:
+                stm.mem16[stm.TIM2 + stm.TIM_CR1] &= 0xfffe
+                self.firing = False
+                timeout = True
+        self.p_NCHG.init(Pin.OUT_PP)
+        self.p_CH.init(Pin.OUT_PP)
         self.p_NCHG.value(1)
-        run_dac(len(self.waveform), addressof(self.waveform))
-
-    def fire(self, B='0', C='0', S='M', Q='E'):
-        droplet_size = self._get_size(S)
-        droplet_quality = self._get_quality(Q)
-        signal = SequenceFactory().get_sequence2(nozzles_black=self._bin_to_range(B),
-                                                nozzles_cyan=self._bin_to_range(C),
-                                                nozzles_yellow=self._bin_to_range(C),
-                                                nozzles_magenta=self._bin_to_range(C),
-                                                size=droplet_size,
-                                                quality=droplet_quality)
-        self._fire(signal)
-
-    def fire_all(self, S='M', Q='E'):
-        droplet_size = self._get_size(S)
-        droplet_quality = self._get_quality(Q)
-        signal = SequenceFactory().get_sequence2(  nozzles_black=range(1, 91),
-                                                nozzles_cyan=range(1, 31),
-                                                nozzles_yellow=range(1, 31),
-                                                nozzles_magenta=range(1, 31),
-                                                size=droplet_size,
-                                                quality=droplet_quality)
-        self._fire(signal)
+        if timeout: raise OSError('waveform did not finish, no TIM4 update after %d of %d periods' % (self.periods, config.WAVEFORM_REPEATS))
+
+    def fire(self, B='0', C='0', S='M', Q='E', W=None, M=None, Y=None):
+        # queues the firing and returns, the previous one may still be output.
+        # B, C, M, Y: nozzle masks of black, cyan, magenta and yellow, see sequence_table.mask(),
+        # magenta and yellow are the same as cyan when left out. The sequence table has no colour
+        # data yet, colour nozzles are refused, see sequenceTable.check()
+        if W is not None: self.select_waveform(self.find_waveform(W))
+        # the quality block of the sequence is fixed, Q is accepted for older G-code
+        cyan = mask(C)
+        magenta = cyan if M is None else mask(M)
+        yellow = cyan if Y is None else mask(Y)
+        self._queue((mask(B), cyan, magenta, yellow), self._get_size(S))
+
+    def fire_all(self, S='M', Q='E', W=None):
+        if W is not None: self.select_waveform(self.find_waveform(W))
+        self._queue(self.all_masks, self._get_size(S))
+
+    def fire_masks(self, masks, size):
+        # masks decoded beforehand (black, cyan, magenta, yellow), see job_runner.py
+        self._queue(masks, size)
+
+    def _queue(self, nozzles, size):
+        # the back buffer is free once the previous pending firing has started
+        while self.pending is not None:
+            self.poll()
+        signal = self.sequences.build(self.signals[self.back], nozzles, size)
+        self.back ^= 1
+        self.pending = signal
+        self.poll()
+
+    def poll(self):
+        '''
+        Output engine, called from the main loop and while waiting: outputs one of the
+        FIRE_REPEATS repetitions of the active signal when FIRE_INTERVAL_MS has passed since the
+        last one, and swaps to the pending signal when the active one is done. The main loop
+        reads and prepares the next command in between. Returns True while there is work left.
+        A repetition blocks for about 11 ms, mostly the 51 NCHG pulses of _wake_chip(), so this
+        is the longest a real-time query waits for its answer while firing.
+        '''
+        if self.active is None:
+            if self.pending is None: return False
+            self.active = self.pending
+            self.pending = None
+            self.repeats_left = config.FIRE_REPEATS
+        if time.ticks_diff(time.ticks_ms(), self.next_repeat) < 0: return True
+
+        self._wait_fired()
+        self._wake_chip()
+        self._latch()
+        dma_functions.output_signal(self.active)
+        self._all_signals_low()
+        # the waveform plays in the background during the pause
+        self._fire_nozzles()
+        self.next_repeat = time.ticks_add(time.ticks_ms(), config.FIRE_INTERVAL_MS)
+        self.repeats_left -= 1
+        if self.repeats_left == 0: self.active = None
+        return True
+
+    def queued(self):
+        # firings waiting or being output, at most two
+        return (self.active is not None) + (self.pending is not None)
+
+    def flush(self):
+        # output everything that is queued, before moving the stage or changing the waveform
+        while self.poll():
+            pass
+        self._wait_fired()
 
     def _get_size(self, S):
         if S=='S': return 'small'
@@ -77,25 +286,6 @@ class printheadController():
         if Q=='A': return 'all'
         return 'all'
 
-    def _bin_to_range(self, bin):
-        counter = 1
-        lst = []
-        bin = list(bin)
-
-        for i in bin:
-            if i == '1': lst.append(counter)
-            counter += 1
-        return lst
-
-    def _fire(self, signal):
-        for i in range(100):
-            self._wake_chip()
-            self._latch()
-            dma_functions.output_signal(signal)
-            self._all_signals_low()
-            self._fire_nozzles()
-            time.sleep(0.001)
-
     def _all_signals_low(self):
         self.p_SIBL.value(0)
         self.p_SICL.value(0)
@@ -114,84 +304,3 @@ class printheadController():
             self.p_NCHG.value(0)
             time.sleep_us(105)
         self.p_NCHG.value(1)
-
-
-
-@micropython.asm_thumb
-def run_dac(r0, r1):
-    # r0 = length of waveform array
-    # r1 = address of waveform array
-    # r2 = delay counter
-    # r3 = waveform length save
-    # r4 = pulse counter
-    # r5 = DAC base addressof
-    # r6 = waveform value holder
-    # r7 = waveform index counter
-
-    movwt(r5, stm.DAC) # store DAC base address in r5
-    mov(r3, r0) # set counter to waveform length
-    mov(r7, r1) # save address of waveform
-    mov(r4, 4) # number of pulses to give
-
-    b(loop_four)
-    label(loop2)
-
-    b(loop_entry)
-    label(loop1)
-
-    ldrb(r6, [r7, 0]) # get the value of waveform array
-    strh(r6, [r5, stm.DAC_DHR8R1]) # set DAC output
-    add(r7, r7, 4) # increment to select next waveform value
-
-    # delay for a bit
-    movwt(r2, 3)
-    label(delay_on)
-    sub(r2, r2, 1)
-    cmp(r2, 0)
-    bgt(delay_on)
-
-
-    # loop through waveform
-    sub(r3, r3, 1)
-    label(loop_entry)
-    cmp(r3, 0)
-    bgt(loop1)
-
-    cmp(r4, 1)
-    ble(skip_pulse)
-
-    # Pulse CH pin
-    # NCHG Down
-    movwt(r2, stm.GPIOB)
-    movw(r3, 1<<8)
-    strh(r3, [r2, stm.GPIO_BSRRH])
-    # CH Up
-    movwt(r2, stm.GPIOB)
-    movw(r3, 1<<9)
-    strh(r3, [r2, stm.GPIO_BSRRL])
-
-    # delay for a bit
-    movwt(r7, 20)
-    label(delay_on2)
-    sub(r7, r7, 1)
-    cmp(r7, 0)
-    bgt(delay_on2)
-
-    # CH Down
-    movw(r3, 1<<9)
-    strh(r3, [r2, stm.GPIO_BSRRH])
-    label(skip_pulse)
-    # NCHG Up
-    movwt(r2, stm.GPIOB)
-    movw(r3, 1<<8)
-    strh(r3, [r2, stm.GPIO_BSRRL])
-
-    mov(r3, r0) # reset counter to waveform length
-    mov(r7, r1) # reset waveform address
-
-
-    # loop 4 times
-    sub(r4, r4, 1)
-    label(loop_four)
-    cmp(r4, 0)
-    bgt(loop2)
@@ -24,6 +24,10 @@ class SequenceFactory():
 
     The function will return a list of 16-bit words, with 6 bits of data.
     The placement of these bits is defined in the config file.
+
+    The firmware no longer builds sequences at fire time: host/timing.py compiles
+    host/timing_spec.py into sequence.bin (see sequence_table.py) and checks the result
+    word for word against get_sequence2().
     """
 
 
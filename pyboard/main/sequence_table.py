@@ -0,0 +1,94 @@
+import config
+import struct
+import ubinascii
+from array import array
+
+# droplet size -> size bit of the patches
+SIZE_BITS = {'small': 1, 'medium': 2, 'large': 4}
+CHANNELS = 4
+CHANNEL_NAMES = ('black', 'cyan', 'magenta', 'yellow')
+
+
+class sequenceTable():
+    """
+    Printhead signal words of one firing, compiled on the host by host/timing.py from
+    host/timing_spec.py and stored in config.SEQUENCE_FILE.
+
+    The template holds the words without any nozzle, a nozzle is added by OR-ing its masks into
+    the words at its patch offsets. Nothing else is computed on the board:
+
+        table = sequenceTable()
+        signal = table.new_buffer()
+        table.build(signal, (black, cyan, magenta, yellow), 'medium')
+        dma_functions.output_signal(signal)
+
+    The nozzles of a channel are a bytearray mask, bit 0 of byte 0 is nozzle 1, see mask().
+    A channel without data blocks in the spec (the colours, so far) only takes empty masks,
+    see check().
+    """
+
+    def __init__(self, path=config.SEQUENCE_FILE):
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            raise OSError('no sequence table %s, run host/timing.py and copy it to the board' % path)
+        data = f.read()
+        f.close()
+        if data[:4] != b'SEQ1': raise ValueError('%s is not a sequence table' % path)
+
+        n_words, n_patches = struct.unpack('<HH', data[4:8])
+        self.template = array('i', struct.unpack_from('<%dH' % n_words, data, 8))
+
+        # per channel: nozzle -> list of (offset, mask, size bits)
+        self.patches = [{} for i in range(CHANNELS)]
+        i = 8 + 2 * n_words
+        for k in range(n_patches):
+            channel, nozzle, sizes, offset, mask = struct.unpack_from('<BBBHH', data, i)
+            self.patches[channel].setdefault(nozzle, []).append((offset, mask, sizes))
+            i += 7
+
+    def new_buffer(self):
+        return array('i', self.template)
+
+    def check(self, masks):
+        # nozzles of a channel without patches would silently not fire
+        for channel in range(len(masks)):
+            if not self.patches[channel] and any(masks[channel]):
+                raise ValueError('no %s nozzle data in %s, see host/timing_spec.py' % (CHANNEL_NAMES[channel], config.SEQUENCE_FILE))
+
+    def build(self, out, masks, size='medium'):
+        # out: buffer of new_buffer(), masks: per channel a nozzle mask, empty bytes are skipped
+        self.check(masks)
+        size_bit = SIZE_BITS[size]
+        out[:] = self.template
+        for channel in range(len(masks)):
+            patches = self.patches[channel]
+            nozzles = masks[channel]
+            for i in range(len(nozzles)):
+                byte = nozzles[i]
+                if not byte: continue
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        for offset, bits, sizes in patches.get(8*i + bit + 1, ()):
+                            if sizes & size_bit: out[offset] |= bits
+        return out
+
+
+def mask(value):
+    '''
+    Nozzle mask of a P1 parameter: 'x' and hex digits of a number with bit n-1 set for nozzle n
+    (x3 is nozzles 1 and 2), or the older string of '0' and '1' with nozzle 1 first.
+    '''
+    value = value.strip()
+    if value[:1] == 'x':
+        digits = value[1:]
+        if len(digits) % 2: digits = '0' + digits
+        return bytearray(reversed(ubinascii.unhexlify(digits)))
+    nozzles = bytearray((len(value) + 7) // 8)
+    for i in range(len(value)):
+        if value[i] == '1': nozzles[i >> 3] |= 1 << (i & 7)
+    return nozzles
+
+
+def all_nozzles(count):
+    return mask('1' * count)
@@ -1,28 +1,46 @@
 from pyb import USB_VCP
 import sys
 import machine
+import time
 
 class serialListener(USB_VCP):
     """
     This class takes care of all serial communication with the host machine.
     Most important functions are:
-        get_message():      reads first command available and returns the decoded string
+        poll_message():     returns the first command available as a string, or None
         send_message(str):  sends a message back to the host machine
     """
 
     def __init__(self):
         super().__init__()
+        self.partial = b''
+        self.partial_start = 0
 
-    def get_message(self):
+    def poll_message(self, timeout=100):
+        '''
+        Returns the first command available or None, without waiting. Waveform and job uploads
+        (W1, J1) are longer than a USB packet and always end with a newline, they are collected
+        over several calls, for at most timeout ms.
+        '''
         try:
-            data = self.readline()
-            if data != None:
-                if data == b'\x04':
-                    print('Catched reset command...')
-                    machine.reset()
-                return str(data.decode('ascii'))
-        except Exception as e: return 'get_message() failed: '+str(e)
-        return False
+            data = self.readline() if self.any() else None
+            if self.partial:
+                if data: self.partial += data
+                if not self.partial.endswith(b'\n') and time.ticks_diff(time.ticks_ms(), self.partial_start) < timeout:
+                    return None
+                data = self.partial
+                self.partial = b''
+            elif data is None:
+                return None
+            elif data[:2] in (b'W1', b'J1') and not data.endswith(b'\n'):
+                self.partial = data
+                self.partial_start = time.ticks_ms()
+                return None
+            if data == b'\x04':
+                print('Catched reset command...')
+                machine.reset()
+            return str(data.decode('ascii'))
+        except Exception as e: return 'poll_message() failed: '+str(e)
 
 
     def send_message(self, message):
@@ -69,6 +69,10 @@ Or:
 import sys
 import time
 import os
+import struct
+import hashlib
+import binascii
+import zlib
 
 try:
     stdout = sys.stdout.buffer
@@ -258,34 +262,61 @@ class Pyboard:
             if delayed:
                 print('')
 
+        # bytes read from the device but not yet consumed
+        self.rx_buffer = b''
+        # raw-paste mode (MicroPython 1.14+) is tried once, older firmware falls back to chunks
+        self.use_raw_paste = True
+
     def close(self):
         self.serial.close()
 
+    def in_waiting(self):
+        return len(self.rx_buffer) + self.serial.inWaiting()
+
+    def read(self, size=1):
+        # blocking read of size bytes, buffered bytes first
+        data = self.rx_buffer[:size]
+        self.rx_buffer = self.rx_buffer[size:]
+        if len(data) < size:
+            data += self.serial.read(size - len(data))
+        return data
+
     def read_until(self, min_num_bytes, ending, timeout=10, data_consumer=None):
-        data = self.serial.read(min_num_bytes)
+        """
+        Reads everything that is waiting at once instead of byte by byte. Bytes after the
+        ending stay in rx_buffer for the next read.
+        """
+        data = self.read(min_num_bytes)
         if data_consumer:
             data_consumer(data)
-        timeout_count = 0
+        last_data = time.time()
         while True:
             if data.endswith(ending):
                 break
-            elif self.serial.inWaiting() > 0:
-                new_data = self.serial.read(1)
+            n = self.in_waiting()
+            if n > 0:
+                new_data = self.read(n)
+                # keep what comes after the first ending for the next read
+                combined = data + new_data
+                i = combined.find(ending, max(0, len(data) - len(ending) + 1))
+                if i >= 0:
+                    self.rx_buffer = combined[i + len(ending):] + self.rx_buffer
+                    new_data = combined[len(data):i + len(ending)]
                 data = data + new_data
                 if data_consumer:
                     data_consumer(new_data)
-                timeout_count = 0
+                last_data = time.time()
             else:
-                timeout_count += 1
-                if timeout is not None and timeout_count >= 100 * timeout:
+                if timeout is not None and time.time() - last_data >= timeout:
                     break
-                time.sleep(0.01)
+                time.sleep(0.001)
         return data
 
     def enter_raw_repl(self):
         self.serial.write(b'\r\x03\x03') # ctrl-C twice: interrupt any running program
 
         # flush input (without relying on serial.flushInput())
+        self.rx_buffer = b''
         n = self.serial.inWaiting()
         while n > 0:
             self.serial.read(n)
@@ -328,6 +359,34 @@ class Pyboard:
         # return normal and error output
         return data, data_err
 
+    def raw_paste_write(self, command_bytes):
+        # the device grants a window of bytes and sends \x01 whenever another window is free
+        window_size = struct.unpack('<H', self.read(2))[0]
+        window_remain = window_size
+
+        i = 0
+        while i < len(command_bytes):
+            while window_remain == 0 or self.in_waiting() > 0:
+                data = self.read(1)
+                if data == b'\x01':
+                    window_remain += window_size
+                elif data == b'\x04':
+                    # device ended the transfer early (e.g. syntax error), acknowledge it
+                    self.serial.write(b'\x04')
+                    return
+                else:
+                    raise PyboardError('unexpected read during raw paste: %r' % data)
+            chunk = command_bytes[i:i + window_remain]
+            self.serial.write(chunk)
+            window_remain -= len(chunk)
+            i += len(chunk)
+
+        # end of data, the device acknowledges with \x04 and compiles and runs the code
+        self.serial.write(b'\x04')
+        data = self.read_until(1, b'\x04')
+        if not data.endswith(b'\x04'):
+            raise PyboardError('could not complete raw paste: %r' % data)
+
     def exec_raw_no_follow(self, command):
         if isinstance(command, bytes):
             command_bytes = command
@@ -339,14 +398,31 @@ class Pyboard:
         if not data.endswith(b'>'):
             raise PyboardError('could not enter raw repl')
 
-        # write command
+        if self.use_raw_paste:
+            # ctrl-E A ctrl-A: request raw-paste mode
+            self.serial.write(b'\x05A\x01')
+            data = self.read(2)
+            if data == b'R\x01':
+                return self.raw_paste_write(command_bytes)
+            if data == b'R\x00':
+                # understood but not supported
+                self.use_raw_paste = False
+            else:
+                # old firmware echoes the request and shows the raw REPL prompt again
+                data = self.read_until(1, b'w REPL; CTRL-B to exit\r\n>')
+                if not data.endswith(b'w REPL; CTRL-B to exit\r\n>'):
+                    print(data)
+                    raise PyboardError('could not enter raw repl')
+                self.use_raw_paste = False
+
+        # write command, without flow control the device needs time for every 256 bytes
         for i in range(0, len(command_bytes), 256):
             self.serial.write(command_bytes[i:min(i + 256, len(command_bytes))])
             time.sleep(0.01)
         self.serial.write(b'\x04')
 
         # check if we could exec command
-        data = self.serial.read(2)
+        data = self.read(2)
         if data != b'OK':
             raise PyboardError('could not exec command (response: %r)' % data)
 
@@ -374,10 +450,123 @@ class Pyboard:
         t = str(self.eval('pyb.RTC().datetime()'), encoding='utf8')[1:-1].split(', ')
         return int(t[4]) * 3600 + int(t[5]) * 60 + int(t[6])
 
+    def fs_hashes(self, paths):
+        # sha256 of files on the board in one round trip, None for missing files
+        command = """
+import uhashlib, ubinascii
+for p in %r:
+    try:
+        f = open(p, 'rb')
+    except OSError:
+        print('-')
+        continue
+    h = uhashlib.sha256()
+    while True:
+        b = f.read(512)
+        if not b:
+            break
+        h.update(b)
+    f.close()
+    print(ubinascii.hexlify(h.digest()).decode())
+""" % (list(paths),)
+        lines = str(self.exec_(command), encoding='utf8').split()
+        return dict((p, None if h == '-' else h) for p, h in zip(paths, lines))
+
+    def fs_put(self, data, dest, compress=True, chunk_size=4096):
+        """
+        Writes data (bytes) to the file dest on the board. With compress every chunk is sent
+        deflated and base64 encoded and inflated on the board.
+        """
+        setup = "f = open(%r, 'wb')\nw = f.write\n" % dest
+        if compress:
+            setup += ("from ubinascii import a2b_base64 as A\n"
+                      "try:\n    from uzlib import decompress as D\n"
+                      "except ImportError:\n    from zlib import decompress as D\n")
+        self.exec_(setup)
+        for i in range(0, len(data), chunk_size):
+            chunk = data[i:i + chunk_size]
+            if compress:
+                # small window, the board inflates into a buffer of the chunk size
+                deflate = zlib.compressobj(9, zlib.DEFLATED, 10)
+                packed = binascii.b2a_base64(deflate.compress(chunk) + deflate.flush()).strip()
+                self.exec_('w(D(A(%r)))' % packed)
+            else:
+                self.exec_('w(%r)' % chunk)
+        self.exec_('f.close()')
+
+    def fs_sync(self, local_dir, remote_dir='/flash', mpy=False, compress=True, data_consumer=None):
+        """
+        Copies the files of local_dir to remote_dir, files with the same sha256 on the board are
+        skipped. With mpy, modules other than boot.py and main.py are precompiled with mpy-cross
+        and sent as .mpy. The other form of every module (x.py for x.mpy and the other way
+        round) is removed from the board, MicroPython imports x.py before x.mpy. Returns the list
+        of files that were written and removed.
+        """
+        files = {}
+        stale = []
+        for name in sorted(os.listdir(local_dir)):
+            path = os.path.join(local_dir, name)
+            if not os.path.isfile(path) or name.endswith('.pyc'):
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            if mpy and name.endswith('.py') and name not in ('boot.py', 'main.py'):
+                data = compile_mpy(path)
+                name = name[:-3] + '.mpy'
+            files[remote_dir.rstrip('/') + '/' + name] = data
+            if name.endswith('.py') and name not in ('boot.py', 'main.py'):
+                stale.append(remote_dir.rstrip('/') + '/' + name[:-3] + '.mpy')
+            elif name.endswith('.mpy'):
+                stale.append(remote_dir.rstrip('/') + '/' + name[:-4] + '.py')
+        stale = [path for path in stale if path not in files]
+
+        remote = self.fs_hashes(list(files))
+        written = []
+        for dest, data in files.items():
+            if remote[dest] == hashlib.sha256(data).hexdigest():
+                continue
+            if data_consumer:
+                data_consumer(('put %s (%d bytes)\n' % (dest, len(data))).encode())
+            self.fs_put(data, dest, compress)
+            written.append(dest)
+        for dest in self.fs_remove(stale):
+            if data_consumer:
+                data_consumer(('remove %s\n' % dest).encode())
+            written.append(dest)
+        return written
+
+    def fs_remove(self, paths):
+        # removes the files that exist on the board in one round trip, returns their paths
+        if not paths:
+            return []
+        command = """
+import uos
+for p in %r:
+    try:
+        uos.remove(p)
+        print(p)
+    except OSError:
+        pass
+""" % (list(paths),)
+        return str(self.exec_(command), encoding='utf8').split()
+
 # in Python2 exec is a keyword so one must use "exec_"
 # but for Python3 we want to provide the nicer version "exec"
 setattr(Pyboard, "exec", Pyboard.exec_)
 
+def compile_mpy(path):
+    # precompile a module with mpy-cross (pip install mpy-cross), returns the .mpy bytes
+    import shutil
+    import subprocess
+    import tempfile
+    if shutil.which('mpy-cross') is None:
+        raise PyboardError('mpy-cross not found, install it or sync without --mpy')
+    with tempfile.TemporaryDirectory() as folder:
+        output = os.path.join(folder, 'module.mpy')
+        subprocess.check_call(['mpy-cross', '-o', output, path])
+        with open(output, 'rb') as f:
+            return f.read()
+
 def execfile(filename, device='/dev/ttyACM0', baudrate=115200, user='micro', password='python'):
     pyb = Pyboard(device, baudrate, user, password)
     pyb.enter_raw_repl()
@@ -396,6 +585,10 @@ def main():
     cmd_parser.add_argument('-c', '--command', help='program passed in as string')
     cmd_parser.add_argument('-w', '--wait', default=0, type=int, help='seconds to wait for USB connected board to become available')
     cmd_parser.add_argument('--follow', action='store_true', help='follow the output after running the scripts [default if no scripts given]')
+    cmd_parser.add_argument('--sync', metavar='DIR', help='copy the changed files of DIR to the board')
+    cmd_parser.add_argument('--dest', default='/flash', help='folder on the board for --sync')
+    cmd_parser.add_argument('--mpy', action='store_true', help='precompile modules with mpy-cross for --sync')
+    cmd_parser.add_argument('--no-compress', action='store_true', help='send files for --sync uncompressed')
     cmd_parser.add_argument('files', nargs='*', help='input files')
     args = cmd_parser.parse_args()
 
@@ -407,7 +600,7 @@ def main():
         sys.exit(1)
 
     # run any command or file(s)
-    if args.command is not None or len(args.files):
+    if args.command is not None or len(args.files) or args.sync:
         # we must enter raw-REPL mode to execute commands
         # this will do a soft-reset of the board
         try:
@@ -432,6 +625,16 @@ def main():
                 stdout_write_bytes(ret_err)
                 sys.exit(1)
 
+        # copy a folder, if given
+        if args.sync:
+            try:
+                written = pyb.fs_sync(args.sync, args.dest, args.mpy, not args.no_compress, stdout_write_bytes)
+            except PyboardError as er:
+                print(er)
+                pyb.close()
+                sys.exit(1)
+            print('%d file(s) written, others unchanged' % len(written))
+
         # run the command, if given
         if args.command is not None:
             execbuffer(args.command.encode('utf-8'))